@@ -14,7 +14,7 @@ from collections.abc import Iterable
 from bs4 import BeautifulSoup
 from yarl import URL
 
-from .api import APIAddress, DownloadFlags, DownloadStatus, PostInfo, PostLinkInfo, ScannedPost, ScannedPostPost
+from .api import DATA_SERVERS_COUNT, APIAddress, DownloadFlags, DownloadStatus, PostInfo, PostLinkInfo, ScannedPost, ScannedPostPost
 from .cache import Cache
 from .config import Config
 from .defs import FILE_NAME_FULL_MAX_LEN, SupportedExternalWebsites
@@ -23,7 +23,10 @@ from .formatter import format_path
 from .logger import Log
 from .util import sanitize_path
 
-__all__ = ('extract_link_name', 'gather_post_info', 'is_link_extension_supported', 'is_link_native', 'is_link_supported')
+__all__ = (
+    'extract_link_name', 'gather_post_info', 'is_link_extension_supported', 'is_link_native', 'is_link_supported', 'link_content_key',
+    'with_random_data_server',
+)
 
 SUPPORTED_TAGS = (
     ('a', 'href'),
@@ -51,6 +54,22 @@ def is_link_native(url: URL) -> bool:
     return link_without_subdomain(url).host in APIAddress.__args__
 
 
+def link_content_key(url: URL) -> str:
+    """Same for every link to a data server file: mirror host, '/data' prefix and query ('?f=' name) don't matter"""
+    if not is_link_native(url):
+        return str(url)
+    return url.path.removeprefix('/data')
+
+
+def with_random_data_server(url: URL) -> URL:
+    """Data server link moved to another randomly picked data server (mirror), other links are returned as is"""
+    base_url = link_without_subdomain(url)
+    if not is_link_native(url) or url.host == base_url.host:
+        return url
+    hosts = [f'n{_:d}.{base_url.host}' for _ in range(1, DATA_SERVERS_COUNT + 1)]
+    return url.with_host(random.choice([_ for _ in hosts if _ != url.host] or hosts))
+
+
 def is_link_supported(url: URL) -> bool:
     return is_link_native(url)
 
@@ -172,6 +191,7 @@ async def gather_post_info(posts: Iterable[ScannedPost], api_address: APIAddress
         dest = Config.dest_base.joinpath(format_path(post, Config.path_format))
 
         links: dict[str, PostLinkInfo] = {}
+        content_keys: dict[str, URL] = {}
         for link_base, name in links_dict.items():
             # check if MEGA links were properly parsed / fixed
             if link_base.host == SupportedExternalWebsites.Mega and len(link_base.path) + len(link_base.fragment) < 26:
@@ -187,6 +207,13 @@ async def gather_post_info(posts: Iterable[ScannedPost], api_address: APIAddress
                 if link_norm != link_base:
                     Log.debug(f'Normalized link {link_base!s} -> {link_norm!s}')
                     link_base = link_norm
+            # same file may be linked as preview, attachment and in content, possibly through different mirrors
+            if (content_key := link_content_key(link_base)) in content_keys:
+                Log.debug(f'[{user}:{pid}] {title}: link {link_base!s} is the same file as {content_keys[content_key]!s}. Skipped')
+                # number is still taken so names of the following files stay the same as before dedup (already downloaded ones)
+                next_file_name(name)
+                continue
+            content_keys[content_key] = link_base
             if not pathlib.Path(name).suffix:
                 name = f'{name}{link_base.suffix}'
 
@@ -208,7 +235,7 @@ async def gather_post_info(posts: Iterable[ScannedPost], api_address: APIAddress
             links[name] = plink
 
         p = PostInfo(pid, user, service, title, imported, published, edited, tags, content, dest, list(links.values()), DownloadStatus())
-        await Cache.store_post_info_cache([p])
+        await Cache.store_post_info_cache([p], [spost])
         post_infos.append(p)
 
     return post_infos
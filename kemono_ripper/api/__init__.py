@@ -1,7 +1,20 @@
 from .api import Kemono
-from .defs import DOWNLOAD_MODE_DEFAULT, DOWNLOAD_MODES, DownloadMode, Mem
+from .chunk_size import AdaptiveChunkSize
+from .circuit_breaker import CircuitBreaker, CircuitState
+from .content_store import ContentStore, link_file
+from .defs import (
+    CONNECT_RETRY_DELAY,
+    DATA_SERVERS_COUNT,
+    DOWNLOAD_MODE_DEFAULT,
+    DOWNLOAD_MODES,
+    FILE_WRITE_BUFFER_CHUNKS,
+    DownloadMode,
+    Mem,
+)
 from .exceptions import KemonoAPIError, KemonoErrorCodes
+from .file_writer import FileWriter
 from .options import KemonoOptions
+from .part_file import PartFile, PartFileInfo
 from .request_queue import RequestQueue
 from .types import (
     APIAddress,
@@ -31,14 +44,18 @@ from .types import (
     ScannedPostProps,
     SearchedPost,
     SQLColumn,
+    SQLIndex,
     SQLSchema,
     State,
     URLProbeResult,
 )
 
 __all__ = (
+    'CONNECT_RETRY_DELAY',
+    'DATA_SERVERS_COUNT',
     'DOWNLOAD_MODES',
     'DOWNLOAD_MODE_DEFAULT',
+    'FILE_WRITE_BUFFER_CHUNKS',
     'APIAddress',
     'APIEndpoint',
     'APIEndpointFormat',
@@ -49,11 +66,16 @@ __all__ = (
     'APIRequestParams',
     'APIResponse',
     'APIService',
+    'AdaptiveChunkSize',
+    'CircuitBreaker',
+    'CircuitState',
+    'ContentStore',
     'Creator',
     'DownloadFlags',
     'DownloadMode',
     'DownloadResult',
     'DownloadStatus',
+    'FileWriter',
     'FreePost',
     'Kemono',
     'KemonoAPIError',
@@ -64,11 +86,14 @@ __all__ = (
     'ListedPostFile',
     'Mem',
     'PCSDPost',
+    'PartFile',
+    'PartFileInfo',
     'PostInfo',
     'PostLinkInfo',
     'PostPageScanResult',
     'RequestQueue',
     'SQLColumn',
+    'SQLIndex',
     'SQLSchema',
     'ScannedPost',
     'ScannedPostPost',
@@ -76,4 +101,5 @@ __all__ = (
     'SearchedPost',
     'State',
     'URLProbeResult',
+    'link_file',
 )
@@ -1,4 +1,4 @@
-from .action import APIAction, APIDownloadAction, APIFetchAction
+from .action import APIAction, APIDownloadAction, APIFetchAction, APIProbeAction
 from .creators import GetCreatorsAction
 from .posts import GetCreatorPostAction, GetCreatorPostsAction, GetFreePostAction, GetPostTagsAction, SearchPostsAction
 
@@ -6,6 +6,7 @@ __all__ = (
     'APIAction',
     'APIDownloadAction',
     'APIFetchAction',
+    'APIProbeAction',
     'GetCreatorPostAction',
     'GetCreatorPostsAction',
     'GetCreatorPostsAction',
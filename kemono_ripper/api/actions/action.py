@@ -77,6 +77,7 @@ class APIDownloadAction(APIAction):
     """
     _post: PostInfo
     _post_link: PostLinkInfo
+    _url: URL
 
     def __init__(self, post: PostInfo, plink: PostLinkInfo) -> None:
         self._setup(post, plink)
@@ -86,6 +87,7 @@ class APIDownloadAction(APIAction):
         self._method = 'GET'
         self._post = post
         self._post_link = plink
+        self._url = plink.url
 
     def _validate(self) -> None:
         assert self._post_link.url.is_absolute()
@@ -94,7 +96,11 @@ class APIDownloadAction(APIAction):
         return {'method': self._method, 'url': self.get_url(), 'allow_redirects': True}
 
     def get_url(self) -> URL:
-        return self._post_link.url
+        return self._url
+
+    def reroute(self, url: URL) -> None:
+        """Makes action request same file from another (mirror) server"""
+        self._url = url
 
     @property
     def post(self) -> PostInfo:
@@ -107,6 +113,15 @@ class APIDownloadAction(APIAction):
     def __str__(self) -> str:
         return f'[{self._method}] => {self.get_url()!s}'
 
+
+class APIProbeAction(APIDownloadAction):
+    """
+    Same as download but only fetches headers (file size)
+    """
+    def _setup(self, post: PostInfo, plink: PostLinkInfo) -> None:
+        super()._setup(post, plink)
+        self._method = 'HEAD'
+
 #
 #
 #########################################
@@ -12,10 +12,19 @@ import pathlib
 import random
 import sys
 from asyncio import Future, Semaphore, as_completed, sleep
+from asyncio import TimeoutError as AsyncTimeoutError
 from collections.abc import Awaitable, Callable, Iterable
 
-from aiofile import async_open
-from aiohttp import ClientConnectorError, ClientPayloadError, ClientResponse, ClientSession, ClientTimeout, TCPConnector
+from aiohttp import (
+    ClientConnectorError,
+    ClientError,
+    ClientPayloadError,
+    ClientResponse,
+    ClientResponseError,
+    ClientSession,
+    ClientTimeout,
+    TCPConnector,
+)
 from aiohttp_socks import ProxyConnector
 
 from kemono_ripper.util import UAManager
@@ -24,6 +33,7 @@ from .actions import (
     APIAction,
     APIDownloadAction,
     APIFetchAction,
+    APIProbeAction,
     GetCreatorPostAction,
     GetCreatorPostsAction,
     GetCreatorsAction,
@@ -31,11 +41,16 @@ from .actions import (
     GetPostTagsAction,
     SearchPostsAction,
 )
-from .defs import CONNECT_RETRY_DELAY, MAX_JOBS, POSTS_PER_PAGE, DownloadMode, Mem
+from .chunk_size import AdaptiveChunkSize
+from .circuit_breaker import CircuitBreaker
+from .content_store import ContentStore
+from .defs import CONNECT_RETRY_DELAY, FILE_WRITE_BUFFER_CHUNKS, MAX_JOBS, POSTS_PER_PAGE, DownloadMode, Mem
 from .exceptions import KemonoErrorCodes, RequestError, ValidationError
+from .file_writer import FileWriter, file_sha256
 from .filters import Filter, any_filter_matching
 from .logging import Log, set_logger
 from .options import KemonoOptions
+from .part_file import PartFile, PartFileInfo
 from .request_queue import RequestQueue
 from .types import (
     APIAddress,
@@ -56,6 +71,17 @@ from .types import (
 __all__ = ('Kemono',)
 
 CLIENT_CONNECTOR_ERRORS = (ClientPayloadError, ClientConnectorError)
+CONTENT_ERROR_CODES = (KemonoErrorCodes.ECHECKSUM, KemonoErrorCodes.ESIZE)
+'''invalid data received, server itself is fine so these are not counted against its host'''
+HOST_ERROR_STATUSES = (403, 429)
+'''client error statuses caused by host state (blocked, rate limited), counted against it along with server errors'''
+
+
+def _is_host_failure(e: BaseException) -> bool:
+    """Connection errors, timeouts and server error statuses. Invalid response content or request is not the host's fault"""
+    if isinstance(e, ClientResponseError):
+        return e.status >= 500 or e.status in HOST_ERROR_STATUSES
+    return isinstance(e, (ClientError, OSError, AsyncTimeoutError))
 
 
 class Kemono:
@@ -78,6 +104,7 @@ class Kemono:
         self._extra_cookies: list[tuple[str, str]] = options.extra_cookies
         self._filters: tuple[Filter, ...] = options.filters
         self._download_mode: DownloadMode = options.download_mode
+        self._content_store: ContentStore | None = ContentStore(options.content_store) if options.content_store else None
         # ensure correct args
         assert Log, 'Logger is not initialized!'
         assert next(reversed(self._dest_base.parents)).is_dir(), f'Inavlid base destination folder \'{self._dest_base!s}\'!'
@@ -123,9 +150,10 @@ class Kemono:
                 session.cookie_jar.update_cookies({ck: cv})
         return session
 
-    async def _wrap_request(self, action: APIAction, try_num: int, **kwargs) -> ClientResponse:
+    async def _wrap_request(self, action: APIAction, try_num: int, *, queued=True, **kwargs) -> ClientResponse:
+        """'queued' - request waits for its turn in request queue (base delay since last request)"""
         assert self._session is not None
-        if self._nodelay is False:
+        if self._nodelay is False and queued:
             await RequestQueue.until_ready(str(action.get_url()))
         Log.trace(f'[{try_num + 1:d}] Sending API request: {action!s}')
         response = await self._session.request(**action.as_api_request_data(), **kwargs)
@@ -135,95 +163,250 @@ class Kemono:
         if self._session is None:
             self._session = self._make_session()
 
+        host = action.get_url().host
         try_num = 0
         while try_num <= self._retries:
             r: ClientResponse | None = None
+            if not CircuitBreaker.allow(host):
+                # API has no mirrors, wait for circuit to half-open
+                try_num += 1
+                Log.error(f'{action.get_url()!s}: host {host} is unavailable, error #{try_num:d}...')
+                if try_num <= self._retries:
+                    await sleep(random.uniform(*CONNECT_RETRY_DELAY))
+                continue
             try:
                 async with await self._wrap_request(action, try_num) as r:
                     if r.status == 404:
+                        CircuitBreaker.record_success(host)
                         Log.error(f'Got 404 for {action.get_url()!s}...!')
                         # try_num = self._retries
                         raise RequestError(KemonoErrorCodes.ENOTFOUND)
                     r.raise_for_status()
                     response_content = await r.content.read()
+                    # response arrived, processing errors are not the host's fault
+                    CircuitBreaker.record_success(host)
                     result = await action.process_response_content(response_content)
                     return result
             except Exception as e:
                 Log.error(f'{action.get_url()!s}: {sys.exc_info()[0]}: {sys.exc_info()[1]}')
+                if _is_host_failure(e):
+                    CircuitBreaker.record_failure(host)
                 if (r is None or r.status != 403) and not isinstance(e, CLIENT_CONNECTOR_ERRORS):
                     try_num += 1
                     Log.error(f'{action.get_url()!s}: error #{try_num:d}...')
                 if r is not None and not r.closed:
                     r.close()
                 if try_num <= self._retries:
+                    if not CircuitBreaker.try_spend_retry():
+                        Log.error(f'{action.get_url()!s}: retry budget is exhausted!')
+                        break
                     await sleep(random.uniform(*CONNECT_RETRY_DELAY))
                 continue
 
-        if try_num > self._retries:
-            Log.error('Unable to connect. Aborting')
+        Log.error('Unable to connect. Aborting')
         raise ConnectionError
 
-    async def _download(self, action: APIDownloadAction) -> KemonoErrorCodes:
+    async def _download(self, action: APIDownloadAction, retry_later: bool) -> KemonoErrorCodes:
         local_path = action.post_link.local_path
         if ffilter := any_filter_matching(action.post, action.post_link, self._filters):
             Log.info(f'File {local_path} was filtered out by {ffilter!s}. Skipped!')
-            return KemonoErrorCodes.ESUCCESS
+            return KemonoErrorCodes.EFILTERED
 
         if self._download_mode != DownloadMode.FULL:
             if self._download_mode == DownloadMode.TOUCH:
                 action.post_link.path.touch(exist_ok=True)
             return KemonoErrorCodes.ESUCCESS
 
+        expected_sha256 = action.post_link.url_sha256
+        if self._content_store and expected_sha256 and (
+            stored_path := self._content_store.find(expected_sha256, action.post_link.url.suffix)
+        ):
+            action.post_link.status.size = stored_path.stat().st_size
+            action.post_link.status.sha256 = expected_sha256
+            if action.post_link.path.is_file() and action.post_link.path.samefile(stored_path):
+                Log.warn(f'{local_path} is already completed (content store), size: {action.post_link.status.size / Mem.MB:.2f} Mb')
+                return KemonoErrorCodes.EEXISTS
+            try:
+                await self._content_store.place(stored_path, action.post_link.path)
+                Log.info(f'{local_path} is already downloaded, linked from {stored_path}')
+                return KemonoErrorCodes.ESUCCESS
+            except OSError:
+                Log.warn(f'Unable to link {stored_path} to {local_path}: {sys.exc_info()[0]}: {sys.exc_info()[1]}. Downloading...')
+
+        part_file = PartFile(action.post_link.path)
+        # size unknown or file was written in place by older version: it is verified where it is,
+        # moved to partial download only if it has to be resumed, so if download fails existing file stays where it was
+        final_unverified = action.post_link.path.is_file() and not part_file.path.is_file()
+        if final_unverified:
+            file_size = action.post_link.path.stat().st_size
+            if 0 < action.post_link.status.size == file_size:
+                # final file only appears once completed, no need to ask server
+                Log.warn(f'{local_path} is already completed, size: {file_size:d} ({file_size / Mem.MB:.2f} Mb)')
+                return KemonoErrorCodes.EEXISTS
+
         if self._session is None:
             self._session = self._make_session()
 
-        try_num = 0
+        # deferred retries continue try count from previous attempt
+        try_num = action.post_link.status.tries if retry_later else 0
         bytes_written = 0
+        result = KemonoErrorCodes.ECONNECT
         while try_num <= self._retries:
             r: ClientResponse | None = None
+            result = KemonoErrorCodes.ECONNECT
+            if (url := CircuitBreaker.route(action.post_link.url)) is None:
+                # host and its mirrors are down, fail fast instead of occupying a worker
+                try_num += 1
+                Log.error(f'{local_path}: host {action.post_link.url.host} is unavailable, error #{try_num:d}...')
+                if try_num <= self._retries and retry_later:
+                    action.post_link.status.tries = try_num
+                    return KemonoErrorCodes.ERETRY
+                break
+            if url != action.get_url():
+                Log.warn(f'{local_path}: host {action.get_url().host} is unavailable, rerouting to {url.host}')
+                action.reroute(url)
             try:
-                file_size = action.post_link.path.stat().st_size if action.post_link.path.is_file() else 0
-                hkwargs: dict[str, dict[str, str]] = {'headers': {'Range': f'bytes={file_size:d}-'} if file_size > 0 else {}}
-                async with await self._wrap_request(action, try_num=try_num, **hkwargs) as r:
+                final_unverified = final_unverified and action.post_link.path.is_file()
+                file_size = action.post_link.path.stat().st_size if final_unverified else part_file.size()
+                part_info = part_file.load() if file_size > 0 and not final_unverified else None
+                headers: dict[str, str] = {'Range': f'bytes={file_size:d}-'} if file_size > 0 else {}
+                if part_info and part_info['etag']:
+                    headers['If-Range'] = part_info['etag']  # file changed on server -> whole file is sent instead of the rest
+                async with await self._wrap_request(action, try_num=try_num, headers=headers) as r:
                     content_len: int = r.content_length or 0
                     content_range_s = str(r.headers.get('Content-Range', '/')).split('/', 1)
                     content_range = int(content_range_s[1]) if len(content_range_s) > 1 and content_range_s[1].isnumeric() else 1
                     if (content_len == 0 or r.status == 416) and file_size >= content_range:
+                        check_path = action.post_link.path if final_unverified else part_file.path
+                        if expected_sha256 and (file_hash := await file_sha256(check_path)) != expected_sha256:
+                            Log.error(f'{local_path}: SHA-256 mismatch, expected {expected_sha256}, got {file_hash}! Redownloading...')
+                            if final_unverified:
+                                # downloaded next to it, replaced once completed
+                                final_unverified = False
+                            else:
+                                part_file.discard()
+                            raise RequestError(KemonoErrorCodes.ECHECKSUM)
                         Log.warn(f'{local_path} is already completed, size: {file_size:d} ({file_size / Mem.MB:.2f} Mb)')
+                        if not final_unverified:
+                            part_file.complete()
                         action.post_link.status.size = file_size
+                        action.post_link.status.sha256 = expected_sha256
+                        CircuitBreaker.record_success(url.host)
                         return KemonoErrorCodes.EEXISTS
                     if r.status == 404:
+                        CircuitBreaker.record_success(url.host)
                         Log.error(f'Got 404 for {action.get_url()!s}...!')
                         # try_num = self._retries
                         raise RequestError(KemonoErrorCodes.ENOTFOUND)
                     r.raise_for_status()
+                    if file_size > 0 and r.status != 206:
+                        Log.warn(f'{local_path}: server sent whole file instead of the rest, restarting download...')
+                        file_size = 0
+                    elif part_info and part_info['size'] not in (0, file_size + content_len):
+                        Log.warn(f'{local_path}: file size changed from {part_info["size"]:d} to {file_size + content_len:d}, restarting...')
+                        part_file.discard()
+                        raise RequestError(KemonoErrorCodes.ESIZE)
                     action.post_link.status.size = file_size + content_len
+                    # size wasn't known before (not probed), filter before any body bytes are transferred
+                    if ffilter := any_filter_matching(action.post, action.post_link, self._filters):
+                        CircuitBreaker.record_success(url.host)
+                        Log.info(f'File {local_path} was filtered out by {ffilter!s}. Skipped!')
+                        return KemonoErrorCodes.EFILTERED
                     assert content_len > 0, f'Content length is {r.content_length!s} for {action.get_url()!s}! Retrying...'
+                    if final_unverified:
+                        if file_size:
+                            action.post_link.path.replace(part_file.path)
+                        final_unverified = False
                     action.post_link.path.parent.mkdir(parents=True, exist_ok=True)
                     start_str = f' <continuing at {file_size:d}>' if file_size else ''
                     total_str = f' / {action.post_link.status.size / Mem.MB:.2f}' if file_size else ''
                     Log.info(f'[{self.api_address}] Saving{start_str} {action.post_link.name}'
                              f' {content_len / Mem.MB:.2f}{total_str} Mb to {local_path}')
-                    async with async_open(action.post_link.path, 'ab') as output_file:
-                        if content_len > 16 * Mem.KB:
-                            try_num = 0  # reset try count if we can still download
-                        async for chunk in r.content.iter_chunked(128 * Mem.KB):
-                            await output_file.write(chunk)
-                            bytes_written += len(chunk)
+                    part_info = PartFileInfo(url=str(action.post_link.url), size=action.post_link.status.size,
+                                             etag=r.headers.get('ETag', ''), ranges=[(0, file_size)])
+                    part_file.save(part_info)
+                    writer = FileWriter(part_file.path, 'ab' if file_size else 'wb', action.post_link.status.size,
+                                        sha256=bool(expected_sha256))
+                    try:
+                        async with writer as output_file:
+                            if content_len > 16 * Mem.KB:
+                                try_num = 0  # reset try count if we can still download
+                            chunk_size = AdaptiveChunkSize()
+                            async for chunk in chunk_size.iter_chunked(r.content):
+                                output_file.buffer_size = chunk_size.size * FILE_WRITE_BUFFER_CHUNKS
+                                await output_file.write(chunk)
+                                bytes_written += len(chunk)
+                    finally:
+                        part_file.save(PartFileInfo(**{**part_info, 'ranges': [(0, writer.offset)]}))
+                    assert writer.offset == action.post_link.status.size, (
+                        f'Bytes written mismatch for {local_path}: {writer.offset:d} / {action.post_link.status.size:d}! Retrying...'
+                    )
+                    if expected_sha256:
+                        if writer.sha256 != expected_sha256:
+                            Log.error(f'{local_path}: SHA-256 mismatch, expected {expected_sha256}, got {writer.sha256}! Redownloading...')
+                            part_file.discard()
+                            raise RequestError(KemonoErrorCodes.ECHECKSUM)
+                        action.post_link.status.sha256 = writer.sha256
+                    part_file.complete()
+                CircuitBreaker.record_success(url.host)
+                if self._content_store and action.post_link.status.sha256:
+                    await self._store_content(action.post_link)
                 return KemonoErrorCodes.ESUCCESS
             except Exception as e:
                 Log.error(f'{local_path}: {sys.exc_info()[0]}: {sys.exc_info()[1]}')
+                if isinstance(e, RequestError) and e.code in CONTENT_ERROR_CODES:
+                    result = e.code
+                elif r is None or r.status != 404:
+                    CircuitBreaker.record_failure(url.host)
                 if (r is None or r.status != 403) and not isinstance(e, CLIENT_CONNECTOR_ERRORS):
                     try_num += 1
                     Log.error(f'{local_path}: error #{try_num:d}...')
                 if r is not None and not r.closed:
                     r.close()
                 if try_num <= self._retries:
+                    if not CircuitBreaker.try_spend_retry():
+                        Log.error(f'{local_path}: retry budget is exhausted!')
+                        break
+                    if retry_later:
+                        action.post_link.status.tries = try_num
+                        return KemonoErrorCodes.ERETRY
                     await sleep(random.uniform(*CONNECT_RETRY_DELAY))
                 continue
 
-        Log.error(f'Unable to connect. Aborting {local_path}')
-        return KemonoErrorCodes.ECONNECT
+        if result in CONTENT_ERROR_CODES:
+            Log.error(f'Unable to download valid file. Aborting {local_path}')
+        else:
+            Log.error(f'Unable to connect. Aborting {local_path}')
+        return result
+
+    async def _probe(self, action: APIProbeAction) -> int:
+        if self._session is None:
+            self._session = self._make_session()
+        if (url := CircuitBreaker.route(action.post_link.url)) is None:
+            return 0
+        if url != action.get_url():
+            action.reroute(url)
+        try:
+            # single attempt, size stays unknown on failure and download itself will retry
+            # HEAD requests are light, waiting for request queue would hold off downloads until every link is probed
+            async with await self._wrap_request(action, try_num=0, queued=False) as r:
+                if r.status == 404:
+                    CircuitBreaker.record_success(url.host)
+                    return 0
+                r.raise_for_status()
+                CircuitBreaker.record_success(url.host)
+                return r.content_length or 0
+        except Exception:
+            Log.warn(f'{action.get_url()!s}: probe failed: {sys.exc_info()[0]}: {sys.exc_info()[1]}')
+            CircuitBreaker.record_failure(url.host)
+            return 0
+
+    async def _store_content(self, post_link: PostLinkInfo) -> None:
+        try:
+            await self._content_store.add(post_link.path, post_link.status.sha256, post_link.url.suffix)
+        except OSError:
+            # file itself is downloaded and verified, only dedup is lost
+            Log.warn(f'Unable to add {post_link.local_path} to content store: {sys.exc_info()[0]}: {sys.exc_info()[1]}')
 
     async def _scan_post(self, link: PostPageScanResult) -> ScannedPost:
         assert link.service
@@ -291,9 +474,19 @@ class Kemono:
         post_tags: list[PostListedTag] = await self._query_api(GetPostTagsAction(self._api_address))
         return post_tags
 
-    async def download_url(self, post: PostInfo, plink: PostLinkInfo) -> KemonoErrorCodes:
+    async def probe_url(self, post: PostInfo, plink: PostLinkInfo) -> int:
+        """Returns file size reported by server (HEAD request) without downloading the file, 0 if unknown"""
+        Log.trace(f'[API] Probing {plink.url!s}...')
+        size = await self._probe(APIProbeAction(post, plink))
+        return size
+
+    async def download_url(self, post: PostInfo, plink: PostLinkInfo, *, retry_later=False) -> KemonoErrorCodes:
+        """
+        Downloads link file retrying on errors. With 'retry_later' a failed attempt returns ERETRY instead of waiting to retry,
+        caller is expected to call again after CONNECT_RETRY_DELAY, try count is kept in link status
+        """
         Log.info(f'[API] Downloading {plink.url!s}...')
-        result = await self._download(APIDownloadAction(post, plink))
+        result = await self._download(APIDownloadAction(post, plink), retry_later)
         return result
 
 #
@@ -0,0 +1,49 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import time
+from collections.abc import AsyncIterator
+
+from aiohttp import StreamReader
+
+from .defs import DOWNLOAD_CHUNK_SIZE_INIT, DOWNLOAD_CHUNK_SIZE_MAX, DOWNLOAD_CHUNK_TIME_FAST, DOWNLOAD_CHUNK_TIME_SLOW
+
+__all__ = ('AdaptiveChunkSize',)
+
+
+class AdaptiveChunkSize:
+    """
+    Read size following observed connection throughput. Doubles (up to max) while chunks come back full and fast,
+    halves (down to init) when a read takes long, so slow links still report progress often
+    """
+    def __init__(self, size_init=DOWNLOAD_CHUNK_SIZE_INIT, size_max=DOWNLOAD_CHUNK_SIZE_MAX) -> None:
+        self._size_init = size_init
+        self._size_max = size_max
+        self.size = size_init
+
+    def update(self, received: int, elapsed: float) -> int:
+        if received >= self.size and elapsed < DOWNLOAD_CHUNK_TIME_FAST:
+            self.size = min(self._size_max, self.size * 2)
+        elif elapsed > DOWNLOAD_CHUNK_TIME_SLOW:
+            self.size = max(self._size_init, self.size // 2)
+        return self.size
+
+    async def iter_chunked(self, content: StreamReader) -> AsyncIterator[bytes]:
+        while True:
+            read_start = time.monotonic()
+            chunk = await content.read(self.size)
+            if not chunk:
+                break
+            self.update(len(chunk), time.monotonic() - read_start)
+            yield chunk
+
+#
+#
+#########################################
@@ -0,0 +1,141 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+import re
+import time
+from collections import deque
+from enum import IntEnum
+
+from yarl import URL
+
+from .defs import (
+    CIRCUIT_FAILURE_RATE,
+    CIRCUIT_MIN_REQUESTS,
+    CIRCUIT_OPEN_TIME,
+    CIRCUIT_PROBE_TIMEOUT,
+    CIRCUIT_WINDOW,
+    DATA_SERVERS_COUNT,
+    RETRY_BUDGET_INITIAL,
+    RETRY_BUDGET_MAX,
+    RETRY_BUDGET_RATIO,
+)
+
+re_data_server = re.compile(r'^n(\d+)\.(.+)$')
+
+
+class CircuitState(IntEnum):
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.value:d})'
+
+
+class HostCircuit:
+    def __init__(self) -> None:
+        self.state = CircuitState.CLOSED
+        self.results = deque[bool](maxlen=CIRCUIT_WINDOW)
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+        '''half-open probe request start time, 0 - no probe. Slot expires so probe that never reported back can't block host forever'''
+
+    def failure_rate(self) -> float:
+        return self.results.count(False) / len(self.results) if self.results else 0.0
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker + global retry budget.
+    Host circuit opens when failure rate over last requests is too high, requests to it fail fast (or go to a mirror)
+    until cooldown passes, then a single probe request decides whether to close it again.
+    Retries are paid from budget refilled by successful requests so a dead network can't cause a retry storm
+    """
+    _circuits: dict[str, HostCircuit] = {}
+    _retry_budget: float = RETRY_BUDGET_INITIAL
+
+    @staticmethod
+    def _reset() -> None:
+        CircuitBreaker._circuits.clear()
+        CircuitBreaker._retry_budget = RETRY_BUDGET_INITIAL
+
+    @staticmethod
+    def _circuit(host: str) -> HostCircuit:
+        if host not in CircuitBreaker._circuits:
+            CircuitBreaker._circuits[host] = HostCircuit()
+        return CircuitBreaker._circuits[host]
+
+    @staticmethod
+    def state(host: str) -> CircuitState:
+        circuit = CircuitBreaker._circuit(host)
+        if circuit.state == CircuitState.OPEN and time.monotonic() - circuit.opened_at >= CIRCUIT_OPEN_TIME:
+            circuit.state = CircuitState.HALF_OPEN
+            circuit.probe_started = 0.0
+        return circuit.state
+
+    @staticmethod
+    def allow(host: str) -> bool:
+        """
+        Returns True if request to host may be sent now. In half-open state only one probe request is let through
+        (another one after CIRCUIT_PROBE_TIMEOUT if it was cancelled or failed without recording a result)
+        """
+        state = CircuitBreaker.state(host)
+        if state == CircuitState.CLOSED:
+            return True
+        circuit = CircuitBreaker._circuit(host)
+        now = time.monotonic()
+        if state == CircuitState.HALF_OPEN and (not circuit.probe_started or now - circuit.probe_started >= CIRCUIT_PROBE_TIMEOUT):
+            circuit.probe_started = now
+            return True
+        return False
+
+    @staticmethod
+    def record_success(host: str) -> None:
+        circuit = CircuitBreaker._circuit(host)
+        circuit.results.append(True)
+        if circuit.state != CircuitState.CLOSED:
+            circuit.state = CircuitState.CLOSED
+            circuit.results.clear()
+            circuit.probe_started = 0.0
+        CircuitBreaker._retry_budget = min(RETRY_BUDGET_MAX, CircuitBreaker._retry_budget + RETRY_BUDGET_RATIO)
+
+    @staticmethod
+    def record_failure(host: str) -> None:
+        circuit = CircuitBreaker._circuit(host)
+        circuit.results.append(False)
+        if circuit.state == CircuitState.HALF_OPEN or (
+            circuit.state == CircuitState.CLOSED and len(circuit.results) >= CIRCUIT_MIN_REQUESTS
+            and circuit.failure_rate() >= CIRCUIT_FAILURE_RATE
+        ):
+            circuit.state = CircuitState.OPEN
+            circuit.opened_at = time.monotonic()
+            circuit.probe_started = 0.0
+
+    @staticmethod
+    def try_spend_retry() -> bool:
+        """Takes one retry from global budget, returns False if budget is exhausted"""
+        if CircuitBreaker._retry_budget >= 1.0:
+            CircuitBreaker._retry_budget -= 1.0
+            return True
+        return False
+
+    @staticmethod
+    def route(url: URL) -> URL | None:
+        """Returns url if its host is available, same url on another available data server (mirror) or None if there is none"""
+        if CircuitBreaker.allow(url.host):
+            return url
+        if server_match := re_data_server.fullmatch(url.host):
+            for num in range(1, DATA_SERVERS_COUNT + 1):
+                mirror_host = f'n{num:d}.{server_match.group(2)}'
+                if mirror_host != url.host and CircuitBreaker.allow(mirror_host):
+                    return url.with_host(mirror_host)
+        return None
+
+#
+#
+#########################################
@@ -0,0 +1,60 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+import os
+import pathlib
+import shutil
+from asyncio import to_thread
+
+__all__ = ('ContentStore', 'link_file')
+
+
+def link_file(src: pathlib.Path, dst: pathlib.Path) -> bool:
+    """
+    Makes dst a hardlink to src replacing existing (partial) dst file. Falls back to copy if hardlink can't be created
+    (different volume, filesystem without hardlinks support). Returns True if file was hardlinked
+    """
+    if dst.is_file() and dst.samefile(src):
+        return True
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+        return True
+    except OSError:
+        shutil.copyfile(src, dst)
+        return False
+
+
+class ContentStore:
+    """
+    Content-addressed file store. Every verified data server file is kept once as '<root>/2c/41/<sha256>.<ext>' (same layout
+    as data server paths), post folders receive hardlinks to it so a file shared by multiple posts is only downloaded once
+    """
+    def __init__(self, root: pathlib.Path) -> None:
+        self._root = root
+
+    def path_for(self, sha256: str, suffix: str) -> pathlib.Path:
+        return self._root / sha256[:2] / sha256[2:4] / f'{sha256}{suffix.lower()}'
+
+    def find(self, sha256: str, suffix: str) -> pathlib.Path | None:
+        stored_path = self.path_for(sha256, suffix)
+        return stored_path if stored_path.is_file() else None
+
+    async def place(self, stored_path: pathlib.Path, dest: pathlib.Path) -> None:
+        await to_thread(link_file, stored_path, dest)
+
+    async def add(self, src: pathlib.Path, sha256: str, suffix: str) -> None:
+        """Stores verified file, src becomes one of its links"""
+        stored_path = self.path_for(sha256, suffix)
+        if not stored_path.is_file():
+            await to_thread(link_file, src, stored_path)
+
+#
+#
+#########################################
@@ -11,11 +11,27 @@ from enum import Enum
 CONNECT_REQUEST_DELAY = 0.1
 CONNECT_RETRY_DELAY = (4.0, 8.0)
 
+CIRCUIT_WINDOW = 20
+CIRCUIT_MIN_REQUESTS = 5
+CIRCUIT_FAILURE_RATE = 0.5
+CIRCUIT_OPEN_TIME = 30.0
+CIRCUIT_PROBE_TIMEOUT = 60.0
+RETRY_BUDGET_INITIAL = 50.0
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MAX = 200.0
+DATA_SERVERS_COUNT = 4
+
 CHUNK_BLOCK_LEN = 16
 EMPTY_IV = b'\0' * CHUNK_BLOCK_LEN
 UINT32_MAX = 0xFFFFFFFF
 DOWNLOAD_CHUNK_SIZE_INIT = 0x20000
 DOWNLOAD_CHUNK_SIZE_MAX = 0x100000
+DOWNLOAD_CHUNK_TIME_FAST = 0.05
+DOWNLOAD_CHUNK_TIME_SLOW = 0.5
+FILE_WRITE_BUFFER_CHUNKS = 8
+FILE_WRITE_BUFFER_SIZE = DOWNLOAD_CHUNK_SIZE_INIT * FILE_WRITE_BUFFER_CHUNKS
+PART_FILE_EXT = '.part'
+PART_FILE_SIDECAR_EXT = '.json'
 
 POSTS_PER_PAGE = 50
 MAX_JOBS = 8
@@ -12,9 +12,12 @@ from enum import IntEnum
 class KemonoErrorCodes(IntEnum):
     ESUCCESS = 0
     EEXISTS = 1
+    EFILTERED = 2
     ENOTFOUND = -1
     ECONNECT = -2
     ESIZE = -3
+    ERETRY = -4
+    ECHECKSUM = -5
 
     def __str__(self) -> str:
         return f'{self.name} ({self.value:d})'
@@ -23,9 +26,12 @@ class KemonoErrorCodes(IntEnum):
 KEMONO_ERROR_DESCRIPTION: dict[KemonoErrorCodes, tuple[str, str]] = {
     KemonoErrorCodes.ESUCCESS: ('ESUCCESS', 'Operation completed successfully'),
     KemonoErrorCodes.EEXISTS: ('EEXISTS', 'File already exists'),
+    KemonoErrorCodes.EFILTERED: ('EFILTERED', 'File was filtered out'),
     KemonoErrorCodes.ENOTFOUND: ('ENOTFOUND', 'No post, creator or file exists at pointed URL'),
     KemonoErrorCodes.ECONNECT: ('ECONNECT', 'General connection error'),
     KemonoErrorCodes.ESIZE: ('ESIZE', 'Downloaded file size mismatch'),
+    KemonoErrorCodes.ERETRY: ('ERETRY', 'Download attempt failed, retry is up to caller'),
+    KemonoErrorCodes.ECHECKSUM: ('ECHECKSUM', 'Downloaded file hash mismatch'),
 }
 
 
@@ -0,0 +1,177 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import pathlib
+import sys
+from asyncio import gather, get_running_loop, to_thread
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Literal
+
+from .defs import FILE_WRITE_BUFFER_SIZE
+
+__all__ = ('FileWriter', 'file_sha256')
+
+FALLOC_FL_KEEP_SIZE = 0x01
+
+
+def _load_fallocate() -> Callable[[int, int, int, int], int] | None:
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fallocate = libc.fallocate
+        fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong)
+        fallocate.restype = ctypes.c_int
+        return fallocate
+    except (OSError, AttributeError, TypeError):
+        return None
+
+
+_fallocate = _load_fallocate()
+_pwrite = getattr(os, 'pwrite', None)
+
+
+def _preallocate(fd: int, offset: int, length: int) -> None:
+    # file size is kept intact so interrupted download is still resumed from its actual end, failure is not an error
+    if _fallocate is not None and length > 0:
+        _fallocate(fd, FALLOC_FL_KEEP_SIZE, offset, length)
+
+
+def _write_at(fd: int, data: bytes | bytearray, offset: int) -> None:
+    view = memoryview(data)
+    while view:
+        if _pwrite is not None:
+            written = _pwrite(fd, view, offset)
+        else:  # Windows, fd is only ever used by writer thread so seek + write is safe
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+
+def _hash_file(update: Callable[[bytes], None], path: pathlib.Path, size: int, buffer_size: int) -> None:
+    with open(path, 'rb') as existing_file:
+        size_left = size
+        while size_left > 0 and (data := existing_file.read(min(buffer_size, size_left))):
+            update(data)
+            size_left -= len(data)
+
+
+async def file_sha256(path: pathlib.Path) -> str:
+    """Hex digest of existing file, computed in a worker thread"""
+    file_hash = hashlib.sha256()
+    await to_thread(_hash_file, file_hash.update, path, path.stat().st_size, FILE_WRITE_BUFFER_SIZE)
+    return file_hash.hexdigest()
+
+
+class FileWriter:
+    """
+    Async file writer. Chunks are coalesced in memory and flushed in large blocks at explicit offsets by a single shared I/O thread,
+    known remaining size is preallocated (Linux). Buffered data is flushed on exit, even on error, so partial download can be resumed.
+    Optionally computes SHA-256 of the whole file as it is written. Hashing is done in worker threads alongside the write of the same block
+    (existing part of appended file is read once on open), outside of the shared I/O thread so other downloads' writes aren't stalled by it
+    """
+    _executor: ThreadPoolExecutor | None = None
+
+    def __init__(self, path: pathlib.Path, mode: Literal['ab', 'wb'], expected_size=0, buffer_size=FILE_WRITE_BUFFER_SIZE,
+                 sha256=False) -> None:
+        self._path = path
+        self._mode = mode
+        self._expected_size = expected_size
+        self._buffer_size = buffer_size
+        self._buffer = bytearray()
+        self._fd = -1
+        self._offset = 0
+        self._hash = hashlib.sha256() if sha256 else None
+
+    @staticmethod
+    def _io_executor() -> ThreadPoolExecutor:
+        if FileWriter._executor is None:
+            FileWriter._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='file_writer')
+        return FileWriter._executor
+
+    def _open(self) -> None:
+        flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0) | (os.O_TRUNC if self._mode == 'wb' else 0)
+        self._fd = os.open(self._path, flags, 0o666)
+        try:
+            self._offset = os.fstat(self._fd).st_size
+            _preallocate(self._fd, self._offset, self._expected_size - self._offset)
+        except BaseException:
+            self._close()
+            raise
+
+    def _hash_existing(self) -> None:
+        _hash_file(self._hash.update, self._path, self._offset, self._buffer_size)
+
+    def _close(self) -> None:
+        os.close(self._fd)
+        self._fd = -1
+
+    async def __aenter__(self) -> FileWriter:
+        await get_running_loop().run_in_executor(self._io_executor(), self._open)
+        if self._hash is not None and self._offset > 0:
+            try:
+                await to_thread(self._hash_existing)
+            except BaseException:
+                await get_running_loop().run_in_executor(self._io_executor(), self._close)
+                raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        try:
+            await self.flush()
+        finally:
+            await get_running_loop().run_in_executor(self._io_executor(), self._close)
+
+    @property
+    def buffer_size(self) -> int:
+        return self._buffer_size
+
+    @buffer_size.setter
+    def buffer_size(self, size: int) -> None:
+        self._buffer_size = size
+
+    @property
+    def offset(self) -> int:
+        """File size including buffered data"""
+        return self._offset + len(self._buffer)
+
+    @property
+    def sha256(self) -> str:
+        """Hex digest of data written so far (including existing data), empty if hashing is disabled"""
+        return self._hash.hexdigest() if self._hash is not None else ''
+
+    async def write(self, chunk: bytes) -> None:
+        self._buffer.extend(chunk)
+        if len(self._buffer) >= self._buffer_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self._buffer:
+            return
+        # buffer is handed over to I/O thread as is, no copy
+        data, offset = self._buffer, self._offset
+        self._buffer = bytearray()
+        self._offset += len(data)
+        write = get_running_loop().run_in_executor(self._io_executor(), _write_at, self._fd, data, offset)
+        if self._hash is not None:
+            # each flush is awaited before the next one so hash is always updated sequentially
+            await gather(write, to_thread(self._hash.update, data))
+        else:
+            await write
+
+#
+#
+#########################################
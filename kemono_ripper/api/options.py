@@ -31,6 +31,7 @@ class KemonoOptions(NamedTuple):
     extra_cookies: list[tuple[str, str]]
     filters: tuple[Filter, ...]
     download_mode: DownloadMode
+    content_store: pathlib.Path | None
     # for global
     logger: Logger
 
@@ -0,0 +1,64 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+from typing import TypedDict
+
+from .defs import PART_FILE_EXT, PART_FILE_SIDECAR_EXT, UTF8
+
+__all__ = ('PartFile', 'PartFileInfo')
+
+
+class PartFileInfo(TypedDict):
+    url: str
+    size: int
+    etag: str
+    ranges: list[tuple[int, int]]
+    '''completed byte ranges [start, end)'''
+
+
+class PartFile:
+    """
+    Download in progress. Data goes to '<name>.part', sidecar '<name>.part.json' describes what is being downloaded,
+    file is renamed to its final name only once completed, so existing final file is always complete
+    """
+    def __init__(self, dest: pathlib.Path) -> None:
+        self.dest = dest
+        self.path = dest.with_name(f'{dest.name}{PART_FILE_EXT}')
+        self.sidecar_path = dest.with_name(f'{dest.name}{PART_FILE_EXT}{PART_FILE_SIDECAR_EXT}')
+
+    def size(self) -> int:
+        return self.path.stat().st_size if self.path.is_file() else 0
+
+    def load(self) -> PartFileInfo | None:
+        try:
+            with open(self.sidecar_path, 'rt', encoding=UTF8) as sidecar_file:
+                return json.load(sidecar_file)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, info: PartFileInfo) -> None:
+        self.sidecar_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.sidecar_path, 'wt', encoding=UTF8) as sidecar_file:
+            json.dump(info, sidecar_file)
+
+    def discard(self) -> None:
+        self.path.unlink(missing_ok=True)
+        self.sidecar_path.unlink(missing_ok=True)
+
+    def complete(self) -> None:
+        os.replace(self.path, self.dest)
+        self.sidecar_path.unlink(missing_ok=True)
+
+#
+#
+#########################################
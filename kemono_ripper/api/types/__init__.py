@@ -28,6 +28,7 @@ from .types import (
     SearchedPost,
     SearchedPosts,
     SQLColumn,
+    SQLIndex,
     SQLSchema,
     State,
     URLProbeResult,
@@ -58,6 +59,7 @@ __all__ = (
     'PostListedTag',
     'PostPageScanResult',
     'SQLColumn',
+    'SQLIndex',
     'SQLSchema',
     'ScannedPost',
     'ScannedPostPost',
@@ -7,18 +7,21 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 #
 
 import pathlib
+import re
 from enum import IntEnum
 from typing import Literal, NamedTuple, TypeAlias, TypedDict
 
 from yarl import URL
 
 APIEntrance = 'api/v1'
-APIMethod: TypeAlias = Literal['GET', 'POST']
+APIMethod: TypeAlias = Literal['GET', 'POST', 'HEAD']
 APIAddress: TypeAlias = Literal['kemono.cr', 'kemono.party']
 APIService: TypeAlias = Literal['patreon', 'boosty', 'subscribestar', 'fantia', 'gumroad', 'fanbox', 'discord', 'dlsite']
 APIEndpointFormat: TypeAlias = Literal['{}/user/{}/posts', '{}/user/{}/post/{}', '{}/post/{}', 'posts/tags', 'posts']
 APIEndpoint: TypeAlias = Literal['creators', APIEndpointFormat]
 
+re_data_path_sha256 = re.compile(r'^(?:/data)?/[\da-f]{2}/[\da-f]{2}/([\da-f]{64})(?:\.[^/]*)?$')
+
 
 class PostPageScanResult(NamedTuple):
     post_id: str
@@ -260,11 +263,14 @@ class DownloadFlags(IntEnum):
 
 
 class DownloadStatus:
-    def __init__(self, *, expected_size=0, flags=DownloadFlags.NONE, result=DownloadResult.UNKNOWN, state=State.NEW) -> None:
+    def __init__(self, *, expected_size=0, flags=DownloadFlags.NONE, result=DownloadResult.UNKNOWN, state=State.NEW, sha256='') -> None:
         self.size = expected_size
         self.flags = flags
         self.result = result
         self.state = state
+        self.tries = 0
+        self.sha256 = sha256
+        '''hash of completed file, verified against url'''
 
     def __str__(self) -> str:
         return f'state: {self.state!s}, flags: {self.flags!s}, result: {self.result!s}'
@@ -284,10 +290,16 @@ class SQLColumn(NamedTuple):
     default: str | None
 
 
+class SQLIndex(NamedTuple):
+    name: str
+    columns: tuple[str, ...]
+
+
 class SQLSchema(NamedTuple):
     table_name: str
     columns: tuple[SQLColumn, ...]
     primary_key: tuple[str, ...] | tuple
+    indexes: tuple[SQLIndex, ...] | tuple = ()
 
 
 class PostLinkInfo(NamedTuple):
@@ -316,6 +328,12 @@ class PostLinkInfo(NamedTuple):
     def local_path(self) -> str:
         return self.local_path3
 
+    @property
+    def url_sha256(self) -> str:
+        """Data server file path is its content hash: '/2c/41/<sha256>.png'. Empty for other links"""
+        path_match = re_data_path_sha256.match(self.url.path.lower())
+        return path_match.group(1) if path_match else ''
+
     sql_schema = SQLSchema(
         'cache_post_link',
         (
@@ -325,8 +343,13 @@ class PostLinkInfo(NamedTuple):
             SQLColumn('path', 'TEXT', True, None),
             SQLColumn('size', 'INTEGER', True, "'0'"),
             SQLColumn('flags', 'INTEGER', True, "'0'"),
+            SQLColumn('service', 'TEXT', True, "''"),
+            SQLColumn('sha256', 'TEXT', True, "''"),
         ),
-        ('post_id', 'name'))
+        ('service', 'post_id', 'name'),
+        (
+            SQLIndex('cache_post_link_sha256', ('sha256',)),
+        ))
 
 
 class PostInfo(NamedTuple):
@@ -378,8 +401,17 @@ class PostInfo(NamedTuple):
             SQLColumn('content', 'TEXT', True, None),
             SQLColumn('dest', 'TEXT', True, "''"),
             SQLColumn('flags', 'INTEGER', True, "'0'"),
+            SQLColumn('raw', 'BLOB', False, None),
+            SQLColumn('accessed', 'INTEGER', True, "'0'"),
+            SQLColumn('updated', 'INTEGER', True, "'0'"),
         ),
-        ('post_id',))
+        ('service', 'post_id'),
+        (
+            SQLIndex('cache_post_post_id', ('post_id',)),
+            SQLIndex('cache_post_creator', ('creator_id', 'service')),
+            SQLIndex('cache_post_published', ('published',)),
+            SQLIndex('cache_post_accessed', ('accessed',)),
+        ))
 
 
 class PCSDPost(TypedDict):
@@ -6,24 +6,63 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 #
 #
 
-import itertools
+import base64
+import difflib
+import gzip
+import json
+import math
 import pathlib
-from collections import defaultdict, namedtuple
-from collections.abc import Iterable, Sequence
-from typing import TypeAlias
+import random
+import time
+import zlib
+from asyncio import sleep
+from collections import OrderedDict, defaultdict, namedtuple
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from typing import NamedTuple, TypeAlias, TypeVar
 
 from yarl import URL
 
-from .api import DownloadStatus, PostInfo, PostLinkInfo, SQLSchema
+from .api import (
+    APIAddress,
+    APIService,
+    Creator,
+    DownloadFlags,
+    DownloadResult,
+    DownloadStatus,
+    PostInfo,
+    PostLinkInfo,
+    PostPageScanResult,
+    ScannedPost,
+    SQLColumn,
+    SQLIndex,
+    SQLSchema,
+)
 from .config import Config
-from .defs import CACHE_DB_NAME_DEFAULT
+from .defs import (
+    CACHE_ACCESSED_BATCH_SIZE,
+    CACHE_BUSY_TIMEOUT,
+    CACHE_CREATORS_MAX_AGE,
+    CACHE_DB_NAME_DEFAULT,
+    CACHE_LOCK_BACKOFF_BASE,
+    CACHE_LOCK_BACKOFF_MAX,
+    CACHE_LOCK_RETRIES,
+    CACHE_PRUNE_PASSES_MAX,
+    CACHE_QUERY_CHUNK_SIZE,
+    CACHE_RAW_COMPRESSION_LEVEL,
+    CACHE_STORE_CHUNK_SIZE,
+    CREATOR_FUZZY_CANDIDATES_MAX,
+    CREATOR_FUZZY_RATIO_MIN,
+    UTF8,
+    CreatorMatchMode,
+)
 from .logger import Log
+from .version import APP_NAME, APP_VERSION
 
 try:
     import sqlite3
     DBConnection: TypeAlias = sqlite3.Connection
 except ImportError:
-    from typing import Generic, TypeAlias, TypeVar
+    from typing import Generic, TypeAlias
     T_co = TypeVar('T_co', covariant=True)
 
     class DummyMethod(Generic[T_co]):
@@ -42,15 +81,286 @@ except ImportError:
 
     class DummySqlite3:
         connect = DummyMethod(DummySqlite3Connection)
+        OperationalError = Exception
 
     sqlite3 = DummySqlite3
     DBConnection: TypeAlias = DummySqlite3Connection
 
-__all__ = ('Cache',)
+__all__ = ('Cache', 'CacheStats', 'FailedLink', 'RunJournal')
+
+RT = TypeVar('RT')
 
 QueryResult: TypeAlias = list[tuple[str | int | float | bool | None, ...]]
 SchemaDumpRow = namedtuple('SchemaDumpRow', ('cid', 'col_name', 'data_type', 'not_null', 'default', 'is_pk'))
 
+POST_COLUMNS = tuple(_.name for _ in PostInfo.sql_schema.columns if _.name not in ('raw', 'accessed', 'updated'))
+'''cache_post columns mapped to PostInfo fields'''
+LINK_COLUMNS = tuple(_.name for _ in PostLinkInfo.sql_schema.columns if _.name not in ('post_id', 'service'))
+'''cache_post_link columns besides post key'''
+NODE_LOCAL_FLAGS = (
+    DownloadFlags.ALREADY_EXISTED_EXACT | DownloadFlags.ALREADY_EXISTED_SIMILAR | DownloadFlags.FILE_WAS_CREATED | DownloadFlags.COMPLETED
+)
+'''download flags describing local files state, meaningless for another node'''
+EXPORT_FORMAT = f'{APP_NAME}-cache'
+META_SCHEMA = SQLSchema(
+    'cache_meta',
+    (
+        SQLColumn('key', 'TEXT', True, None),
+        SQLColumn('value', 'TEXT', False, None),
+    ),
+    ('key',))
+'''cache_meta: key-value storage for cache bookkeeping'''
+CREATOR_SCHEMA = SQLSchema(
+    'cache_creator',
+    (
+        SQLColumn('api_address', 'TEXT', True, None),
+        SQLColumn('service', 'TEXT', True, None),
+        SQLColumn('creator_id', 'TEXT', True, None),
+        SQLColumn('name', 'TEXT', True, None),
+        SQLColumn('indexed', 'INTEGER', True, "'0'"),
+        SQLColumn('updated', 'INTEGER', True, "'0'"),
+        SQLColumn('favorited', 'INTEGER', True, "'0'"),
+    ),
+    ('api_address', 'service', 'creator_id'),
+    (
+        SQLIndex('cache_creator_creator_id', ('creator_id',)),
+    ))
+'''cache_creator: creators list per API address'''
+CREATOR_COLUMNS = tuple(_.name for _ in CREATOR_SCHEMA.columns)
+RUN_JOURNAL_SCHEMA = SQLSchema(
+    'run_journal',
+    (
+        SQLColumn('run_id', 'INTEGER', True, None),
+        SQLColumn('action', 'TEXT', True, None),
+        SQLColumn('args', 'TEXT', True, None),
+        SQLColumn('api_address', 'TEXT', True, None),
+        SQLColumn('created', 'INTEGER', True, "'0'"),
+        SQLColumn('finished', 'INTEGER', True, "'0'"),
+    ),
+    ('run_id',))
+'''run_journal: download runs, unfinished ones can be resumed'''
+RUN_JOURNAL_POST_SCHEMA = SQLSchema(
+    'run_journal_post',
+    (
+        SQLColumn('run_id', 'INTEGER', True, None),
+        SQLColumn('service', 'TEXT', True, None),
+        SQLColumn('post_id', 'TEXT', True, None),
+        SQLColumn('seq', 'INTEGER', True, None),
+        SQLColumn('creator_id', 'TEXT', True, None),
+        SQLColumn('scanned', 'INTEGER', True, "'0'"),
+        SQLColumn('done', 'INTEGER', True, "'0'"),
+    ),
+    ('run_id', 'service', 'post_id'))
+'''run_journal_post: run input posts in input order, scan and download progress'''
+RUN_JOURNAL_LINK_SCHEMA = SQLSchema(
+    'run_journal_link',
+    (
+        SQLColumn('run_id', 'INTEGER', True, None),
+        SQLColumn('service', 'TEXT', True, None),
+        SQLColumn('post_id', 'TEXT', True, None),
+        SQLColumn('name', 'TEXT', True, None),
+        SQLColumn('result', 'INTEGER', True, "'0'"),
+    ),
+    ('run_id', 'service', 'post_id', 'name'))
+'''run_journal_link: final download results of run post links'''
+FAILED_LINK_SCHEMA = SQLSchema(
+    'cache_failed_link',
+    (
+        SQLColumn('service', 'TEXT', True, None),
+        SQLColumn('post_id', 'TEXT', True, None),
+        SQLColumn('name', 'TEXT', True, None),
+        SQLColumn('error', 'TEXT', True, None),
+        SQLColumn('attempts', 'INTEGER', True, "'0'"),
+        SQLColumn('failed', 'INTEGER', True, "'0'"),
+    ),
+    ('service', 'post_id', 'name'))
+'''cache_failed_link: post links which failed to download (retries exhausted), until completed'''
+POSTS_FTS_TRIGGERS: dict[str, str] = {
+    'cache_post_fts_insert': (
+        'AFTER INSERT ON `cache_post` BEGIN\n'
+        '    INSERT INTO `cache_post_fts` (`rowid`,`title`,`content`,`tags`) VALUES (`new`.`rowid`,`new`.`title`,`new`.`content`,`new`.`tags`);\n'
+        'END'
+    ),
+    'cache_post_fts_delete': (
+        'AFTER DELETE ON `cache_post` BEGIN\n'
+        "    INSERT INTO `cache_post_fts` (`cache_post_fts`,`rowid`,`title`,`content`,`tags`)"
+        " VALUES ('delete',`old`.`rowid`,`old`.`title`,`old`.`content`,`old`.`tags`);\n"
+        'END'
+    ),
+    'cache_post_fts_update': (
+        'AFTER UPDATE OF `title`,`content`,`tags` ON `cache_post` BEGIN\n'
+        "    INSERT INTO `cache_post_fts` (`cache_post_fts`,`rowid`,`title`,`content`,`tags`)"
+        " VALUES ('delete',`old`.`rowid`,`old`.`title`,`old`.`content`,`old`.`tags`);\n"
+        '    INSERT INTO `cache_post_fts` (`rowid`,`title`,`content`,`tags`) VALUES (`new`.`rowid`,`new`.`title`,`new`.`content`,`new`.`tags`);\n'
+        'END'
+    ),
+}
+'''cache_post_fts sync triggers'''
+META_KEY_LAST_RUN_TIME = 'last_run_time'
+META_KEY_LAST_RUN_LOOKUPS = 'last_run_lookups'
+META_KEY_LAST_RUN_HITS = 'last_run_hits'
+META_KEY_CREATORS_TIME = 'creators_time'
+QUERY_IN_PARAMS = ','.join('?' * CACHE_QUERY_CHUNK_SIZE)
+'''?,?,...,? (CACHE_QUERY_CHUNK_SIZE times)'''
+
+
+class SchemaMigration(NamedTuple):
+    version: int
+    description: str
+    queries: tuple[str, ...]
+
+
+class CacheStats(NamedTuple):
+    db_path: pathlib.Path
+    file_size: int
+    page_size: int
+    page_count: int
+    free_pages: int
+    auto_vacuum: int
+    posts: int
+    posts_raw: int
+    links: int
+    oldest_access: int
+    table_sizes: dict[str, int]
+    '''table / index name -> bytes, empty if sqlite3 is built without dbstat'''
+    meta: dict[str, str]
+
+    @property
+    def used_size(self) -> int:
+        return (self.page_count - self.free_pages) * self.page_size
+
+    @property
+    def last_run_time(self) -> int:
+        return int(self.meta.get(META_KEY_LAST_RUN_TIME, 0))
+
+    @property
+    def last_run_lookups(self) -> int:
+        return int(self.meta.get(META_KEY_LAST_RUN_LOOKUPS, 0))
+
+    @property
+    def last_run_hits(self) -> int:
+        return int(self.meta.get(META_KEY_LAST_RUN_HITS, 0))
+
+
+class RunJournal(NamedTuple):
+    run_id: int
+    action: str
+    args: str
+    created: int
+    finished: int
+    links: list[PostPageScanResult]
+    '''input posts in input order'''
+    scanned: set[str]
+    '''cache keys of input posts scanned already'''
+
+
+class FailedLink(NamedTuple):
+    service: str
+    post_id: str
+    name: str
+    error: str
+    '''error code name or external handler name'''
+    attempts: int
+    '''total over all runs'''
+    failed: int
+    '''last failure time'''
+
+
+# Migrations are applied in order, each one within a single transaction, starting at DB's 'user_version'.
+# Queries must never be changed once released, new schema changes always go into a new migration
+SCHEMA_MIGRATIONS: tuple[SchemaMigration, ...] = (
+    SchemaMigration(1, 'composite (service, post_id) keys, creator and date indexes', (
+        # version 0 (unversioned) schema, fresh DB starts here too
+        'CREATE TABLE IF NOT EXISTS `cache_post` (\n'
+        '    `post_id` TEXT NOT NULL, `creator_id` TEXT NOT NULL, `service` TEXT NOT NULL, `title` TEXT NOT NULL,\n'
+        '    `imported` TEXT, `published` TEXT, `edited` TEXT, `tags` TEXT NOT NULL, `content` TEXT NOT NULL,\n'
+        "    `dest` TEXT NOT NULL DEFAULT '', `flags` INTEGER NOT NULL DEFAULT '0',\n"
+        '    PRIMARY KEY (`post_id`)\n'
+        ')',
+        'CREATE TABLE IF NOT EXISTS `cache_post_link` (\n'
+        '    `post_id` TEXT NOT NULL, `name` TEXT NOT NULL, `url` TEXT NOT NULL, `path` TEXT NOT NULL,\n'
+        "    `size` INTEGER NOT NULL DEFAULT '0', `flags` INTEGER NOT NULL DEFAULT '0',\n"
+        '    PRIMARY KEY (`post_id`,`name`)\n'
+        ')',
+        'CREATE TABLE `cache_post_v1` (\n'
+        '    `post_id` TEXT NOT NULL, `creator_id` TEXT NOT NULL, `service` TEXT NOT NULL, `title` TEXT NOT NULL,\n'
+        '    `imported` TEXT, `published` TEXT, `edited` TEXT, `tags` TEXT NOT NULL, `content` TEXT NOT NULL,\n'
+        "    `dest` TEXT NOT NULL DEFAULT '', `flags` INTEGER NOT NULL DEFAULT '0',\n"
+        '    PRIMARY KEY (`service`,`post_id`)\n'
+        ')',
+        'CREATE TABLE `cache_post_link_v1` (\n'
+        '    `post_id` TEXT NOT NULL, `name` TEXT NOT NULL, `url` TEXT NOT NULL, `path` TEXT NOT NULL,\n'
+        "    `size` INTEGER NOT NULL DEFAULT '0', `flags` INTEGER NOT NULL DEFAULT '0', `service` TEXT NOT NULL DEFAULT '',\n"
+        '    PRIMARY KEY (`service`,`post_id`,`name`)\n'
+        ')',
+        'INSERT INTO `cache_post_v1` SELECT * FROM `cache_post`',
+        'INSERT INTO `cache_post_link_v1` SELECT `l`.*, `p`.`service` FROM `cache_post_link` AS `l` '
+        'INNER JOIN `cache_post` AS `p` ON `p`.`post_id`=`l`.`post_id`',
+        'DROP TABLE `cache_post`',
+        'DROP TABLE `cache_post_link`',
+        'ALTER TABLE `cache_post_v1` RENAME TO `cache_post`',
+        'ALTER TABLE `cache_post_link_v1` RENAME TO `cache_post_link`',
+        'CREATE INDEX `cache_post_post_id` ON `cache_post` (`post_id`)',
+        'CREATE INDEX `cache_post_creator` ON `cache_post` (`creator_id`,`service`)',
+        'CREATE INDEX `cache_post_published` ON `cache_post` (`published`)',
+    )),
+    SchemaMigration(2, 'compressed raw scanned post', (
+        'ALTER TABLE `cache_post` ADD COLUMN `raw` BLOB',
+    )),
+    SchemaMigration(3, 'post access time and cache bookkeeping', (
+        "ALTER TABLE `cache_post` ADD COLUMN `accessed` INTEGER NOT NULL DEFAULT '0'",
+        "UPDATE `cache_post` SET `accessed`=CAST(strftime('%s','now') AS INTEGER)",
+        'CREATE INDEX `cache_post_accessed` ON `cache_post` (`accessed`)',
+        'CREATE TABLE `cache_meta` (\n'
+        '    `key` TEXT NOT NULL, `value` TEXT,\n'
+        '    PRIMARY KEY (`key`)\n'
+        ')',
+    )),
+    SchemaMigration(4, 'post update time', (
+        "ALTER TABLE `cache_post` ADD COLUMN `updated` INTEGER NOT NULL DEFAULT '0'",
+        'UPDATE `cache_post` SET `updated`=`accessed`',
+    )),
+    SchemaMigration(5, 'creators list', (
+        'CREATE TABLE `cache_creator` (\n'
+        '    `api_address` TEXT NOT NULL, `service` TEXT NOT NULL, `creator_id` TEXT NOT NULL, `name` TEXT NOT NULL,\n'
+        "    `indexed` INTEGER NOT NULL DEFAULT '0', `updated` INTEGER NOT NULL DEFAULT '0', `favorited` INTEGER NOT NULL DEFAULT '0',\n"
+        '    PRIMARY KEY (`api_address`,`service`,`creator_id`)\n'
+        ')',
+        'CREATE INDEX `cache_creator_creator_id` ON `cache_creator` (`creator_id`)',
+    )),
+    SchemaMigration(6, 'verified file hash', (
+        "ALTER TABLE `cache_post_link` ADD COLUMN `sha256` TEXT NOT NULL DEFAULT ''",
+    )),
+    SchemaMigration(7, 'local files by hash', (
+        'CREATE INDEX `cache_post_link_sha256` ON `cache_post_link` (`sha256`)',
+    )),
+    SchemaMigration(8, 'run journal', (
+        'CREATE TABLE `run_journal` (\n'
+        '    `run_id` INTEGER NOT NULL, `action` TEXT NOT NULL, `args` TEXT NOT NULL, `api_address` TEXT NOT NULL,\n'
+        "    `created` INTEGER NOT NULL DEFAULT '0', `finished` INTEGER NOT NULL DEFAULT '0',\n"
+        '    PRIMARY KEY (`run_id`)\n'
+        ')',
+        'CREATE TABLE `run_journal_post` (\n'
+        '    `run_id` INTEGER NOT NULL, `service` TEXT NOT NULL, `post_id` TEXT NOT NULL, `seq` INTEGER NOT NULL,\n'
+        "    `creator_id` TEXT NOT NULL, `scanned` INTEGER NOT NULL DEFAULT '0', `done` INTEGER NOT NULL DEFAULT '0',\n"
+        '    PRIMARY KEY (`run_id`,`service`,`post_id`)\n'
+        ')',
+        'CREATE TABLE `run_journal_link` (\n'
+        '    `run_id` INTEGER NOT NULL, `service` TEXT NOT NULL, `post_id` TEXT NOT NULL, `name` TEXT NOT NULL,\n'
+        "    `result` INTEGER NOT NULL DEFAULT '0',\n"
+        '    PRIMARY KEY (`run_id`,`service`,`post_id`,`name`)\n'
+        ')',
+    )),
+    SchemaMigration(9, 'failed links', (
+        'CREATE TABLE `cache_failed_link` (\n'
+        '    `service` TEXT NOT NULL, `post_id` TEXT NOT NULL, `name` TEXT NOT NULL, `error` TEXT NOT NULL,\n'
+        "    `attempts` INTEGER NOT NULL DEFAULT '0', `failed` INTEGER NOT NULL DEFAULT '0',\n"
+        '    PRIMARY KEY (`service`,`post_id`,`name`)\n'
+        ')',
+    )),
+)
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1].version
+
 
 def _make_schema_string(schema: SQLSchema) -> str:
     fields = [
@@ -64,6 +374,45 @@ def _make_schema_string(schema: SQLSchema) -> str:
     return schema_str
 
 
+def _compress_scanned_post(scanned_post: ScannedPost) -> bytes:
+    return zlib.compress(json.dumps(scanned_post, ensure_ascii=False, separators=(',', ':')).encode(UTF8), CACHE_RAW_COMPRESSION_LEVEL)
+
+
+def _decompress_scanned_post(raw: bytes) -> ScannedPost:
+    return json.loads(zlib.decompress(raw).decode(UTF8))
+
+
+def _chunked(items: Sequence[str]) -> Iterator[tuple[str, ...]]:
+    """
+    Splits items into chunks of exactly CACHE_QUERY_CHUNK_SIZE elements, last chunk is padded with its last item.
+    Keeps 'IN (?,...)' query text constant so it is parsed once and then reused from the statement cache
+    """
+    for i in range(0, len(items), CACHE_QUERY_CHUNK_SIZE):
+        chunk = tuple(items[i:i + CACHE_QUERY_CHUNK_SIZE])
+        yield (*chunk, *((chunk[-1],) * (CACHE_QUERY_CHUNK_SIZE - len(chunk))))
+
+
+def _escape_like(pattern: str) -> str:
+    return pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _fts_phrase(text: str) -> str:
+    return f'"{text.replace(chr(34), chr(34) * 2)}"'
+
+
+def _fuzzy_ratio(pattern: str, name: str) -> float:
+    """Best similarity of lowercase pattern to any same length part of name, 0.0..1.0"""
+    name = name.lower()
+    if len(name) <= len(pattern):
+        return difflib.SequenceMatcher(None, pattern, name).ratio()
+    return max(difflib.SequenceMatcher(None, pattern, name[i:i + len(pattern)]).ratio() for i in range(len(name) - len(pattern) + 1))
+
+
+def _is_locked_error(e: Exception) -> bool:
+    """SQLITE_BUSY / SQLITE_LOCKED, another process is holding the lock"""
+    return isinstance(e, sqlite3.OperationalError) and any(_ in str(e) for _ in ('locked', 'busy'))
+
+
 def _verify_schema(schema: SQLSchema, schema_dump: QueryResult) -> bool:
     if len(schema.columns) != len(schema_dump):
         return False
@@ -85,37 +434,120 @@ def _verify_schema(schema: SQLSchema, schema_dump: QueryResult) -> bool:
 
 class Cache:
     _db: DBConnection | None = None
+    _lookups: int = 0
+    _hits: int = 0
+    _memory: OrderedDict[str, PostInfo] = OrderedDict()
+    '''in-memory LRU tier, write-through. Keyed by PostInfo.as_cache_key()'''
+    _memory_capacity: int = 0
+    _memory_accessed: set[tuple[str, str]] = set()
+    '''(service, post_id) of memory tier hits with 'accessed' time not yet written to DB'''
+    _creators_fts: bool = False
+    '''FTS5 trigram index over creator names is available'''
+    _posts_fts: bool = False
+    '''FTS5 index over post title, content and tags is available'''
 
     @classmethod
     async def __aenter__(cls, _self) -> None:  # noqa PLE0302
         assert cls._db is None
         Log.debug(f'Opening cache DB \'{CACHE_DB_NAME_DEFAULT}\'...')
-        cls._db = sqlite3.connect(f'{Config.default_config_path().with_name(CACHE_DB_NAME_DEFAULT).as_posix()}', isolation_level=None)
+        # short busy timeout blocks the whole event loop, longer waits are handled by async retries
+        cls._db = sqlite3.connect(f'{cls._db_path().as_posix()}', timeout=CACHE_BUSY_TIMEOUT, isolation_level=None)
+        cls._memory_capacity = Config.memory_cache or 0
         if not hasattr(cls._db, 'in_transaction'):
             Log.warn('Warning: sqlite3 module in unavailable! Caching will be disabled!')
             return
+        # WAL: readers never block writer and vice versa, multiple processes can share one DB. Setting persists in DB file
+        journal_mode = (await cls._query('PRAGMA journal_mode=WAL'))[0][0]
+        if journal_mode != 'wal':
+            Log.warn(f'Warning: unable to enable WAL mode for cache DB (journal mode is \'{journal_mode}\')!')
+        await cls._query('PRAGMA synchronous=NORMAL')
         await cls._ensure_db_schema()
 
     @classmethod
     async def __aexit__(cls, _self, exc_type, exc_val, exc_tb) -> None:  # noqa PLE0302
+        if cls._memory_accessed and hasattr(cls._db, 'in_transaction'):
+            await cls._flush_memory_accessed()
+        if cls._lookups and hasattr(cls._db, 'in_transaction'):
+            Log.debug(f'Cache hits: {cls._hits:d} / {cls._lookups:d}')
+            await Cache._store_meta({
+                META_KEY_LAST_RUN_TIME: str(int(time.time())),
+                META_KEY_LAST_RUN_LOOKUPS: str(cls._lookups),
+                META_KEY_LAST_RUN_HITS: str(cls._hits),
+            })
+        cls._lookups = cls._hits = 0
+        cls._memory.clear()
+        cls._memory_accessed.clear()
         cls._db.close()
         cls._db = None
 
+    @staticmethod
+    def _db_path() -> pathlib.Path:
+        return Config.default_config_path().with_name(CACHE_DB_NAME_DEFAULT)
+
     @staticmethod
     def _table_name_from_schema(schema: str) -> str:
         return schema[:schema.find(' ')].strip('`')
 
     @staticmethod
     async def _ensure_db_schema() -> None:
-        for ntup in (PostInfo, PostLinkInfo):
-            schema = _make_schema_string(ntup.sql_schema)
-            await Cache._execute_one((f'CREATE TABLE IF NOT EXISTS {schema}', ()))
+        db_version: int = (await Cache._query('PRAGMA user_version'))[0][0]
+        assert db_version <= SCHEMA_VERSION, (
+            f'Cache DB schema version {db_version:d} is newer than supported version {SCHEMA_VERSION:d}! Update {APP_NAME}!'
+        )
+        for migration in SCHEMA_MIGRATIONS[db_version:]:
+            Log.info(f'Upgrading cache DB schema to version {migration.version:d}: {migration.description}...')
+            await Cache._apply_migration(migration)
+        indexes_existing = {_[0] for _ in await Cache._query("SELECT `name` FROM `sqlite_master` WHERE `type`='index'")}
+        for sql_schema in (PostInfo.sql_schema, PostLinkInfo.sql_schema, META_SCHEMA, CREATOR_SCHEMA,
+                           RUN_JOURNAL_SCHEMA, RUN_JOURNAL_POST_SCHEMA, RUN_JOURNAL_LINK_SCHEMA, FAILED_LINK_SCHEMA):
+            schema = _make_schema_string(sql_schema)
             table_name = Cache._table_name_from_schema(schema)
             schema_existing = await Cache._dump_table_schema(table_name)
-            assert _verify_schema(ntup.sql_schema, schema_existing), (
+            assert _verify_schema(sql_schema, schema_existing), (
                 f'Invalid table {table_name} schema detected!\n\'\'\'\n{schema}\n\'\'\'\nExpected:\n\'\'\'\n{schema_existing!s}\n\'\'\''
                 f'\nDelete outdated schema DB or fix it manually!'
             )
+            indexes_missing = [_.name for _ in sql_schema.indexes if _.name not in indexes_existing]
+            assert not indexes_missing, f'Table {table_name} is missing indexes: {indexes_missing!s}! Delete DB or fix it manually!'
+        await Cache._ensure_fts()
+
+    @staticmethod
+    async def _ensure_fts() -> None:
+        # optional, depends on sqlite3 build (FTS5, 3.34+), so not a part of versioned schema. Maintained manually, no triggers
+        try:
+            await Cache._query(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS `cache_creator_fts` USING fts5(`name`, content='cache_creator', tokenize='trigram')")
+            await Cache._query('SELECT 1 FROM `cache_creator_fts` LIMIT 0')
+            Cache._creators_fts = True
+        except sqlite3.OperationalError as e:
+            Log.debug(f'Creators full-text index is unavailable ({e!s}), falling back to table scan')
+            Cache._creators_fts = False
+        # same but synced by triggers since posts are written all the time. Triggers are dropped if FTS5 is unavailable
+        # (otherwise they break every write), index is then rebuilt once it's available again
+        triggers_existing = {_[0] for _ in await Cache._query("SELECT `name` FROM `sqlite_master` WHERE `type`='trigger'")}
+        try:
+            await Cache._query(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS `cache_post_fts` USING fts5("
+                "`title`, `content`, `tags`, content='cache_post', tokenize='unicode61 remove_diacritics 2')")
+            await Cache._query('SELECT 1 FROM `cache_post_fts` LIMIT 0')
+            if any(_ not in triggers_existing for _ in POSTS_FTS_TRIGGERS):
+                Log.info('Building cache posts full-text index...')
+                await Cache._execute_one(
+                    *((f'CREATE TRIGGER IF NOT EXISTS `{name}` {body}', ()) for name, body in POSTS_FTS_TRIGGERS.items()),
+                    ("INSERT INTO `cache_post_fts` (`cache_post_fts`) VALUES ('rebuild')", ()),
+                )
+            Cache._posts_fts = True
+        except sqlite3.OperationalError as e:
+            Log.debug(f'Posts full-text index is unavailable ({e!s}), falling back to table scan')
+            await Cache._execute_one(*((f'DROP TRIGGER IF EXISTS `{_}`', ()) for _ in POSTS_FTS_TRIGGERS))
+            Cache._posts_fts = False
+
+    @staticmethod
+    async def _rebuild_fts() -> None:
+        await Cache._execute_one(
+            *((("INSERT INTO `cache_creator_fts` (`cache_creator_fts`) VALUES ('rebuild')", ()),) if Cache._creators_fts else ()),
+            *((("INSERT INTO `cache_post_fts` (`cache_post_fts`) VALUES ('rebuild')", ()),) if Cache._posts_fts else ()),
+        )
 
     @staticmethod
     async def _dump_table_schema(table_name: str) -> QueryResult:
@@ -123,88 +555,616 @@ class Cache:
         results = await Cache._query(f"PRAGMA TABLE_INFO('{table_name}')")
         return results
 
+    @staticmethod
+    async def _with_retries(func: Callable[[], RT]) -> RT:
+        """Runs func, retrying with exponential backoff + jitter while DB is locked by another process"""
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except sqlite3.OperationalError as e:
+                if attempt >= CACHE_LOCK_RETRIES or not _is_locked_error(e):
+                    raise
+                delay = min(CACHE_LOCK_BACKOFF_MAX, CACHE_LOCK_BACKOFF_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+                attempt += 1
+                Log.trace(f'Cache DB is locked ({e!s}), retrying in {delay:.2f}s ({attempt:d}/{CACHE_LOCK_RETRIES:d})...')
+                await sleep(delay)
+
+    @staticmethod
+    def _write_transaction(func: Callable[[DBConnection], RT]) -> Callable[[], RT]:
+        """
+        Wraps func into immediate transaction: write lock is taken upfront so busy handler applies
+        and deferred read->write lock upgrade deadlock between processes is impossible
+        """
+        def run_transaction() -> RT:
+            assert Cache._db
+            with Cache._db:
+                Cache._db.execute('BEGIN IMMEDIATE')
+                return func(Cache._db)
+        return run_transaction
+
+    @staticmethod
+    async def _apply_migration(migration: SchemaMigration) -> None:
+        def migrate(db: DBConnection) -> None:
+            # another process may have applied it already while we were waiting for the lock
+            if db.execute('PRAGMA user_version').fetchone()[0] >= migration.version:
+                return
+            [db.execute(query) for query in (*migration.queries, f'PRAGMA user_version={migration.version:d}')]
+        await Cache._with_retries(Cache._write_transaction(migrate))
+
     @staticmethod
     async def _execute_one(*queries: tuple[str, Sequence[str | int | float | bool]]) -> None:
-        assert Cache._db
-        with Cache._db:
-            [Cache._db.execute(query, params) for query, params in queries]
+        await Cache._with_retries(Cache._write_transaction(lambda db: [db.execute(query, params) for query, params in queries]))
 
     @staticmethod
     async def _execute_many(*queries: tuple[str, Sequence[Sequence[str | int | float | bool]]]) -> None:
         if not queries:
             return
-        assert Cache._db
-        with Cache._db:
-            [Cache._db.executemany(query, params) for query, params in queries]
+        await Cache._with_retries(Cache._write_transaction(lambda db: [db.executemany(query, params) for query, params in queries]))
 
     @staticmethod
     async def _query(query: str, params: Sequence[str | int | float | bool] = ()) -> QueryResult:
         assert Cache._db
-        with Cache._db:
-            return Cache._db.execute(f'{query};', params).fetchall()
+        return await Cache._with_retries(lambda: Cache._db.execute(f'{query};', params).fetchall())
 
     @staticmethod
-    async def get_post_info_cache(post_ids_: Iterable[str]) -> list[PostInfo]:
-        post_ids = ','.join(f'\'{_}\'' for _ in post_ids_)
-        presults = await Cache._query(
-            'SELECT {columns} FROM `cache_post` '
-            'WHERE `post_id` IN ({ids})'
-            .format(columns=','.join(f'`{_.name}`' for _ in PostInfo.sql_schema.columns), ids=post_ids), ())
-        plresults = await Cache._query(
-            'SELECT {columns} FROM `cache_post_link` '
-            'WHERE `post_id` IN ({ids}) ORDER BY `post_id`'
-            .format(columns=','.join(f'`{_.name}`' for _ in PostLinkInfo.sql_schema.columns), ids=post_ids), ())
-        post_links: dict[str, list[PostLinkInfo]] = defaultdict(list[PostLinkInfo])
+    async def _query_chunked(query: str, params: Sequence[str], prefix: Sequence[str] = ()) -> QueryResult:
+        results: QueryResult = []
+        for chunk in _chunked(params):
+            results.extend(await Cache._query(query, (*prefix, *chunk)))
+        return results
+
+    @staticmethod
+    async def _execute_chunked(query: str, params: Sequence[str], prefix: Sequence[str] = ()) -> None:
+        await Cache._execute_many((query, [(*prefix, *chunk) for chunk in _chunked(params)]))
+
+    @staticmethod
+    def _post_keys_condition(service: APIService | None, *, links: bool) -> tuple[str, tuple[str, ...]]:
+        """
+        Returns WHERE condition for a chunk of post ids + its params prefix.
+        Links of posts with unknown service are resolved through 'cache_post' so lookup still uses primary key
+        """
+        if service:
+            return f'`service`=? AND `post_id` IN ({QUERY_IN_PARAMS})', (service,)
+        elif links:
+            return f'(`service`,`post_id`) IN (SELECT `service`,`post_id` FROM `cache_post` WHERE `post_id` IN ({QUERY_IN_PARAMS}))', ()
+        else:
+            return f'`post_id` IN ({QUERY_IN_PARAMS})', ()
+
+    @staticmethod
+    def _memory_put(post_infos: Iterable[PostInfo], *, existing_only=False) -> None:
+        if not Cache._memory_capacity:
+            return
+        for post_info in post_infos:
+            key = post_info.as_cache_key()
+            if existing_only and key not in Cache._memory:
+                continue
+            Cache._memory[key] = post_info
+            Cache._memory.move_to_end(key)
+        while len(Cache._memory) > Cache._memory_capacity:
+            Cache._memory.popitem(last=False)
+
+    @staticmethod
+    def _memory_get(post_ids: Iterable[str], service: APIService) -> tuple[list[PostInfo], list[str]]:
+        """Returns memory hits and post ids which are not in memory"""
+        hits: list[PostInfo] = []
+        misses: list[str] = []
+        for post_id in post_ids:
+            if post_info := Cache._memory.get(f'{post_id}:{service}'):
+                Cache._memory.move_to_end(post_info.as_cache_key())
+                Cache._memory_accessed.add((service, post_id))
+                hits.append(post_info)
+            else:
+                misses.append(post_id)
+        return hits, misses
+
+    @staticmethod
+    async def _flush_memory_accessed() -> None:
+        """Writes 'accessed' time of memory tier hits so they are not the first ones to be pruned"""
+        accessed_keys, Cache._memory_accessed = Cache._memory_accessed, set()
+        if accessed_keys:
+            accessed = int(time.time())
+            await Cache._execute_many(('UPDATE `cache_post` SET `accessed`=? WHERE `service`=? AND `post_id`=?',
+                                       [(accessed, *_) for _ in accessed_keys]))
+
+    @staticmethod
+    async def get_post_info_cache(post_ids_: Iterable[str], service: APIService | None = None) -> list[PostInfo]:
+        """
+        Returns cached post infos. With in-memory tier enabled returned objects are shared with it,
+        any changes must be written back using one of the store / update methods
+        """
+        post_ids = list(dict.fromkeys(post_ids_))
+        # without service post id may match posts of multiple services, only persistent layer can answer that
+        memory_hits, post_ids_db = Cache._memory_get(post_ids, service) if Cache._memory_capacity and service else ([], post_ids)
+        post_infos = [*memory_hits, *await Cache._get_post_info_cache_db(post_ids_db, service)] if post_ids_db else memory_hits
+        if len(Cache._memory_accessed) >= CACHE_ACCESSED_BATCH_SIZE:
+            await Cache._flush_memory_accessed()
+        Cache._lookups += len(post_ids)
+        Cache._hits += len({_.post_id for _ in post_infos})
+        return post_infos
+
+    @staticmethod
+    async def _get_post_info_cache_db(post_ids: list[str], service: APIService | None) -> list[PostInfo]:
+        pcondition, pprefix = Cache._post_keys_condition(service, links=False)
+        presults = await Cache._query_chunked(
+            'SELECT {columns} FROM `cache_post` WHERE {condition}'
+            .format(columns=','.join(f'`{_}`' for _ in POST_COLUMNS), condition=pcondition), post_ids, pprefix)
+        plcondition, plprefix = Cache._post_keys_condition(service, links=True)
+        plresults = await Cache._query_chunked(
+            'SELECT {columns} FROM `cache_post_link` WHERE {condition}'
+            .format(columns=','.join(f'`{_.name}`' for _ in PostLinkInfo.sql_schema.columns), condition=plcondition), post_ids, plprefix)
+        post_links: dict[tuple[str, str], list[PostLinkInfo]] = defaultdict(list[PostLinkInfo])
         for plr in plresults:
-            post_links[plr[0]].append(
-                PostLinkInfo(plr[0], plr[1], URL(plr[2]), pathlib.Path(plr[3]), DownloadStatus(expected_size=plr[4], flags=plr[5])),
+            post_links[(plr[6], plr[0])].append(
+                PostLinkInfo(plr[0], plr[1], URL(plr[2]), pathlib.Path(plr[3]),
+                             DownloadStatus(expected_size=plr[4], flags=plr[5], sha256=plr[7])),
             )
         post_infos: list[PostInfo] = []
         for pr in presults:
             post_info = PostInfo(pr[0], pr[1], pr[2], pr[3], pr[4], pr[5], pr[6], pr[7].split(','), pr[8],
-                                 pathlib.Path(pr[9]), list(post_links.get(pr[0], [])), DownloadStatus(flags=pr[10]))
+                                 pathlib.Path(pr[9]), list(post_links.get((pr[2], pr[0]), [])), DownloadStatus(flags=pr[10]))
             post_infos.append(post_info)
+        if post_infos:
+            await Cache._execute_chunked(f'UPDATE `cache_post` SET `accessed`=? WHERE {pcondition}', post_ids, (int(time.time()), *pprefix))
+            Cache._memory_put(post_infos)
         return post_infos
 
     @staticmethod
-    async def store_post_info_cache(post_infos: Sequence[PostInfo]) -> None:
+    async def get_scanned_post_cache(post_ids_: Iterable[str], service: APIService | None = None) -> list[ScannedPost]:
+        post_ids = list(dict.fromkeys(post_ids_))
+        pcondition, pprefix = Cache._post_keys_condition(service, links=False)
+        rresults = await Cache._query_chunked(
+            f'SELECT `raw` FROM `cache_post` WHERE {pcondition} AND `raw` IS NOT NULL', post_ids, pprefix)
+        return [_decompress_scanned_post(_[0]) for _ in rresults]
+
+    @staticmethod
+    async def search_post_info_cache(search_string: str, tags: Sequence[str] = ()) -> list[PostInfo]:
+        """
+        Searches cached posts title, content and tags. All words must be present, 'word*' matches word prefix.
+        Every one of 'tags' must be present in post tags. Results are sorted by publish date, newest first
+        """
+        words = [_ for _ in search_string.split() if _.rstrip('*')]
+        conditions: list[str] = []
+        params: list[str] = []
+        if Cache._posts_fts and words:
+            # fts5 MATCH requires the table name, aliases are not accepted on the left side
+            source = '`cache_post_fts` INNER JOIN `cache_post` AS `p` ON `p`.`rowid`=`cache_post_fts`.`rowid`'
+            conditions.append('`cache_post_fts` MATCH ?')
+            params.append(' '.join(f'{_fts_phrase(_[:-1])}*' if _.endswith('*') else _fts_phrase(_) for _ in words))
+        else:
+            source = '`cache_post` AS `p`'
+            for word in words:
+                conditions.append("(`p`.`title`||' '||`p`.`content`||' '||`p`.`tags`) LIKE ? ESCAPE '\\'")
+                params.append(f'%{_escape_like(word.rstrip("*"))}%')
+        for tag in tags:
+            conditions.append("(','||`p`.`tags`||',') LIKE ? ESCAPE '\\'")
+            params.append(f'%,{_escape_like(tag)},%')
+        results = await Cache._query(
+            f'SELECT `p`.`service`,`p`.`post_id` FROM {source} WHERE {" AND ".join(conditions) or "1"}', params)
+        service_post_ids: dict[str, list[str]] = defaultdict(list)
+        for service, post_id in results:
+            service_post_ids[service].append(post_id)
+        post_infos: list[PostInfo] = []
+        for service, post_ids in service_post_ids.items():
+            post_infos.extend(await Cache._get_post_info_cache_db(post_ids, service))
+        return sorted(post_infos, key=lambda pi: pi.published or '', reverse=True)
+
+    @staticmethod
+    async def store_post_info_cache(post_infos: Sequence[PostInfo], scanned_posts: Sequence[ScannedPost] = ()) -> None:
+        """Stores post infos, optionally along with their source scanned posts (matched by index). Stored scanned post is kept otherwise"""
+        assert not scanned_posts or len(scanned_posts) == len(post_infos)
+        # one short transaction per chunk, concurrent processes don't have to wait for the whole batch
+        for i in range(0, len(post_infos), CACHE_STORE_CHUNK_SIZE):
+            await Cache._store_post_info_cache_chunk(
+                post_infos[i:i + CACHE_STORE_CHUNK_SIZE], scanned_posts[i:i + CACHE_STORE_CHUNK_SIZE] if scanned_posts else ())
+        Cache._memory_put(post_infos)
+
+    @staticmethod
+    async def _store_post_info_cache_chunk(post_infos: Sequence[PostInfo], scanned_posts: Sequence[ScannedPost]) -> None:
+        accessed = int(time.time())
         await Cache._execute_many(
-            (f'REPLACE INTO `cache_post` ({",".join(_.name for _ in PostInfo.sql_schema.columns)})\n'
-             f'VALUES\n({",".join("?" * len(PostInfo.sql_schema.columns))})',
+            (f'INSERT INTO `cache_post` ({",".join(f"`{_}`" for _ in POST_COLUMNS)},`raw`,`accessed`,`updated`)\n'
+             f'VALUES\n({",".join("?" * (len(POST_COLUMNS) + 3))})\n'
+             f'ON CONFLICT (`service`,`post_id`) DO UPDATE SET\n'
+             f'{",".join(f"`{_}`=`excluded`.`{_}`" for _ in POST_COLUMNS)},`raw`=COALESCE(`excluded`.`raw`,`raw`),'
+             f'`accessed`=`excluded`.`accessed`,`updated`=`excluded`.`updated`',
              [
                  (_.post_id, _.creator_id, _.service, _.title, _.imported, _.published, _.edited,
-                  ','.join(_.tags), _.content, _.dest.as_posix(), int(_.status.flags))
-                 for _ in post_infos
+                  ','.join(_.tags), _.content, _.dest.as_posix(), int(_.status.flags),
+                  _compress_scanned_post(scanned_posts[i]) if scanned_posts else None, accessed, accessed)
+                 for i, _ in enumerate(post_infos)
              ],
              ),
-        )
-
-        await Cache._execute_many(
+            ('DELETE FROM `cache_post_link` WHERE `service`=? AND `post_id`=?', [(_.service, _.post_id) for _ in post_infos]),
             (f'REPLACE INTO `cache_post_link` ({",".join(_.name for _ in PostLinkInfo.sql_schema.columns)})\n'
              f'VALUES\n({",".join("?" * len(PostLinkInfo.sql_schema.columns))})',
              [
-                 (_.post_id, _.name, str(_.url), _.path.as_posix(), _.status.size, int(_.status.flags))
-                 for _ in list[PostLinkInfo](itertools.chain(*(_.links for _ in post_infos)))
+                 (pl.post_id, pl.name, str(pl.url), pl.path.as_posix(), pl.status.size, int(pl.status.flags), pi.service, pl.status.sha256)
+                 for pi in post_infos for pl in pi.links
              ],
              ),
         )
 
     @staticmethod
     async def update_post_info_cache(post_info: PostInfo) -> None:
-        await Cache._execute_one(('UPDATE `cache_post` SET `dest`=?, `flags`=? WHERE `post_id`=?',
-                                  (post_info.dest.as_posix(), int(post_info.status.flags), post_info.post_id)))
+        await Cache._execute_one(('UPDATE `cache_post` SET `dest`=?, `flags`=? WHERE `service`=? AND `post_id`=?',
+                                  (post_info.dest.as_posix(), int(post_info.status.flags), post_info.service, post_info.post_id)))
+        Cache._memory_put((post_info,), existing_only=True)
+
+    @staticmethod
+    async def update_post_link_info_cache(post_info: PostInfo, post_link_info: PostLinkInfo) -> None:
+        key = (post_info.service, post_link_info.post_id, post_link_info.name)
+        await Cache._execute_one(
+            ('UPDATE `cache_post_link` SET `path`=?, `size`=?, `flags`=?, `sha256`=? WHERE `service`=? AND `post_id`=? AND `name`=?',
+             (post_link_info.path.as_posix(), post_link_info.status.size, int(post_link_info.status.flags), post_link_info.status.sha256,
+              *key)),
+            # completed link is not failed anymore
+            *((('DELETE FROM `cache_failed_link` WHERE `service`=? AND `post_id`=? AND `name`=?', key),)
+              if post_link_info.status.flags & DownloadFlags.COMPLETED else ()),
+        )
+        Cache._memory_put((post_info,), existing_only=True)
+
+    @staticmethod
+    async def store_failed_link(post_info: PostInfo, post_link_info: PostLinkInfo, error: str) -> None:
+        await Cache._execute_one((
+            'INSERT INTO `cache_failed_link` (`service`,`post_id`,`name`,`error`,`attempts`,`failed`) VALUES (?,?,?,?,1,?)\n'
+            'ON CONFLICT (`service`,`post_id`,`name`) DO UPDATE SET\n'
+            '`error`=`excluded`.`error`,`attempts`=`attempts`+1,`failed`=`excluded`.`failed`',
+            (post_info.service, post_link_info.post_id, post_link_info.name, error, int(time.time()))))
+
+    @staticmethod
+    async def get_failed_links() -> list[FailedLink]:
+        """Returns failed post links, oldest failures first"""
+        results = await Cache._query(
+            f'SELECT {",".join(f"`{_.name}`" for _ in FAILED_LINK_SCHEMA.columns)} FROM `cache_failed_link` ORDER BY `failed`')
+        return [FailedLink(*_) for _ in results]
+
+    @staticmethod
+    async def clear_failed_links(failed_links: Iterable[FailedLink]) -> None:
+        await Cache._execute_many(('DELETE FROM `cache_failed_link` WHERE `service`=? AND `post_id`=? AND `name`=?',
+                                   [(_.service, _.post_id, _.name) for _ in failed_links]))
+
+    @staticmethod
+    async def get_local_files(sha256: str) -> list[tuple[pathlib.Path, int]]:
+        """Returns paths and sizes of completed downloads with given content hash"""
+        results = await Cache._query(
+            'SELECT DISTINCT `path`,`size` FROM `cache_post_link` WHERE `sha256`=? AND `flags`&?', (sha256, int(DownloadFlags.COMPLETED)))
+        return [(pathlib.Path(_[0]), _[1]) for _ in results]
+
+    @staticmethod
+    async def clear_post_info_cache(post_ids_: Iterable[str], service: APIService | None = None) -> None:
+        post_ids = list(dict.fromkeys(post_ids_))
+        post_ids_set = set(post_ids)
+        for key in [k for k, v in Cache._memory.items() if v.post_id in post_ids_set and v.service == (service or v.service)]:
+            del Cache._memory[key]
+        plcondition, plprefix = Cache._post_keys_condition(service, links=True)
+        await Cache._execute_chunked(f'DELETE FROM `cache_post_link` WHERE {plcondition}', post_ids, plprefix)
+        pcondition, pprefix = Cache._post_keys_condition(service, links=False)
+        await Cache._execute_chunked(f'DELETE FROM `cache_post` WHERE {pcondition}', post_ids, pprefix)
+
+    @staticmethod
+    async def _store_meta(values: dict[str, str]) -> None:
+        await Cache._execute_many(('REPLACE INTO `cache_meta` (`key`,`value`) VALUES (?,?)', list(values.items())))
+
+    @staticmethod
+    async def _evict_posts(condition: str, params: Sequence[str | int]) -> int:
+        """Deletes posts matching condition along with their links. Returns number of posts deleted"""
+        posts_before: int = (await Cache._query('SELECT COUNT(*) FROM `cache_post`'))[0][0]
+        await Cache._execute_one(
+            (f'DELETE FROM `cache_post` WHERE {condition}', params),
+            ('DELETE FROM `cache_post_link` WHERE (`service`,`post_id`) NOT IN (SELECT `service`,`post_id` FROM `cache_post`)', ()),
+            ('DELETE FROM `cache_failed_link` WHERE (`service`,`post_id`) NOT IN (SELECT `service`,`post_id` FROM `cache_post`)', ()),
+        )
+        return posts_before - (await Cache._query('SELECT COUNT(*) FROM `cache_post`'))[0][0]
+
+    @staticmethod
+    async def _evict_run_journals(created_before: int) -> int:
+        """Deletes journals of runs (finished or abandoned) started before given time. Returns number of runs deleted"""
+        runs_before: int = (await Cache._query('SELECT COUNT(*) FROM `run_journal`'))[0][0]
+        await Cache._execute_one(
+            ('DELETE FROM `run_journal` WHERE `created`<?', (created_before,)),
+            ('DELETE FROM `run_journal_post` WHERE `run_id` NOT IN (SELECT `run_id` FROM `run_journal`)', ()),
+            ('DELETE FROM `run_journal_link` WHERE `run_id` NOT IN (SELECT `run_id` FROM `run_journal`)', ()),
+        )
+        return runs_before - (await Cache._query('SELECT COUNT(*) FROM `run_journal`'))[0][0]
+
+    @staticmethod
+    async def get_cache_stats() -> CacheStats:
+        await Cache._flush_memory_accessed()
+        table_sizes: dict[str, int] = {}
+        try:
+            table_sizes.update(await Cache._query('SELECT `name`, SUM(`pgsize`) FROM `dbstat` GROUP BY `name` ORDER BY 2 DESC'))
+        except sqlite3.OperationalError:
+            Log.debug('sqlite3 is built without dbstat, per table sizes are not available')
+        return CacheStats(
+            Cache._db_path(),
+            Cache._db_path().stat().st_size,
+            (await Cache._query('PRAGMA page_size'))[0][0],
+            (await Cache._query('PRAGMA page_count'))[0][0],
+            (await Cache._query('PRAGMA freelist_count'))[0][0],
+            (await Cache._query('PRAGMA auto_vacuum'))[0][0],
+            (await Cache._query('SELECT COUNT(*) FROM `cache_post`'))[0][0],
+            (await Cache._query('SELECT COUNT(*) FROM `cache_post` WHERE `raw` IS NOT NULL'))[0][0],
+            (await Cache._query('SELECT COUNT(*) FROM `cache_post_link`'))[0][0],
+            (await Cache._query('SELECT IFNULL(MIN(`accessed`),0) FROM `cache_post`'))[0][0],
+            table_sizes,
+            dict(await Cache._query('SELECT `key`,`value` FROM `cache_meta`')),
+        )
+
+    @staticmethod
+    async def prune_cache(max_age: int | None, max_size: int | None) -> int:
+        """
+        Evicts posts not accessed for 'max_age' seconds (and run journals older than that),
+        then least recently accessed posts until used size is within 'max_size' bytes. Returns number of posts evicted
+        """
+        evicted = 0
+        await Cache._flush_memory_accessed()
+        Cache._memory.clear()
+        if max_age:
+            evicted += await Cache._evict_posts('`accessed`<?', (int(time.time()) - max_age,))
+            if evicted_runs := await Cache._evict_run_journals(int(time.time()) - max_age):
+                Log.info(f'Evicted {evicted_runs:d} run journals')
+        if max_size:
+            count = 0
+            for _ in range(CACHE_PRUNE_PASSES_MAX):
+                stats = await Cache.get_cache_stats()
+                if stats.used_size <= max_size or not stats.posts:
+                    break
+                # estimate with average post size, repeat until fits since overhead / fragmentation is not accounted for,
+                # evicting at least twice as many as the last time so a few posts sharing a partially filled page can't exhaust passes
+                count = min(stats.posts, max(count * 2, math.ceil((stats.used_size - max_size) / (stats.used_size / stats.posts))))
+                evicted += await Cache._evict_posts(
+                    '(`service`,`post_id`) IN (SELECT `service`,`post_id` FROM `cache_post` ORDER BY `accessed`,`service`,`post_id` LIMIT ?)',
+                    (count,))
+                if Cache._posts_fts:
+                    # deletions only append tombstones to full-text index, merge them away or it keeps growing
+                    await Cache._execute_one(("INSERT INTO `cache_post_fts` (`cache_post_fts`) VALUES ('optimize')", ()))
+        if evicted and (await Cache._query('PRAGMA auto_vacuum'))[0][0] == 2:
+            await Cache._query('PRAGMA incremental_vacuum')
+        return evicted
+
+    @staticmethod
+    async def compact_cache(full: bool) -> None:
+        """Releases free pages with incremental vacuum or rebuilds the DB file (also switching it to incremental vacuum mode)"""
+        if not full and (await Cache._query('PRAGMA auto_vacuum'))[0][0] == 2:
+            await Cache._query('PRAGMA incremental_vacuum')
+        else:
+            await Cache._query('PRAGMA auto_vacuum=INCREMENTAL')
+            await Cache._query('VACUUM')
+            # VACUUM may change rowids of tables without INTEGER PRIMARY KEY, full-text indexes refer to them
+            await Cache._rebuild_fts()
+        await Cache._query('ANALYZE')
+        # move everything from WAL into DB file and truncate WAL so freed space is actually returned
+        await Cache._query('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    @staticmethod
+    async def export_cache(file_path: pathlib.Path, creator_ids: Sequence[str] = (), services: Sequence[str] = ()) -> int:
+        """
+        Writes selected posts (all if no filters) along with their links into a gzipped NDJSON file, one post per line after the header.
+        Returns number of posts exported
+        """
+        conditions = (
+            *((f'`p`.`creator_id` IN ({",".join("?" * len(creator_ids))})',) if creator_ids else ()),
+            *((f'`p`.`service` IN ({",".join("?" * len(services))})',) if services else ()),
+        )
+        condition = ' AND '.join(('1', *conditions))
+        params = (*creator_ids, *services)
+        post_columns = (*POST_COLUMNS, 'raw', 'updated')
+        link_columns = ('service', 'post_id', *LINK_COLUMNS)
+        exported = 0
+        last_key: tuple[str, str] = ('', '')
+        # keyset pagination over primary key
+        pquery = (f'SELECT {",".join(f"`p`.`{_}`" for _ in post_columns)} FROM `cache_post` AS `p` '
+                  f'WHERE {condition} AND (`p`.`service`,`p`.`post_id`)>(?,?) ORDER BY `p`.`service`,`p`.`post_id` '
+                  f'LIMIT {CACHE_QUERY_CHUNK_SIZE:d}')
+        with gzip.open(file_path, 'wt', encoding=UTF8, newline='\n') as outfile_cache:
+            outfile_cache.write(f'{json.dumps({"format": EXPORT_FORMAT, "schema": SCHEMA_VERSION, "app_version": APP_VERSION})}\n')
+            while presults := await Cache._query(pquery, (*params, *last_key)):
+                posts = [dict(zip(post_columns, _, strict=True)) for _ in presults]
+                first_key, last_key = (posts[0]['service'], posts[0]['post_id']), (posts[-1]['service'], posts[-1]['post_id'])
+                plresults = await Cache._query(
+                    f'SELECT {",".join(f"`l`.`{_}`" for _ in link_columns)} FROM `cache_post_link` AS `l` '
+                    f'INNER JOIN `cache_post` AS `p` ON `p`.`service`=`l`.`service` AND `p`.`post_id`=`l`.`post_id` '
+                    f'WHERE {condition} AND (`p`.`service`,`p`.`post_id`)>=(?,?) AND (`p`.`service`,`p`.`post_id`)<=(?,?)',
+                    (*params, *first_key, *last_key))
+                post_links: dict[tuple[str, str], list[dict[str, str | int]]] = defaultdict(list)
+                for plr in plresults:
+                    post_links[(plr[0], plr[1])].append(dict(zip(LINK_COLUMNS, plr[2:], strict=True)))
+                for post in posts:
+                    post['raw'] = base64.b64encode(post['raw']).decode() if post['raw'] else None
+                    record = {'post': post, 'links': post_links.get((post['service'], post['post_id']), [])}
+                    outfile_cache.write(f'{json.dumps(record, ensure_ascii=False, separators=(",", ":"))}\n')
+                exported += len(posts)
+        return exported
+
+    @staticmethod
+    async def import_cache(file_path: pathlib.Path) -> tuple[int, int, int]:
+        """
+        Merges posts from a file created by 'export_cache'. Post with newer update time wins, node-local download flags are never imported.
+        Returns numbers of posts added, updated and skipped (local post is same or newer)
+        """
+        counts = (0, 0, 0)
+        with gzip.open(file_path, 'rt', encoding=UTF8) as infile_cache:
+            header: dict[str, str | int] = json.loads(infile_cache.readline() or '{}')
+            assert header.get('format') == EXPORT_FORMAT, f'\'{file_path.name}\' is not a {APP_NAME} cache export file!'
+            records: list[dict] = []
+            for line in infile_cache:
+                if line.strip():
+                    records.append(json.loads(line))
+                if len(records) >= CACHE_STORE_CHUNK_SIZE:
+                    counts = tuple(a + b for a, b in zip(counts, await Cache._import_chunk(records), strict=True))
+                    records.clear()
+            if records:
+                counts = tuple(a + b for a, b in zip(counts, await Cache._import_chunk(records), strict=True))
+        Cache._memory.clear()
+        return counts
+
+    @staticmethod
+    async def _import_chunk(records: Sequence[dict]) -> tuple[int, int, int]:
+        local_flags = int(NODE_LOCAL_FLAGS)
+        accessed = int(time.time())
+
+        def merge(db: DBConnection) -> tuple[int, int, int]:
+            added = updated = 0
+            for record in records:
+                post: dict[str, str | int | None] = record['post']
+                key = (post['service'], post['post_id'])
+                local = db.execute('SELECT `updated` FROM `cache_post` WHERE `service`=? AND `post_id`=?', key).fetchone()
+                if local and local[0] >= post['updated']:
+                    continue
+                db.execute(
+                    f'INSERT INTO `cache_post` ({",".join(f"`{_}`" for _ in POST_COLUMNS)},`raw`,`accessed`,`updated`)\n'
+                    f'VALUES\n({",".join("?" * (len(POST_COLUMNS) + 3))})\n'
+                    f'ON CONFLICT (`service`,`post_id`) DO UPDATE SET\n'
+                    f'{",".join(f"`{_}`=`excluded`.`{_}`" for _ in POST_COLUMNS if _ != "flags")},'
+                    f'`flags`=`excluded`.`flags`|(`flags`&{local_flags:d}),`raw`=COALESCE(`excluded`.`raw`,`raw`),'
+                    f'`accessed`=`excluded`.`accessed`,`updated`=`excluded`.`updated`',
+                    (*(post[_] for _ in POST_COLUMNS if _ != 'flags'), post['flags'] & ~local_flags,
+                     base64.b64decode(post['raw']) if post.get('raw') else None, accessed, post['updated']))
+                names_new = {_['name'] for _ in record['links']}
+                names_old = {_[0] for _ in db.execute('SELECT `name` FROM `cache_post_link` WHERE `service`=? AND `post_id`=?', key)}
+                db.executemany('DELETE FROM `cache_post_link` WHERE `service`=? AND `post_id`=? AND `name`=?',
+                               [(*key, _) for _ in names_old - names_new])
+                db.executemany(
+                    f'INSERT INTO `cache_post_link` (`service`,`post_id`,{",".join(f"`{_}`" for _ in LINK_COLUMNS)})\n'
+                    f'VALUES\n({",".join("?" * (len(LINK_COLUMNS) + 2))})\n'
+                    f'ON CONFLICT (`service`,`post_id`,`name`) DO UPDATE SET\n'
+                    f'`url`=`excluded`.`url`,`path`=`excluded`.`path`,'
+                    f'`size`=CASE WHEN `excluded`.`size`>0 THEN `excluded`.`size` ELSE `size` END,'
+                    f'`sha256`=CASE WHEN `excluded`.`sha256`!=\'\' THEN `excluded`.`sha256` ELSE `sha256` END,'
+                    f'`flags`=`excluded`.`flags`|CASE WHEN `path`=`excluded`.`path` THEN `flags`&{local_flags:d} ELSE 0 END',
+                    # older export files have no link hashes
+                    [(*key, *(_[c] & ~local_flags if c == 'flags' else _.get(c, '') for c in LINK_COLUMNS)) for _ in record['links']])
+                if local:
+                    updated += 1
+                else:
+                    added += 1
+            return added, updated, len(records) - added - updated
+        return await Cache._with_retries(Cache._write_transaction(merge))
+
+    @staticmethod
+    async def creators_outdated(api_address: APIAddress, max_age: int = CACHE_CREATORS_MAX_AGE) -> bool:
+        """Creators list of given API address was never stored or is older than 'max_age' seconds (0 - never outdated)"""
+        results = await Cache._query('SELECT `value` FROM `cache_meta` WHERE `key`=?', (f'{META_KEY_CREATORS_TIME}:{api_address}',))
+        return not results or (max_age > 0 and int(time.time()) - int(results[0][0]) > max_age)
 
     @staticmethod
-    async def update_post_link_info_cache(post_link_info: PostLinkInfo) -> None:
-        await Cache._execute_one(('UPDATE `cache_post_link` SET `path`=?, `size`=?, `flags`=? WHERE `post_id`=? AND `name`=?',
-                                  (post_link_info.path.as_posix(), post_link_info.status.size, int(post_link_info.status.flags),
-                                   post_link_info.post_id, post_link_info.name)))
+    async def store_creators(api_address: APIAddress, creators: Sequence[Creator]) -> tuple[int, int, int]:
+        """Syncs stored creators list of given API address with 'creators'. Returns numbers of creators added, updated and removed"""
+        def sync(db: DBConnection) -> tuple[int, int, int]:
+            existing = {(_[0], _[1]): _[2:] for _ in db.execute(
+                f'SELECT {",".join(f"`{_}`" for _ in CREATOR_COLUMNS[1:])} FROM `cache_creator` WHERE `api_address`=?', (api_address,))}
+            incoming = {(_['service'], _['id']): (_['name'], _['indexed'], _['updated'], _['favorited']) for _ in creators}
+            changed = [(api_address, *k, *v) for k, v in incoming.items() if existing.get(k) != v]
+            removed = [(api_address, *k) for k in existing.keys() - incoming.keys()]
+            # only entries with new / changed / removed name are reindexed, upsert keeps rowids (which index refers to) intact
+            renamed = [(api_address, *k) for k, v in incoming.items() if k in existing and existing[k][0] != v[0]]
+            added = [(api_address, *k) for k in incoming.keys() - existing.keys()]
+            fts_condition = '`api_address`=? AND `service`=? AND `creator_id`=?'
+            if Cache._creators_fts:
+                db.executemany("INSERT INTO `cache_creator_fts` (`cache_creator_fts`,`rowid`,`name`)\n"
+                               f"SELECT 'delete',`rowid`,`name` FROM `cache_creator` WHERE {fts_condition}", [*renamed, *removed])
+            db.executemany(f'INSERT INTO `cache_creator` ({",".join(f"`{_}`" for _ in CREATOR_COLUMNS)})\n'
+                           f'VALUES\n({",".join("?" * len(CREATOR_COLUMNS))})\n'
+                           'ON CONFLICT (`api_address`,`service`,`creator_id`) DO UPDATE SET\n'
+                           f'{",".join(f"`{_}`=`excluded`.`{_}`" for _ in CREATOR_COLUMNS[3:])}', changed)
+            db.executemany(f'DELETE FROM `cache_creator` WHERE {fts_condition}', removed)
+            if Cache._creators_fts:
+                db.executemany('INSERT INTO `cache_creator_fts` (`rowid`,`name`)\n'
+                               f'SELECT `rowid`,`name` FROM `cache_creator` WHERE {fts_condition}', [*renamed, *added])
+            db.execute('REPLACE INTO `cache_meta` (`key`,`value`) VALUES (?,?)',
+                       (f'{META_KEY_CREATORS_TIME}:{api_address}', str(int(time.time()))))
+            return len(added), len(changed) - len(added), len(removed)
+        return await Cache._with_retries(Cache._write_transaction(sync))
 
     @staticmethod
-    async def clear_post_info_cache(post_ids_: Iterable[str]) -> None:
-        post_ids = ','.join(f'\'{_}\'' for _ in post_ids_)
-        await Cache._execute_one((f'DELETE FROM `cache_post` WHERE `post_id` IN ({post_ids})', ()))
-        await Cache._execute_one((f'DELETE FROM `cache_post_link` WHERE `post_id` IN ({post_ids})', ()))
+    async def find_creators(api_address: APIAddress, pattern: str, mode: CreatorMatchMode = 'substring') -> list[Creator]:
+        """
+        Searches stored creators of given API address by name, case insensitive.
+        Uses trigram full-text index if available and pattern is long enough, falls back to table scan otherwise
+        """
+        pattern = pattern.lower()
+        use_fts = Cache._creators_fts and len(pattern) >= 3
+        columns = ','.join(f'`c`.`{_}`' for _ in CREATOR_COLUMNS)
+        if use_fts:
+            query = (f'SELECT {columns} FROM `cache_creator_fts` AS `f` INNER JOIN `cache_creator` AS `c` ON `c`.`rowid`=`f`.`rowid` '
+                     f'WHERE `f`.`name` MATCH ? AND `c`.`api_address`=?')
+        else:
+            query = f'SELECT {columns} FROM `cache_creator` AS `c` WHERE `c`.`api_address`=?'
+        if mode == 'fuzzy':
+            if use_fts:
+                # candidates sharing any trigram with pattern, best matching first
+                trigrams = dict.fromkeys(pattern[i:i + 3] for i in range(len(pattern) - 2))
+                results = await Cache._query(f'{query} ORDER BY `f`.`rank` LIMIT {CREATOR_FUZZY_CANDIDATES_MAX:d}',
+                                             (' OR '.join(_fts_phrase(_) for _ in trigrams), api_address))
+            else:
+                results = await Cache._query(query, (api_address,))
+            scored = [(ratio, _) for _ in results if (ratio := _fuzzy_ratio(pattern, _[3])) >= CREATOR_FUZZY_RATIO_MIN]
+            results = [_[1] for _ in sorted(scored, key=lambda rr: (-rr[0], rr[1][3].lower()))]
+        else:
+            like = f'{_escape_like(pattern)}%' if mode == 'prefix' else f'%{_escape_like(pattern)}%'
+            results = await Cache._query(f"{query} AND `c`.`name` LIKE ? ESCAPE '\\' ORDER BY `c`.`name` COLLATE NOCASE",
+                                         (*((_fts_phrase(pattern),) if use_fts else ()), api_address, like))
+        return [Creator(id=_[2], name=_[3], service=_[1], indexed=_[4], updated=_[5], favorited=_[6]) for _ in results]
+
+    @staticmethod
+    async def create_run_journal(action: str, args: str, api_address: APIAddress, links: Sequence[PostPageScanResult]) -> int:
+        """Starts journal of a new download run with its input posts. Returns run id"""
+        def create(db: DBConnection) -> int:
+            run_id = db.execute('INSERT INTO `run_journal` (`action`,`args`,`api_address`,`created`) VALUES (?,?,?,?)',
+                                (action, args, api_address, int(time.time()))).lastrowid
+            db.executemany('INSERT OR IGNORE INTO `run_journal_post` (`run_id`,`service`,`post_id`,`seq`,`creator_id`) VALUES (?,?,?,?,?)',
+                           [(run_id, _.service, _.post_id, i, _.creator_id) for i, _ in enumerate(links)])
+            return run_id
+        return await Cache._with_retries(Cache._write_transaction(create))
+
+    @staticmethod
+    async def get_run_journal(run_id: int | None = None) -> RunJournal | None:
+        """Returns journal of given run or of the latest unfinished one"""
+        columns = ','.join(f'`{_}`' for _ in ('run_id', 'action', 'args', 'created', 'finished', 'api_address'))
+        if run_id:
+            results = await Cache._query(f'SELECT {columns} FROM `run_journal` WHERE `run_id`=?', (run_id,))
+        else:
+            results = await Cache._query(f'SELECT {columns} FROM `run_journal` WHERE `finished`=0 ORDER BY `run_id` DESC LIMIT 1')
+        if not results:
+            return None
+        run_id, action, args, created, finished, api_address = results[0]
+        presults = await Cache._query(
+            'SELECT `post_id`,`creator_id`,`service`,`scanned` FROM `run_journal_post` WHERE `run_id`=? ORDER BY `seq`', (run_id,))
+        links = [PostPageScanResult(_[0], _[1], _[2], api_address) for _ in presults]
+        scanned = {link.as_cache_key() for link, pr in zip(links, presults, strict=True) if pr[3]}
+        return RunJournal(run_id, action, args, created, finished, links, scanned)
+
+    @staticmethod
+    async def get_run_journal_progress(run_id: int) -> tuple[set[str], dict[tuple[str, str], DownloadResult]]:
+        """Returns cache keys of posts completely processed by given run and final results of its post links (by post cache key, link name)"""
+        presults = await Cache._query('SELECT `post_id`,`service` FROM `run_journal_post` WHERE `run_id`=? AND `done`', (run_id,))
+        plresults = await Cache._query('SELECT `post_id`,`service`,`name`,`result` FROM `run_journal_link` WHERE `run_id`=?', (run_id,))
+        return {f'{_[0]}:{_[1]}' for _ in presults}, {(f'{_[0]}:{_[1]}', _[2]): DownloadResult(_[3]) for _ in plresults}
+
+    @staticmethod
+    async def journal_posts_scanned(run_id: int, post_infos: Sequence[PostInfo]) -> None:
+        await Cache._execute_many(('UPDATE `run_journal_post` SET `scanned`=1 WHERE `run_id`=? AND `service`=? AND `post_id`=?',
+                                   [(run_id, _.service, _.post_id) for _ in post_infos]))
+
+    @staticmethod
+    async def journal_post_done(run_id: int, post_info: PostInfo) -> None:
+        await Cache._execute_one(('UPDATE `run_journal_post` SET `done`=1 WHERE `run_id`=? AND `service`=? AND `post_id`=?',
+                                  (run_id, post_info.service, post_info.post_id)))
+
+    @staticmethod
+    async def journal_link_results(run_id: int, post_info: PostInfo, post_link_infos: Iterable[PostLinkInfo]) -> None:
+        await Cache._execute_many(('REPLACE INTO `run_journal_link` (`run_id`,`service`,`post_id`,`name`,`result`) VALUES (?,?,?,?,?)',
+                                   [(run_id, post_info.service, post_info.post_id, _.name, int(_.status.result)) for _ in post_link_infos]))
+
+    @staticmethod
+    async def finish_run_journal(run_id: int) -> None:
+        """Marks run as finished. Finished run can't be resumed so its progress is dropped"""
+        await Cache._execute_one(
+            ('UPDATE `run_journal` SET `finished`=? WHERE `run_id`=?', (int(time.time()), run_id)),
+            ('DELETE FROM `run_journal_post` WHERE `run_id`=?', (run_id,)),
+            ('DELETE FROM `run_journal_link` WHERE `run_id`=?', (run_id,)),
+        )
 
 #
 #
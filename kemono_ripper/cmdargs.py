@@ -15,15 +15,32 @@ from .defs import (
     ACTION_APPEND,
     ACTION_STORE_TRUE,
     CONNECT_RETRIES_BASE,
+    CREATOR_MATCH_DEFAULT,
+    CREATOR_MATCH_MODES,
+    DOWNLOAD_ORDER_DEFAULT,
+    DOWNLOAD_ORDERS,
     HELP_ARG_API_ADDRESS,
+    HELP_ARG_CACHE_CREATOR,
+    HELP_ARG_CACHE_EXPORT_FILE,
     HELP_ARG_CACHE_FORCE,
+    HELP_ARG_CACHE_FULL_VACUUM,
+    HELP_ARG_CACHE_IMPORT_FILE,
+    HELP_ARG_CACHE_MAX_AGE,
+    HELP_ARG_CACHE_MAX_SIZE,
+    HELP_ARG_CACHE_MEMORY,
+    HELP_ARG_CACHE_REBUILD,
+    HELP_ARG_CACHE_SERVICES,
     HELP_ARG_CACHE_SKIP,
+    HELP_ARG_CONTENT_STORE,
     HELP_ARG_COOKIE,
     HELP_ARG_CREATOR_ID,
+    HELP_ARG_CREATOR_MATCH,
     HELP_ARG_CREATOR_NAME_PATTERN,
     HELP_ARG_DMMODE,
+    HELP_ARG_DOWNLOAD_ORDER,
     HELP_ARG_FILTER_FILEEXT,
     HELP_ARG_FILTER_FILENAME,
+    HELP_ARG_FILTER_FILESIZE,
     HELP_ARG_FILTER_POST_DATE_RANGE,
     HELP_ARG_FILTER_POST_ID_RANGE,
     HELP_ARG_FILTER_POST_TAGS,
@@ -42,8 +59,11 @@ from .defs import (
     HELP_ARG_POST_URL,
     HELP_ARG_PROXY,
     HELP_ARG_PRUNE,
+    HELP_ARG_RESUME_RUN_ID,
     HELP_ARG_RETRIES,
     HELP_ARG_SAME_CREATOR,
+    HELP_ARG_SEARCH_OFFLINE,
+    HELP_ARG_SEARCH_RIP,
     HELP_ARG_SEARCH_STRING,
     HELP_ARG_SERVICE,
     HELP_ARG_SKIP_COMPLETED,
@@ -59,6 +79,7 @@ from .logger import Log
 from .validators import (
     log_level,
     positive_int,
+    positive_nonzero_int,
     valid_date_range,
     valid_ext,
     valid_file_path,
@@ -66,6 +87,7 @@ from .validators import (
     valid_indent,
     valid_kwarg,
     valid_maxjobs,
+    valid_output_file_path,
     valid_path_format,
     valid_pattern,
     valid_post_url,
@@ -104,11 +126,19 @@ PARSER_TITLE_POST_RIP = 'prip'
 PARSER_TITLE_POST_RIP_ID = 'prip_id'
 PARSER_TITLE_POST_RIP_URL = 'prip_url'
 PARSER_TITLE_POST_RIP_FILE = 'prip_file'
+PARSER_TITLE_POST_RIP_RESUME = 'prip_resume'
+PARSER_TITLE_POST_RIP_FAILED = 'prip_failed'
 PARSER_TITLE_POST_TAGS = 'ptags'
 PARSER_TITLE_POST_TAGS_DUMP = 'ptag_dump'
 PARSER_TITLE_CONFIG = 'config'
 PARSER_TITLE_CONFIG_CREATE = 'cfcreate'
 PARSER_TITLE_CONFIG_MODIFY = 'cfmodify'
+PARSER_TITLE_CACHE = 'cache'
+PARSER_TITLE_CACHE_STATS = 'castats'
+PARSER_TITLE_CACHE_PRUNE = 'caprune'
+PARSER_TITLE_CACHE_COMPACT = 'cacompact'
+PARSER_TITLE_CACHE_EXPORT = 'caexport'
+PARSER_TITLE_CACHE_IMPORT = 'caimport'
 
 PARSER_TITLE_NAMES_REMAP: dict[str, str] = {
     PARSER_TITLE_CREATOR_LIST: 'list',
@@ -124,10 +154,17 @@ PARSER_TITLE_NAMES_REMAP: dict[str, str] = {
     PARSER_TITLE_POST_RIP_ID: 'id',
     PARSER_TITLE_POST_RIP_URL: 'url',
     PARSER_TITLE_POST_RIP_FILE: 'file',
+    PARSER_TITLE_POST_RIP_RESUME: 'resume',
+    PARSER_TITLE_POST_RIP_FAILED: 'failed',
     PARSER_TITLE_POST_TAGS: 'tags',
     PARSER_TITLE_POST_TAGS_DUMP: 'dump',
     PARSER_TITLE_CONFIG_CREATE: 'create',
     PARSER_TITLE_CONFIG_MODIFY: 'modify',
+    PARSER_TITLE_CACHE_STATS: 'stats',
+    PARSER_TITLE_CACHE_PRUNE: 'prune',
+    PARSER_TITLE_CACHE_COMPACT: 'compact',
+    PARSER_TITLE_CACHE_EXPORT: 'export',
+    PARSER_TITLE_CACHE_IMPORT: 'import',
 }
 
 PARSER_PARAM_PARSER_TYPE = 'zzzparser'
@@ -209,6 +246,8 @@ def create_parsers() -> dict[str, ArgumentParser]:
     _ = create_parser(subs_post_rip, PARSER_TITLE_POST_RIP_ID, 'Rip posts by post id')
     _ = create_parser(subs_post_rip, PARSER_TITLE_POST_RIP_URL, 'Rip posts by URL')
     _ = create_parser(subs_post_rip, PARSER_TITLE_POST_RIP_FILE, 'Read posts to rip from a text file')
+    _ = create_parser(subs_post_rip, PARSER_TITLE_POST_RIP_RESUME, 'Continue interrupted rip')
+    _ = create_parser(subs_post_rip, PARSER_TITLE_POST_RIP_FAILED, 'Retry links which failed to download in previous rips')
 
     par_post_tag = create_parser(subs_posts, PARSER_TITLE_POST_TAGS, '')
     subs_post_tag = create_subparser(par_post_tag, 'subcommand_3')
@@ -219,6 +258,14 @@ def create_parsers() -> dict[str, ArgumentParser]:
     _ = create_parser(subs_config, PARSER_TITLE_CONFIG_CREATE, 'Create config file if doesn\'t exist')
     _ = create_parser(subs_config, PARSER_TITLE_CONFIG_MODIFY, 'Change settings in config file')
 
+    par_cache = create_parser(subs_main, PARSER_TITLE_CACHE, '')
+    subs_cache = create_subparser(par_cache, 'subcommand_2')
+    _ = create_parser(subs_cache, PARSER_TITLE_CACHE_STATS, 'Show cache DB size and usage statistics')
+    _ = create_parser(subs_cache, PARSER_TITLE_CACHE_PRUNE, 'Evict old or least recently used posts from cache DB')
+    _ = create_parser(subs_cache, PARSER_TITLE_CACHE_COMPACT, 'Release unused cache DB file space')
+    _ = create_parser(subs_cache, PARSER_TITLE_CACHE_EXPORT, 'Export cached posts to a file')
+    _ = create_parser(subs_cache, PARSER_TITLE_CACHE_IMPORT, 'Merge cached posts from an exported file')
+
     return parsers
 
 
@@ -243,6 +290,8 @@ def add_common_args(par: ArgumentParser) -> None:
     do.add_argument('-o', '--path', default=None, help=HELP_ARG_PATH, type=valid_folder_path)
     do.add_argument('-f', '--path-format', default=None, help=HELP_ARG_PATH_FORMAT, type=valid_path_format)
     do.add_argument('-d', '--download-mode', default=DM_DEFAULT, help=HELP_ARG_DMMODE, choices=DOWNLOAD_MODES)
+    do.add_argument('--download-order', default=DOWNLOAD_ORDER_DEFAULT, help=HELP_ARG_DOWNLOAD_ORDER, choices=DOWNLOAD_ORDERS)
+    do.add_argument('--content-store', metavar='#path', default=None, help=HELP_ARG_CONTENT_STORE, type=valid_folder_path)
     do.add_argument('-j', '--max-jobs', metavar='#number', default=None, help=HELP_ARG_MAXJOBS, type=valid_maxjobs)
     do.add_argument('--skip-completed', default=None, action=ACTION_STORE_TRUE, help=HELP_ARG_SKIP_COMPLETED)
     do.add_argument('--skip-external', default=None, action=ACTION_STORE_TRUE, help=HELP_ARG_SKIP_EXTERNAL)
@@ -259,7 +308,7 @@ def add_filtering_args(par: ArgumentParser, add_search_filters: bool, add_downlo
         fi.add_argument('--imported', metavar='#min..max', default=None, help='', type=valid_date_range)
         fi.add_argument('--published', metavar='#min..max', default=None, help=HELP_ARG_FILTER_POST_DATE_RANGE, type=valid_date_range)
     if add_download_filters:
-        # fi.add_argument('--filter-filesize', metavar='#min-max', default=None, help='', type=valid_range)
+        fi.add_argument('--filter-filesize', metavar='#min-max', default=None, help=HELP_ARG_FILTER_FILESIZE, type=valid_range)
         fi.add_argument('--filter-filename', metavar='#pattern', default=None, help=HELP_ARG_FILTER_FILENAME, type=valid_pattern)
         fi.add_argument('--ext', metavar='#.EXT', action=ACTION_APPEND, help=HELP_ARG_FILTER_FILEEXT, type=valid_ext)
 
@@ -269,6 +318,8 @@ def add_caching_args(par: ArgumentParser) -> None:
     ca_m = ca.add_mutually_exclusive_group(required=False)
     ca_m.add_argument('--skip-cache', default=None, action=ACTION_STORE_TRUE, help=HELP_ARG_CACHE_SKIP)
     ca_m.add_argument('--force-cache', default=None, action=ACTION_STORE_TRUE, help=HELP_ARG_CACHE_FORCE)
+    ca.add_argument('--rebuild-cache', default=None, action=ACTION_STORE_TRUE, help=HELP_ARG_CACHE_REBUILD)
+    ca.add_argument('--memory-cache', metavar='#number', default=None, help=HELP_ARG_CACHE_MEMORY, type=positive_int)
 
 
 def add_logging_args(par: ArgumentParser) -> None:
@@ -296,6 +347,7 @@ def parse_arglist(args: Sequence[str]) -> Namespace:
         f'\n{INDENT}{MODULE} {PARSER_TITLE_CREATOR} ...'
         f'\n{INDENT}{MODULE} {PARSER_TITLE_POST} ...'
         f'\n{INDENT}{MODULE} {PARSER_TITLE_CONFIG} ...'
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_CACHE} ...'
     )
 
     # Config
@@ -333,6 +385,7 @@ def parse_arglist(args: Sequence[str]) -> Namespace:
     )
     pclg1 = pcl.add_argument_group(title='options')
     pclg1.add_argument('pattern', help=HELP_ARG_CREATOR_NAME_PATTERN, type=str)
+    pclg1.add_argument('-m', '--match', default=CREATOR_MATCH_DEFAULT, help=HELP_ARG_CREATOR_MATCH, choices=CREATOR_MATCH_MODES)
     #  dump
     pcd = parsers[PARSER_TITLE_CREATOR_DUMP]
     pcd.usage = (
@@ -371,11 +424,13 @@ def parse_arglist(args: Sequence[str]) -> Namespace:
     ppse = parsers[PARSER_TITLE_POST_SEARCH]
     ppse.usage = (
         f'\n{INDENT}{MODULE} {PARSER_TITLE_POST} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_POST_SEARCH]}'
-        f' #[options...] #string #[tag [tag ...]]'
+        f' #[options...] [--offline] [--rip] #string #[tag [tag ...]]'
     )
     ppseg1 = ppse.add_argument_group(title='options')
     ppseg1.add_argument('search_string', metavar='string', help=HELP_ARG_SEARCH_STRING)
     ppseg1.add_argument('search_tags', metavar='tag [tag ...]', nargs=ZERO_OR_MORE, help=HELP_ARG_POST_TAG)
+    ppseg1.add_argument('--offline', action=ACTION_STORE_TRUE, help=HELP_ARG_SEARCH_OFFLINE)
+    ppseg1.add_argument('--rip', action=ACTION_STORE_TRUE, help=HELP_ARG_SEARCH_RIP)
     #  scan
     pps = parsers[PARSER_TITLE_POST_SCAN]
     pps.usage = (
@@ -425,6 +480,10 @@ def parse_arglist(args: Sequence[str]) -> Namespace:
         f' {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_POST_RIP_URL]} ...'
         f'\n{INDENT}{MODULE} {PARSER_TITLE_POST} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_POST_RIP]}'
         f' {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_POST_RIP_FILE]} ...'
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_POST} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_POST_RIP]}'
+        f' {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_POST_RIP_RESUME]} ...'
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_POST} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_POST_RIP]}'
+        f' {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_POST_RIP_FAILED]} ...'
     )
     #   rip ids
     ppri = parsers[PARSER_TITLE_POST_RIP_ID]
@@ -454,6 +513,22 @@ def parse_arglist(args: Sequence[str]) -> Namespace:
     )
     pprfg1 = pprf.add_argument_group(title='options')
     pprfg1.add_argument('file', help=HELP_ARG_POST_FILE, type=valid_file_path)
+    #   rip resume
+    pprr = parsers[PARSER_TITLE_POST_RIP_RESUME]
+    pprr.usage = (
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_POST} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_POST_RIP]}'
+        f' {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_POST_RIP_RESUME]}'
+        f' #[options...] [#run_id]'
+    )
+    pprrg1 = pprr.add_argument_group(title='options')
+    pprrg1.add_argument('run_id', nargs=OPTIONAL, default=None, help=HELP_ARG_RESUME_RUN_ID, type=positive_nonzero_int)
+    #   rip failed
+    pprfa = parsers[PARSER_TITLE_POST_RIP_FAILED]
+    pprfa.usage = (
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_POST} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_POST_RIP]}'
+        f' {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_POST_RIP_FAILED]}'
+        f' #[options...]'
+    )
     #  tag
     ppt = parsers[PARSER_TITLE_POST_TAGS]
     ppt.usage = (
@@ -469,11 +544,62 @@ def parse_arglist(args: Sequence[str]) -> Namespace:
     pptdg1 = pptd.add_argument_group(title='options')
     pptdg1.add_argument('--prune', action=ACTION_STORE_TRUE, help=HELP_ARG_PRUNE)
 
+    # Cache
+    pca = parsers[PARSER_TITLE_CACHE]
+    pca.usage = (
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_CACHE} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_CACHE_STATS]}'
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_CACHE} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_CACHE_PRUNE]} ...'
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_CACHE} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_CACHE_COMPACT]} ...'
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_CACHE} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_CACHE_EXPORT]} ...'
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_CACHE} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_CACHE_IMPORT]} ...'
+    )
+    #  stats
+    pcas = parsers[PARSER_TITLE_CACHE_STATS]
+    pcas.usage = (
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_CACHE} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_CACHE_STATS]}'
+        f' #[options...]'
+    )
+    #  prune
+    pcap = parsers[PARSER_TITLE_CACHE_PRUNE]
+    pcap.usage = (
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_CACHE} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_CACHE_PRUNE]}'
+        f' #[options...] [--max-age #days] [--max-size #MiB]'
+    )
+    pcapg1 = pcap.add_argument_group(title='options')
+    pcapg1.add_argument('--max-age', metavar='#days', default=None, help=HELP_ARG_CACHE_MAX_AGE, type=positive_nonzero_int)
+    pcapg1.add_argument('--max-size', metavar='#MiB', default=None, help=HELP_ARG_CACHE_MAX_SIZE, type=positive_nonzero_int)
+    #  compact
+    pcac = parsers[PARSER_TITLE_CACHE_COMPACT]
+    pcac.usage = (
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_CACHE} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_CACHE_COMPACT]}'
+        f' #[options...]'
+    )
+    pcacg1 = pcac.add_argument_group(title='options')
+    pcacg1.add_argument('--full-vacuum', action=ACTION_STORE_TRUE, help=HELP_ARG_CACHE_FULL_VACUUM)
+    #  export
+    pcae = parsers[PARSER_TITLE_CACHE_EXPORT]
+    pcae.usage = (
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_CACHE} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_CACHE_EXPORT]}'
+        f' #[options...] [--creator #creator_id ...] [--services #service ...] #file'
+    )
+    pcaeg1 = pcae.add_argument_group(title='options')
+    pcaeg1.add_argument('cache_file', metavar='file', help=HELP_ARG_CACHE_EXPORT_FILE, type=valid_output_file_path)
+    pcaeg1.add_argument('--creator', metavar='#creator_id', action=ACTION_APPEND, help=HELP_ARG_CACHE_CREATOR)
+    pcaeg1.add_argument('--services', metavar='#service', action=ACTION_APPEND, help=HELP_ARG_CACHE_SERVICES, choices=APIService.__args__)
+    #  import
+    pcai = parsers[PARSER_TITLE_CACHE_IMPORT]
+    pcai.usage = (
+        f'\n{INDENT}{MODULE} {PARSER_TITLE_CACHE} {PARSER_TITLE_NAMES_REMAP[PARSER_TITLE_CACHE_IMPORT]}'
+        f' #[options...] #file'
+    )
+    pcaig1 = pcai.add_argument_group(title='options')
+    pcaig1.add_argument('cache_file', metavar='file', help=HELP_ARG_CACHE_IMPORT_FILE, type=valid_file_path)
+
     [add_file_parsing_args(_) for _ in (ppsf, pprf)]
-    [add_json_args(_) for _ in (pcl, pcd, pcr, ppl, ppse, pps, ppsi, ppsu, ppsf, ppri, ppru, pprf, pptd, pcfc, pcfm)]
-    [add_caching_args(_) for _ in (pcl, pcr, ppl, ppse, pps, ppsi, ppsu, ppsf, ppri, ppru, pprf)]
-    [add_common_args(_) for _ in (parser_root, pcl, pcd, pcr, ppl, ppse, pps, ppsi, ppsu, ppsf, ppri, ppru, pprf, pptd, pcfc, pcfm)]
-    [add_filtering_args(_, True, _ not in (ppl, ppse)) for _ in (pcr, ppl, ppse, ppri, ppru, pprf)]
+    [add_json_args(_) for _ in (pcl, pcd, pcr, ppl, ppse, pps, ppsi, ppsu, ppsf, ppri, ppru, pprf, pprr, pprfa, pptd, pcfc, pcfm)]
+    [add_caching_args(_) for _ in (pcl, pcr, ppl, ppse, pps, ppsi, ppsu, ppsf, ppri, ppru, pprf, pprr, pprfa)]
+    [add_common_args(_) for _ in (parser_root, pcl, pcd, pcr, ppl, ppse, pps, ppsi, ppsu, ppsf, ppri, ppru, pprf, pprr, pprfa, pptd, pcfc, pcfm)]
+    [add_filtering_args(_, True, _ != ppl) for _ in (pcr, ppl, ppse, ppri, ppru, pprf, pprr, pprfa)]
     [add_logging_args(_) for _ in parsers.values()]
     [add_help(_, _ == parser_root) for _ in parsers.values()]
     return execute_parser(parser_root, args)
@@ -496,6 +622,7 @@ def prepare_arglist(args: Sequence[str]) -> None:
     }
 
     parsed = parse_arglist(args)
+    Config.arglist = list(args)
     config_create = ' '.join(getattr(parsed, _, '') for _ in ('subcommand_1', 'subcommand_2')) == 'config create'
     for pp in vars(parsed):
         param = Config.NAMESPACE_VARS_REMAP.get(pp, pp)
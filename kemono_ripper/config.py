@@ -19,7 +19,9 @@ from .defs import (
     CONFIG_NAME_DEFAULT,
     CONNECT_TIMEOUT_SOCKET_READ,
     NUM_EXTERNAL_SITES,
+    CreatorMatchMode,
     DateRange,
+    DownloadOrder,
     NumRange,
     SupportedExternalWebsites,
 )
@@ -81,6 +83,15 @@ class BaseConfig:
         'imported': 'filter_post_imported',
         'published': 'filter_post_published',
         'ext': 'filter_extensions',
+        'max_age': 'cache_max_age',
+        'max_size': 'cache_max_size',
+        'full_vacuum': 'cache_full_vacuum',
+        'creator': 'cache_creator_ids',
+        'services': 'cache_services',
+        'match': 'creator_match',
+        'offline': 'search_offline',
+        'rip': 'search_rip',
+        'run_id': 'resume_run_id',
     }
 
     def __init__(self) -> None:
@@ -91,20 +102,44 @@ class BaseConfig:
         self.service: APIService | None = None
         self.search_string: str | None = None
         self.search_tags: list[str] | None = None
+        self.search_offline: bool | None = None
+        '''post search: search local cache'''
+        self.search_rip: bool | None = None
+        '''post search: download found posts'''
         self.post_ids: list[str] | None = None
         '''post scan id, post rip id'''
         self.creator_id: str | None = None
         '''post scan id, post rip id'''
+        self.resume_run_id: int | None = None
+        '''post rip resume'''
         self.same_creator: bool | None = None
         '''same creator for all posts being scanned see `post list`'''
         self.links: list[PostPageScanResult] | None = None
         '''post scan link, post rip link'''
         self.pattern: str | None = None
         '''creator list pattern'''
+        self.creator_match: CreatorMatchMode | None = None
+        '''creator list pattern matching mode'''
         self.skip_cache: bool | None = None
         '''json caches'''
         self.force_cache: bool | None = None
         '''json caches'''
+        self.rebuild_cache: bool | None = None
+        '''rebuild cached post infos from stored scanned posts'''
+        self.memory_cache: int | None = None
+        '''in-memory cache tier capacity (posts)'''
+        self.cache_max_age: int | None = None
+        '''cache prune: days since last access'''
+        self.cache_max_size: int | None = None
+        '''cache prune: MiB'''
+        self.cache_full_vacuum: bool | None = None
+        '''cache compact'''
+        self.cache_file: pathlib.Path | None = None
+        '''cache export, cache import'''
+        self.cache_creator_ids: list[str] | None = None
+        '''cache export'''
+        self.cache_services: list[APIService] | None = None
+        '''cache export'''
         self.indent: int | None = None
         '''indentation for saved json files'''
         self.prune: bool | None = None
@@ -127,6 +162,9 @@ class BaseConfig:
         self.dest_base: pathlib.Path | None = None
         self.proxy: str | None = None
         self.download_mode: str | None = None
+        self.download_order: DownloadOrder | None = None
+        self.content_store: pathlib.Path | None = None
+        '''downloaded files storage, post folders get hardlinks to files in it'''
         self.logging_flags: int | None = None
         self.disable_log_colors: bool | None = None
         self.skip_external: bool | None = None
@@ -139,6 +177,8 @@ class BaseConfig:
         self.nodelay: bool = False
         self.noconfirm: bool = True
         self.probe_unknown_links: bool = True
+        self.arglist: list[str] = []
+        '''parsed command-line args (may not be sys.argv if launched through main_sync)'''
 
     def _reset(self) -> None:
         self.__init__()  # noqa: PLC2801
@@ -10,7 +10,7 @@ import datetime
 import json
 import pathlib
 from enum import Enum, IntEnum
-from typing import Any, NamedTuple
+from typing import Any, Literal, NamedTuple
 
 from .version import APP_NAME
 
@@ -29,6 +29,24 @@ CREATORS_NAME_DEFAULT = 'creators.json'
 POST_TAGS_NAME_DEFAULT = 'post_tags.json'
 CONFIG_NAME_DEFAULT = 'settings.json'
 CACHE_DB_NAME_DEFAULT = f'{APP_NAME}.db'
+CACHE_QUERY_CHUNK_SIZE = 500
+CACHE_ACCESSED_BATCH_SIZE = 500
+CACHE_RAW_COMPRESSION_LEVEL = 6
+CACHE_PRUNE_PASSES_MAX = 8
+CACHE_STORE_CHUNK_SIZE = 200
+CACHE_CREATORS_MAX_AGE = 86400
+CREATOR_FUZZY_CANDIDATES_MAX = 200
+CREATOR_FUZZY_RATIO_MIN = 0.6
+CreatorMatchMode = Literal['substring', 'prefix', 'fuzzy']
+CREATOR_MATCH_MODES: tuple[CreatorMatchMode, ...] = CreatorMatchMode.__args__
+CREATOR_MATCH_DEFAULT = CREATOR_MATCH_MODES[0]
+DownloadOrder = Literal['input', 'shortest', 'largest', 'host']
+DOWNLOAD_ORDERS: tuple[DownloadOrder, ...] = DownloadOrder.__args__
+DOWNLOAD_ORDER_DEFAULT = DOWNLOAD_ORDERS[0]
+CACHE_BUSY_TIMEOUT = 0.5
+CACHE_LOCK_RETRIES = 20
+CACHE_LOCK_BACKOFF_BASE = 0.05
+CACHE_LOCK_BACKOFF_MAX = 2.0
 POST_TAGS_PER_POST_INFO_NAME_DEFAULT = '!info.json'
 POST_DONE_FILE_NAME_DEFAULT = 'done'
 FILE_NAME_FULL_MAX_LEN = 220
@@ -125,8 +143,26 @@ HELP_ARG_RETRIES = f'Connection retries count. Default is \'{CONNECT_RETRIES_BAS
 HELP_ARG_API_ADDRESS = 'Target API address'
 HELP_ARG_SERVICE = 'Target service'
 HELP_ARG_CREATOR_NAME_PATTERN = 'Any name part. Case insensitive'
+HELP_ARG_CREATOR_MATCH = (
+    'Name matching mode: \'substring\' - any name part, \'prefix\' - name start, \'fuzzy\' - similar names (typos).'
+    ' Default is \'substring\''
+)
 HELP_ARG_CACHE_SKIP = 'Always query API even if local cache was hit and is in sync with the remote source'
 HELP_ARG_CACHE_FORCE = 'Never query API to prove local cache coherence'
+HELP_ARG_CACHE_REBUILD = (
+    'Rebuild cached posts from locally stored API responses, applying current path format and link parsing rules without re-scanning'
+)
+HELP_ARG_CACHE_MEMORY = 'Keep up to given number of recently used posts in memory in front of the cache DB. Default is \'0\' (disabled)'
+HELP_ARG_CACHE_MAX_AGE = 'Evict cached posts not accessed for the given number of days'
+HELP_ARG_CACHE_MAX_SIZE = 'Evict least recently accessed cached posts until cache data fits into the given size (in MiB)'
+HELP_ARG_CACHE_FULL_VACUUM = 'Always rebuild the whole cache DB file instead of only releasing free pages'
+HELP_ARG_CACHE_EXPORT_FILE = 'Target file path. Posts are saved as gzipped NDJSON'
+HELP_ARG_CACHE_IMPORT_FILE = (
+    'Cache export file path. Posts newer than local ones are merged in, local download state is kept.'
+    ' Saved paths are not changed, use \'--rebuild-cache\' to apply local path settings'
+)
+HELP_ARG_CACHE_CREATOR = 'Only export posts of given creator. Can be used multiple times'
+HELP_ARG_CACHE_SERVICES = 'Only export posts of given service. Can be used multiple times'
 HELP_ARG_INDENT = f'Saved JSON file indentation. Default is \'{JSON_INDENT_DEFAULT:d}\''
 HELP_ARG_PRUNE = 'Prune all extra info from a saved JSON'
 HELP_ARG_POST_ID = 'Post id as seen in web page address (integer)'
@@ -134,17 +170,39 @@ HELP_ARG_CREATOR_ID = 'Creator id as seen in web page address (integer)'
 HELP_ARG_SAME_CREATOR = 'If all post have same creator this flag will speedup scanning process x2, (otherwise you\'ll get wrong results!)'
 HELP_ARG_POST_URL = 'Full url to post page'
 HELP_ARG_POST_FILE = 'Full path to target text file'
+HELP_ARG_RESUME_RUN_ID = (
+    'Id of interrupted download run to continue (default is the latest unfinished one). Input posts and posts already scanned'
+    ' are taken from run journal, finished links are not processed again'
+)
 HELP_ARG_POST_FILE_LINES = 'Range of lines to read from the target file. Example: \'1-15\''
 HELP_ARG_POST_TAG = 'Post tags. List of popular tags can be fetched using \'post tags dump\' command'
 HELP_ARG_SEARCH_STRING = 'Search query string'
+HELP_ARG_SEARCH_OFFLINE = (
+    'Search locally cached posts instead of querying API. All words must be present in post title, content or tags,'
+    ' \'word*\' matches any word starting with \'word\''
+)
+HELP_ARG_SEARCH_RIP = 'Download everything from found posts instead of listing them'
 HELP_ARG_FILTER_POST_ID_RANGE = 'Post id range. Example: \'120000000-150000000\'. Not all post ids are numeric!'
 HELP_ARG_FILTER_POST_TAGS = 'Post tags pattern to exclude. Can be used multiple times. Example: \'--notag hmv\''
 HELP_ARG_FILTER_POST_DATE_RANGE = 'Post date range in format YYYY-MM-DD. Example 1: \'1970-01-01..2040-01-01\'. Example 2: \'2025-12-01..\''
 HELP_ARG_FILTER_USER_ID = 'User id pattern. Most user ids are numeric but any pattern is allowed. Example: \'--nouser 27361892\''
 HELP_ARG_FILTER_FILEEXT = 'Only download files with given extensions. Can be used multiple times. Example: \'--ext .mp4 --ext .png\''
 HELP_ARG_FILTER_FILENAME = 'Only download files mathing given name pattern'
+HELP_ARG_FILTER_FILESIZE = (
+    'Only download files of size in given range, in Megabytes. Example: \'--filter-filesize 0.5-200\'.'
+    ' Sizes are probed before downloading'
+)
 HELP_ARG_SKIP_EXTERNAL = 'Skip all external links'
 HELP_ARG_SKIP_COMPLETED = 'Skip all completed (previously downloaded) links'
+HELP_ARG_CONTENT_STORE = (
+    'Content-addressed store folder for downloaded files. Every file from kemono data servers is downloaded into it once'
+    ' (by its SHA-256 hash) and hardlinked (copied if hardlinks are not supported) into every post folder needing it'
+)
+HELP_ARG_DOWNLOAD_ORDER = (
+    'Links download order: \'input\' - as listed, \'shortest\' - smallest files first (fast visible progress),'
+    ' \'largest\' - biggest files first (long transfers finish early), \'host\' - round-robin by file server.'
+    ' Files of unknown size go last. Default is \'input\''
+)
 
 
 class NumRange(NamedTuple):
@@ -16,12 +16,11 @@ from asyncio import create_task, gather, sleep
 from collections.abc import Callable
 from typing import Literal
 
-from aiofile import async_open
 from aiohttp import ClientConnectorError, ClientPayloadError, ClientResponse, ClientSession, ClientTimeout, TCPConnector
 from aiohttp_socks import ProxyConnector
 from yarl import URL
 
-from .api import DownloadMode, Mem, RequestQueue, URLProbeResult
+from .api import FILE_WRITE_BUFFER_CHUNKS, AdaptiveChunkSize, DownloadMode, FileWriter, Mem, RequestQueue, URLProbeResult
 from .config import ExternalURLHandlerConfig
 from .defs import SupportedExternalWebsites
 from .logger import Log
@@ -152,10 +151,14 @@ class DirectLinkDownloader:
                     total_str = f' / {(file_size + content_len) / Mem.MB:.2f}' if file_size and self.is_range_supported(url) else ''
                     Log.info(f'[DirectDownload] Saving{start_str} {url.name}'
                              f' {content_len / Mem.MB:.2f}{total_str} Mb to {local_path}')
-                    async with async_open(output_path, 'ab' if self.is_range_supported(url) else 'wb') as output_file:
+                    range_supported = self.is_range_supported(url)
+                    expected_size = file_size + content_len if range_supported else content_len
+                    async with FileWriter(output_path, 'ab' if range_supported else 'wb', expected_size) as output_file:
                         if content_len > 16 * Mem.KB:
                             try_num = 0  # reset try count if we can still download
-                        async for chunk in r.content.iter_chunked(128 * Mem.KB):
+                        chunk_size = AdaptiveChunkSize()
+                        async for chunk in chunk_size.iter_chunked(r.content):
+                            output_file.buffer_size = chunk_size.size * FILE_WRITE_BUFFER_CHUNKS
                             await output_file.write(chunk)
                             bytes_written += len(chunk)
                 return output_path
@@ -10,18 +10,23 @@ from __future__ import annotations
 
 import json
 import pathlib
+import random
+import sys
 from asyncio import Lock as AsyncLock
 from asyncio import Semaphore
-from asyncio.queues import Queue as AsyncQueue
-from asyncio.tasks import as_completed, gather, sleep
-from collections import defaultdict, deque
+from asyncio.events import get_running_loop
+from asyncio.queues import PriorityQueue as AsyncPriorityQueue
+from asyncio.tasks import gather
+from asyncio.threads import to_thread
+from collections import defaultdict
 from collections.abc import Callable, Iterable, Sequence
-from typing import Final, Protocol
+from typing import Final, NamedTuple, Protocol
 
 from yarl import URL
 
-from .analyzer import is_link_extension_supported, is_link_native, is_link_supported
+from .analyzer import is_link_extension_supported, is_link_native, is_link_supported, link_content_key
 from .api import (
+    CONNECT_RETRY_DELAY,
     DownloadFlags,
     DownloadMode,
     DownloadResult,
@@ -32,10 +37,13 @@ from .api import (
     PostLinkInfo,
     State,
     URLProbeResult,
+    link_file,
 )
+from .api.filters import any_filter_matching
 from .cache import Cache
 from .config import Config, ExternalURLHandlerConfig
 from .defs import (
+    DOWNLOAD_ORDER_DEFAULT,
     POST_DONE_FILE_NAME_DEFAULT,
     POST_TAGS_PER_POST_INFO_NAME_DEFAULT,
     UTF8,
@@ -43,7 +51,7 @@ from .defs import (
     SupportedExternalWebsites,
 )
 from .download_direct import DirectLinkDownloader
-from .filters import any_filter_matching_post_link, make_post_link_filters
+from .filters import any_filter_matching_post_link, make_file_filters, make_post_link_filters
 from .logger import Log
 
 try:
@@ -190,15 +198,38 @@ EXTERNAL_URL_HANDLERS: dict[str, ExternalURLHandler] = {}
 # end external downloaders
 
 
+class DownloadWorkItem(NamedTuple):
+    order: int
+    seq: int  # unique, keeps order stable and posts / links are never compared
+    post: PostInfo | None  # None is a worker shutdown sentinel
+    plink: PostLinkInfo | None  # None for posts without links
+
+
+DOWNLOAD_WORK_ORDER_LAST: Final[int] = sys.maxsize
+DOWNLOAD_RESULTS_UNFINISHED: Final[tuple[DownloadResult, ...]] = (DownloadResult.FAIL_RETRIES, DownloadResult.SUCCESS_PARTIAL)
+'''link results worth another attempt, not recorded to run journal'''
+
+
 class KemonoDownloader:
-    def __init__(self, kemono: Kemono, post_infos: Sequence[PostInfo]) -> None:
+    def __init__(self, kemono: Kemono, post_infos: Sequence[PostInfo], run_id=0) -> None:
         self._kemono: Final[Kemono] = kemono
+        self._run_id: Final[int] = run_id
         self._post_info: Final[dict[str, PostInfo]] = {}
         self._post_link_filters = make_post_link_filters()
-
-        self._queue_produce: deque[PostInfo] = deque()
-        self._queue_consume: AsyncQueue[PostInfo] = AsyncQueue(Config.max_jobs)
-        self._post_link_download_semaphore: Semaphore = Semaphore(Config.max_jobs)
+        self._file_filters = make_file_filters()
+
+        # links of all posts, once all posts are done one sentinel per worker. Every worker takes the next link as soon as it is free
+        # so a single huge file only occupies one slot while links of other posts keep downloading
+        self._queue_consume: AsyncPriorityQueue[DownloadWorkItem] = AsyncPriorityQueue()
+        self._queued_count = 0
+        self._retries_pending = 0
+        self._workers_count = 0
+        self._post_links_left: dict[PostInfo, int] = {}
+        self._content_owners: dict[str, PostLinkInfo] = {}
+        self._content_waiting: dict[str, list[DownloadWorkItem]] = defaultdict(list[DownloadWorkItem])
+        # run journal progress (resumed run): posts processed completely and final link results, by post cache key (+ link name)
+        self._journal_posts: set[str] = set()
+        self._journal_links: dict[tuple[str, str], DownloadResult] = {}
 
         self._downloaded_count: dict[str, int] = defaultdict(int)
         self._already_exist_count: dict[str, int] = defaultdict(int)
@@ -212,13 +243,13 @@ class KemonoDownloader:
         self._writes_active: dict[PostInfo, list[PostLinkInfo]] = defaultdict(list[PostLinkInfo])
         self._failed_items: dict[PostInfo, list[PostLinkInfo]] = defaultdict(list[PostLinkInfo])
 
-        self._sequence_lock: Final[AsyncLock] = AsyncLock()
         self._active_downloads_lock: Final[AsyncLock] = AsyncLock()
         self._active_writes_lock: Final[AsyncLock] = AsyncLock()
 
         self._orig_count: Final[int] = self._prepare_post_download_info(post_infos)
+        self._posts_complete: Final[set[PostInfo]] = self._find_complete_posts()
 
-        self._queue_produce.extend(post for _, post in self._post_info.items())
+        self._fill_queue()
 
         register_external_downloader(SupportedExternalWebsites.Catbox, DirectLinkHandler())
         register_external_downloader(SupportedExternalWebsites.WebmShare, DirectLinkHandler())
@@ -239,12 +270,24 @@ class KemonoDownloader:
             self._downloads_active[post].append(plink)
         Log.trace(f'[queue] [{post.creator_id}:{post.post_id}] \'{plink.name}\' added to active')
 
-    async def _at_post_link_finish(self, post: PostInfo, plink: PostLinkInfo, result: DownloadResult) -> None:
+    async def _at_post_link_defer(self, post: PostInfo, plink: PostLinkInfo) -> None:
+        plink.status.state = State.QUEUED
+        async with self._active_downloads_lock:
+            if plink in self._downloads_active[post]:
+                self._downloads_active[post].remove(plink)
+        Log.trace(f'[queue] [{post.creator_id}:{post.post_id}] \'{plink.name}\' deferred, removed from active')
+
+    async def _at_post_link_finish(self, post: PostInfo, plink: PostLinkInfo, result: DownloadResult, error='') -> None:
+        """'error' - failure reason (error code name or external handler name) if download failed"""
         plink.status.result = result
         plink.status.state = State.FAILED if ((1 << plink.status.result) & DownloadResult.RESULT_MASK_CRITICAL) else State.DONE
         if plink.status.result in (DownloadResult.SUCCESS, DownloadResult.FAIL_ALREADY_EXISTS):
             plink.status.flags |= DownloadFlags.COMPLETED
-            await Cache.update_post_link_info_cache(plink)
+            await Cache.update_post_link_info_cache(post, plink)
+        elif plink.status.result == DownloadResult.FAIL_RETRIES:
+            await Cache.store_failed_link(post, plink, error)
+        if self._run_id and plink.status.result not in DOWNLOAD_RESULTS_UNFINISHED:
+            await Cache.journal_link_results(self._run_id, post, (plink,))
         async with self._active_downloads_lock:
             if plink in self._downloads_active[post]:
                 self._downloads_active[post].remove(plink)
@@ -268,7 +311,7 @@ class KemonoDownloader:
 
     async def _at_post_start(self, post: PostInfo) -> None:
         async with self._active_downloads_lock:
-            self._downloads_active[post] = []
+            self._downloads_active.setdefault(post, [])
         Log.info(f'Processing post [{post.creator_id}:{post.post_id}] \'{post.title}\'...')
 
     async def _at_post_finish(self, post: PostInfo) -> None:
@@ -302,9 +345,11 @@ class KemonoDownloader:
             self._downloads_active.pop(post)
             post.dest.mkdir(parents=True, exist_ok=True)
             post.dest.joinpath(POST_DONE_FILE_NAME_DEFAULT).touch(exist_ok=True)
+            if self._run_id:
+                await Cache.journal_post_done(self._run_id, post)
 
             Log.trace(f'[queue] post {post.post_id} \'{post.title}\' removed from active')
-            if (num_left := len(self._downloads_active)) < Config.max_jobs - 1 and len(self._queue_produce) == 0:
+            if (num_left := len(self._downloads_active)) < Config.max_jobs - 1 and not self.can_fetch_next():
                 msgs = (
                     f'{num_left:d} posts in queue:',
                     *(f'[{_.creator_id}:{_.post_id}] \'{_.title}\'' for _ in self._downloads_active),
@@ -312,22 +357,98 @@ class KemonoDownloader:
                 for msg in msgs:
                     Log.debug(msg)
 
-    async def _download_post(self, post: PostInfo) -> None:
-        async def download_post_link_wrapper(plink: PostLinkInfo) -> None:
-            async with self._post_link_download_semaphore:
-                return await self._download_post_link(post, plink)
-
+    async def _start_post(self, post: PostInfo) -> None:
         post.status.state = State.DOWNLOADING
+        await self._at_post_start(post)
         Log.trace(f'[{post.creator_id}:{post.post_id}] Saving info to {post.local_path}/{POST_TAGS_PER_POST_INFO_NAME_DEFAULT}')
         post.dest.mkdir(parents=True, exist_ok=True)
         with open(post.dest / POST_TAGS_PER_POST_INFO_NAME_DEFAULT, 'wt', encoding=UTF8, newline='\n', errors='replace') as outfile_tags:
             json.dump(post, outfile_tags, ensure_ascii=False, indent=Config.indent, cls=PathURLJSONEncoder)
             outfile_tags.write('\n')
-        tasks = [download_post_link_wrapper(_) for _ in post.links]
-        _ = await gather(*tasks)
-        post.status.state = State.DONE
 
-    async def _download_post_link(self, post: PostInfo, plink: PostLinkInfo) -> None:
+    async def _finish_post_link(self, post: PostInfo) -> None:
+        self._post_links_left[post] -= 1
+        if self._post_links_left[post] <= 0:
+            self._post_links_left.pop(post)
+            post.status.state = State.DONE
+            await self._at_post_finish(post)
+            if not self._post_links_left:
+                self._stop_workers()
+
+    def _retry_later(self, item: DownloadWorkItem) -> None:
+        # worker slot is released for the backoff period, item re-enters the queue when the timer fires
+        def requeue() -> None:
+            self._retries_pending -= 1
+            self._queue_consume.put_nowait(item)
+            self._queued_count += 1
+
+        self._retries_pending += 1
+        get_running_loop().call_later(random.uniform(*CONNECT_RETRY_DELAY), requeue)
+
+    def _wait_for_same_content(self, item: DownloadWorkItem) -> bool:
+        """
+        Links to the same file (other post, mirror, '?f=' name) are downloaded once per run: the first one picked becomes the owner,
+        the rest are parked until it's done and then reuse its file. Returns True if item was parked
+        """
+        if not is_link_supported(item.plink.url):
+            return False
+        content_key = link_content_key(item.plink.url)
+        owner = self._content_owners.setdefault(content_key, item.plink)
+        if owner is item.plink:
+            return False
+        if owner.status.state in (State.DONE, State.FAILED):
+            if owner.status.result not in (DownloadResult.SUCCESS, DownloadResult.FAIL_ALREADY_EXISTS):
+                self._content_owners[content_key] = item.plink  # owner's download failed, this link tries on its own
+            return False
+        Log.trace(f'[queue] [{item.post.creator_id}:{item.post.post_id}] \'{item.plink.name}\' waits for the same file'
+                  f' \'{owner.name}\' of post {owner.post_id}')
+        self._content_waiting[content_key].append(item)
+        return True
+
+    def _release_same_content(self, plink: PostLinkInfo) -> None:
+        for item in self._content_waiting.pop(link_content_key(plink.url), []):
+            self._queue_consume.put_nowait(item)
+            self._queued_count += 1
+
+    def _stop_workers(self) -> None:
+        for i in range(self._workers_count):
+            self._queue_consume.put_nowait(DownloadWorkItem(DOWNLOAD_WORK_ORDER_LAST, i, None, None))
+
+    async def _download_post_link_local(self, post: PostInfo, plink: PostLinkInfo) -> DownloadResult | None:
+        """
+        Satisfies link with already downloaded file of same content (this run: other post or mirror, earlier: renamed, other post)
+        if there is one, no network I/O
+        """
+        if Config.download_mode != DownloadMode.FULL or any_filter_matching(post, plink, self._file_filters):
+            return None
+        plink_id = f'[{post.creator_id}:{post.post_id}] \'{plink.name}\''
+        sha256 = plink.url_sha256
+        local_files: list[tuple[pathlib.Path, int, str]] = []
+        owner = self._content_owners.get(link_content_key(plink.url))
+        if owner is not None and owner is not plink and owner.status.result in (DownloadResult.SUCCESS, DownloadResult.FAIL_ALREADY_EXISTS):
+            local_files.append((owner.path, owner.status.size, owner.status.sha256))
+        if sha256:
+            local_files.extend((path, size, sha256) for path, size in await Cache.get_local_files(sha256))
+        for local_path, size, local_sha256 in local_files:
+            if local_path == plink.path or not local_path.is_file() or local_path.stat().st_size != size:
+                continue
+            plink.status.size = size
+            plink.status.sha256 = local_sha256
+            if plink.path.is_file() and plink.path.samefile(local_path):
+                Log.info(f'{plink_id}: {plink.local_path} is already linked to {local_path}')
+                return DownloadResult.FAIL_ALREADY_EXISTS
+            try:
+                linked = await to_thread(link_file, local_path, plink.path)
+            except OSError:
+                Log.warn(f'{plink_id}: Unable to reuse {local_path}: {sys.exc_info()[0]}: {sys.exc_info()[1]}')
+                continue
+            plink.status.flags |= DownloadFlags.ALREADY_EXISTED_SIMILAR
+            Log.info(f'{plink_id}: Same file was already downloaded as {local_path}, {"linked" if linked else "copied"} to {plink.local_path}')
+            return DownloadResult.SUCCESS
+        return None
+
+    async def _download_post_link(self, post: PostInfo, plink: PostLinkInfo) -> bool:
+        """Returns False if download attempt failed and link has to be retried later"""
         await self._at_post_link_start(post, plink)
         plink_id = f'[{post.creator_id}:{post.post_id}] \'{plink.name}\''
         plink.status.state = State.SCANNING
@@ -342,6 +463,7 @@ class KemonoDownloader:
         handler_ex = ExternalURLDownloader(url)
         handler_config = ExternalURLHandlerConfig(Config, url.host, dest_base=plink.path)
         handler_valid = handler_ex.valid()
+        error = ''
         if not (handler_valid or link_supported or link_skipped) and Config.probe_unknown_links and is_link_extension_supported(url.suffix):
             handler_config.proxy = ''  # assume unknown link is reachable always
             presult = await handler_ex.probe(plink_id, url, handler_config, is_link_extension_supported)
@@ -365,13 +487,22 @@ class KemonoDownloader:
                 else DownloadResult.SUCCESS_PARTIAL if succ_count
                 else DownloadResult.FAIL_RETRIES
             )
+            error = handler_ex.name()
+        elif link_supported and (lresult := await self._download_post_link_local(post, plink)) is not None:
+            dresult = lresult
         elif link_supported:
             Log.info(f'{plink_id}: Processing {url_str} => {plink.local_path}')
             plink.status.state = State.DOWNLOADING
             await self.add_to_writes(post, plink, True)
-            ec = await self._kemono.download_url(post, plink)
+            ec = await self._kemono.download_url(post, plink, retry_later=True)
             await self.remove_from_writes(post, plink, True)
-            if plink.path.is_file():
+            if ec == KemonoErrorCodes.ERETRY:
+                Log.warn(f'{plink_id}: Attempt {plink.status.tries:d} failed, will retry later...')
+                await self._at_post_link_defer(post, plink)
+                return False
+            if ec == KemonoErrorCodes.EFILTERED:
+                Log.info(f'{plink_id}: Skipped, file was filtered out')
+            elif plink.path.is_file():
                 file_size = plink.path.stat().st_size
                 if file_size != plink.status.size:
                     Log.error(f'Bytes written mismatch for {plink.local_path}'
@@ -385,43 +516,35 @@ class KemonoDownloader:
             dresult = (
                 DownloadResult.SUCCESS if ec == KemonoErrorCodes.ESUCCESS
                 else DownloadResult.FAIL_ALREADY_EXISTS if ec == KemonoErrorCodes.EEXISTS
+                else DownloadResult.FAIL_SKIPPED if ec == KemonoErrorCodes.EFILTERED
                 else DownloadResult.FAIL_RETRIES
             )
+            error = KemonoErrorCodes(ec).name
         else:
             Log.warn(f'{plink_id}: Skipping unsupported link {url_str}...')
             dresult = DownloadResult.FAIL_UNSUPPORTED
-        await self._at_post_link_finish(post, plink, dresult)
-
-    async def _prod(self) -> None:
-        while True:
-            async with self._sequence_lock:
-                if self.can_fetch_next() is False:
-                    break
-                qfull = self._queue_consume.full()
-            if qfull is False:
-                if post := await self._try_fetch_next():
-                    post.status.state = State.QUEUED
-                    await self._queue_consume.put(post)
-            else:
-                await sleep(0.2)
-
-    async def _cons(self) -> None:
-        while True:
-            async with self._sequence_lock:
-                can_fetch = self.can_fetch_next()
-                qsize = self._queue_consume.qsize()
-            if can_fetch is False and qsize == 0:
-                break
-            async with self._active_downloads_lock:
-                dsize = len(self._downloads_active)
-            if qsize > 0 and dsize < Config.max_jobs:
-                post = await self._queue_consume.get()
-                await self._at_post_start(post)
-                await self._download_post(post)
-                await self._at_post_finish(post)
+        await self._at_post_link_finish(post, plink, dresult, error)
+        return True
+
+    async def _worker(self) -> None:
+        while (item := await self._queue_consume.get()).post is not None:
+            self._queued_count -= 1
+            post = item.post
+            try:
+                if item.plink is not None and self._wait_for_same_content(item):
+                    continue
+                # first link of a post to be picked starts it, last one to finish completes it
+                if post.status.state == State.QUEUED:
+                    await self._start_post(post)
+                if item.plink is None or await self._download_post_link(post, item.plink):
+                    if item.plink is not None:
+                        self._release_same_content(item.plink)
+                    await self._finish_post_link(post)
+                else:
+                    self._retry_later(item)
+            finally:
                 self._queue_consume.task_done()
-            else:
-                await sleep(0.35)
+        self._queue_consume.task_done()
 
     async def _after_download(self) -> None:
         newline = '\n'
@@ -436,8 +559,8 @@ class KemonoDownloader:
                  f'{downloaded_count:d} / {self._orig_count - external_count:d}+{external_count:d} post links downloaded, '
                  f'{already_exist_count:d} already existed, {skipped_count:d} skipped, {not_found_count:d} not found, '
                  f'{unsupported_count:d} unsupported, {partial_count:d} partial success (external)')
-        if len(self._queue_produce) > 0:
-            Log.fatal(f'total queue is still at {len(self._queue_produce):d} != 0!')
+        if self.can_fetch_next() or self._retries_pending or self._content_waiting:
+            Log.fatal(f'total queue is still at {self._queued_count:d}+{self._retries_pending:d}+{len(self._content_waiting):d} != 0!')
         if len(self._writes_active) > 0:
             Log.fatal(f'active writes count is still at {len(self._writes_active):d} != 0!')
         if len(self._failed_items) > 0:
@@ -445,10 +568,18 @@ class KemonoDownloader:
                                  f' {plink.url!s} => {plink.local_path}'
                                  for plink in plinks]) for post, plinks in self._failed_items.items()]
             Log.fatal(f'\nFailed items:\n{newline.join(fitems)}')
+            Log.info('Failed items are stored, use \'post rip failed\' to retry them')
 
     async def run(self) -> None:
-        for cv in as_completed([self._prod(), *(self._cons() for _ in range(Config.max_jobs))]):
-            await cv
+        journaled = await self._load_run_journal()
+        if self._sizes_needed():
+            await self._probe_sizes()
+        if journaled or self._sizes_needed():
+            self._fill_queue()  # finished links are left out, order may depend on sizes
+        self._workers_count = max(1, min(Config.max_jobs, self._queued_count))
+        if not self._post_links_left:
+            self._stop_workers()
+        await gather(*(self._worker() for _ in range(self._workers_count)))
         await self._queue_consume.join()
         await self._after_download()
 
@@ -470,16 +601,130 @@ class KemonoDownloader:
                     self._writes_active.pop(post)
 
     def can_fetch_next(self) -> bool:
-        return bool(self._queue_produce)
+        return self._queued_count > 0
 
     def get_workload_size(self) -> int:
-        return len(self._queue_produce) + self._queue_consume.qsize() + len(self._downloads_active)
+        """Number of posts not finished yet"""
+        return len(self._post_links_left)
+
+    def _fill_queue(self) -> None:
+        self._queue_consume = AsyncPriorityQueue()
+        self._queued_count = 0
+        self._post_links_left.clear()
+        for item in self._make_work_items():
+            self._queue_consume.put_nowait(item)
+            self._queued_count += 1
+
+    async def _load_run_journal(self) -> bool:
+        """Loads progress of resumed run, posts and links finished by it are not processed again. Returns True if there was any"""
+        if not self._run_id:
+            return False
+        self._journal_posts, self._journal_links = await Cache.get_run_journal_progress(self._run_id)
+        if self._journal_posts or self._journal_links:
+            Log.info(f'Run #{self._run_id:d}: {len(self._journal_posts):d} posts and {len(self._journal_links):d} links are finished already')
+        return bool(self._journal_posts or self._journal_links)
+
+    def _is_journal_finished(self, post: PostInfo, plink: PostLinkInfo) -> bool:
+        return bool(self._journal_links) and (post.as_cache_key(), plink.name) in self._journal_links
 
-    async def _try_fetch_next(self) -> PostInfo | None:
-        async with self._sequence_lock:
-            if self._queue_produce:
-                return self._queue_produce.popleft()
-        return None
+    @staticmethod
+    def _sizes_needed() -> bool:
+        return bool(
+            Config.download_mode == DownloadMode.FULL and
+            (Config.filter_filesize or Config.download_order in ('shortest', 'largest')),
+        )
+
+    async def _probe_sizes(self) -> None:
+        """Fetches sizes of native links of unknown size (HEAD requests, concurrently), known sizes are stored to cache"""
+        async def probe(post: PostInfo, plink: PostLinkInfo) -> None:
+            async with semaphore:
+                if size := await self._kemono.probe_url(post, plink):
+                    plink.status.size = size
+                    await Cache.update_post_link_info_cache(post, plink)
+
+        plinks = [
+            (post, plink) for post in self._post_info.values() for plink in post.links
+            if not plink.status.size and is_link_native(plink.url) and not self._is_journal_finished(post, plink) and
+            not (Config.skip_completed and plink.status.flags & DownloadFlags.COMPLETED)
+        ]
+        if plinks:
+            Log.info(f'Probing sizes of {len(plinks):d} links...')
+            semaphore = Semaphore(Config.max_jobs)
+            await gather(*(probe(*_) for _ in plinks))
+        all_plinks = [plink for post in self._post_info.values() for plink in post.links]
+        sizes = [_.status.size for _ in all_plinks if _.status.size]
+        Log.info(f'{len(sizes):d} / {len(all_plinks):d} links are of known size, total {sum(sizes) / Mem.MB:.2f} Mb')
+
+    def _make_work_items(self) -> list[DownloadWorkItem]:
+        """Flattens links of all posts in order defined by '--download-order' policy, sizes are known from cache (0 = unknown)"""
+        policy = Config.download_order or DOWNLOAD_ORDER_DEFAULT
+        host_counts: dict[str | None, int] = defaultdict(int)
+        items: list[DownloadWorkItem] = []
+        for post in self._post_info.values():
+            if post in self._posts_complete:
+                continue
+            plinks = post.links
+            if self._journal_links or self._journal_posts:
+                plinks = []
+                for plink in post.links:
+                    if self._is_journal_finished(post, plink):
+                        plink.status.result = self._journal_links[(post.as_cache_key(), plink.name)]
+                        plink.status.state = State.DONE
+                    else:
+                        plinks.append(plink)
+                if not plinks and post.as_cache_key() in self._journal_posts:
+                    post.status.state = State.DONE
+                    continue
+            post.status.state = State.QUEUED
+            self._post_links_left[post] = len(plinks)
+            for plink in plinks or (None,):
+                if plink is not None:
+                    plink.status.state = State.QUEUED
+                if plink is None or policy == 'input':
+                    order = 0
+                elif policy == 'shortest':
+                    order = plink.status.size or DOWNLOAD_WORK_ORDER_LAST - 1
+                elif policy == 'largest':
+                    order = -plink.status.size
+                else:  # policy == 'host'
+                    # n-th link of every server goes in n-th round
+                    order = host_counts[plink.url.host]
+                    host_counts[plink.url.host] += 1
+                items.append(DownloadWorkItem(order, len(items), post, plink))
+        return items
+
+    @staticmethod
+    def _is_post_complete_locally(post: PostInfo) -> bool:
+        """
+        Post was completed earlier and its files are still there: 'done' marker exists, every link is completed and its file
+        is of cached size. Only stat() calls, no network I/O
+        """
+        if not post.status.flags & DownloadFlags.COMPLETED or not post.dest.joinpath(POST_DONE_FILE_NAME_DEFAULT).is_file():
+            return False
+        for plink in post.links:
+            if not plink.status.flags & DownloadFlags.COMPLETED or not plink.status.size:
+                return False
+            try:
+                if plink.path.stat().st_size != plink.status.size:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def _find_complete_posts(self) -> set[PostInfo]:
+        """Posts verified to be complete locally, they are not queued at all"""
+        if Config.download_mode != DownloadMode.FULL:
+            return set()
+        complete_posts = {_ for _ in self._post_info.values() if self._is_post_complete_locally(_)}
+        for post in complete_posts:
+            for plink in post.links:
+                plink.status.result = DownloadResult.FAIL_ALREADY_EXISTS
+                plink.status.state = State.DONE
+            post.status.state = State.DONE
+            self._already_exist_count[post.post_id] += len(post.links)
+        if complete_posts:
+            Log.info(f'{len(complete_posts):d} / {len(self._post_info):d} posts are complete already (verified locally). Skipped')
+        return complete_posts
 
     def _prepare_post_download_info(self, post_infos: Iterable[PostInfo]) -> int:
         post_strings: list[str] = []
@@ -12,6 +12,7 @@ from collections.abc import Iterable
 from typing import Final, Literal, Protocol
 
 from .api import Mem, PostInfo, PostLinkInfo
+from .api.filters import Filter
 from .config import Config
 from .defs import FMT_DATE, DateRange, NumRange
 from .util import build_regex_from_pattern
@@ -28,8 +29,9 @@ class FileSizeFilter:
         self._range = irange
 
     def filters_out(self, _post: PostInfo, plink: PostLinkInfo) -> bool:
-        file_size = len(plink.path.as_posix())
-        file_size /= FileSizeFilter.resolution
+        if not plink.status.size:
+            return False  # unknown yet, checked again once server reports it
+        file_size = plink.status.size / FileSizeFilter.resolution
         return not self._range.min <= file_size <= self._range.max
 
     def __str__(self) -> str:
@@ -51,6 +53,14 @@ class FileNameFilter:
         return f'{self.__class__.__name__}<{self._regex.pattern[1:-1]}>'
 
 
+def make_file_filters() -> tuple[Filter, ...]:
+    filters = (
+        *((FileSizeFilter(Config.filter_filesize),) if Config.filter_filesize else ()),
+        *((FileNameFilter(Config.filter_filename),) if Config.filter_filename else ()),
+    )
+    return filters
+
+
 # Downloader
 
 
@@ -6,17 +6,32 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 #
 #
 
+import datetime
 import json
 import pathlib
 import sys
 from argparse import ArgumentError
-from collections.abc import Awaitable, Callable, Iterable, Sequence
-
-from .analyzer import gather_post_info
-from .api import APIAddress, Creator, Kemono, PCSDPost, PostInfo, PostPageScanResult, ScannedPostPost
-from .cache import Cache
+from collections import Counter, defaultdict
+from collections.abc import Awaitable, Callable, Container, Iterable, Sequence
+
+from .analyzer import gather_post_info, with_random_data_server
+from .api import (
+    APIAddress,
+    Creator,
+    DownloadFlags,
+    DownloadResult,
+    Kemono,
+    Mem,
+    PCSDPost,
+    PostInfo,
+    PostLinkInfo,
+    PostPageScanResult,
+    ScannedPost,
+    ScannedPostPost,
+)
+from .cache import Cache, RunJournal
 from .config import Config
-from .defs import CREATORS_NAME_DEFAULT, POST_TAGS_NAME_DEFAULT, UTF8, PathURLJSONEncoder
+from .defs import CACHE_CREATORS_MAX_AGE, CREATOR_MATCH_DEFAULT, CREATORS_NAME_DEFAULT, POST_TAGS_NAME_DEFAULT, UTF8, PathURLJSONEncoder
 from .downloader import KemonoDownloader
 from .filters import any_filter_matching_post_info, make_post_info_filters
 from .logger import Log
@@ -32,14 +47,21 @@ async def _process_list_search_results(kemono: Kemono, ls_results: Iterable[PCSD
 
 
 async def _process_post_page_scan_results(kemono: Kemono, links: Sequence[PostPageScanResult], *,
-                                          ls_results: Iterable[PCSDPost] = (), compact=False, download=False) -> None:
+                                          ls_results: Iterable[PCSDPost] = (), compact=False, download=False,
+                                          run: RunJournal | None = None) -> None:
+    run_id = run.run_id if run else 0
+    if download and not run_id:
+        run_id = await Cache.create_run_journal(Config.get_action_string(), ' '.join(Config.arglist), kemono.api_address, links)
+        Log.info(f'Run #{run_id:d} started. If interrupted, it can be continued with \'post rip resume {run_id:d}\'')
     Log.info(f'Scanning {len(links):d} posts...')
-    post_infos = await _scan_posts_cached(kemono, links, ls_results)
+    post_infos = await _scan_posts_cached(kemono, links, ls_results, run_id=run_id, scanned=run.scanned if run else ())
     Log.info(f'Received {len(post_infos):d} results. Continuing...')
-    await _process_scan_results(kemono, post_infos, compact=compact, download=download)
+    await _process_scan_results(kemono, post_infos, compact=compact, download=download, run_id=run_id)
+    if run_id:
+        await Cache.finish_run_journal(run_id)
 
 
-async def _process_scan_results(kemono: Kemono, post_infos: Sequence[PostInfo], *, compact=False, download=False) -> None:
+async def _process_scan_results(kemono: Kemono, post_infos: Sequence[PostInfo], *, compact=False, download=False, run_id=0) -> None:
     posts_count = len(post_infos)
     if posts_count == 0:
         Log.info('Nothing to process')
@@ -80,7 +102,7 @@ async def _process_scan_results(kemono: Kemono, post_infos: Sequence[PostInfo],
 
     if download:
         Log.info(f'Sending {posts_count:d} posts to download queue...')
-        async with KemonoDownloader(kemono, post_infos) as downloader:
+        async with KemonoDownloader(kemono, post_infos, run_id) as downloader:
             await downloader.run()
     else:
         lmsgs: tuple[str, ...] = ('', f'{final_count:d} posts:', '', *listing, 'Done')
@@ -133,31 +155,83 @@ def _parse_posts_file(kemono: Kemono, contents: Iterable[str]) -> list[PostPageS
     return links
 
 
-async def _scan_posts_cached(kemono: Kemono, links: Iterable[PostPageScanResult], ls_results: Iterable[PCSDPost] = ()) -> list[PostInfo]:
+async def _rebuild_cached(kemono: Kemono, post_infos: Sequence[PostInfo]) -> tuple[list[PostInfo], list[PostInfo]]:
+    """Re-runs post info gathering on stored scanned posts. Returns rebuilt post infos and post infos which can't be rebuilt"""
+    cached_dict: dict[str, PostInfo] = {_.as_cache_key(): _ for _ in post_infos}
+    scanned_posts: list[ScannedPost] = []
+    for service in dict.fromkeys(_.service for _ in post_infos):
+        scanned_posts.extend(await Cache.get_scanned_post_cache((_.post_id for _ in post_infos if _.service == service), service))
+    rebuilt = await gather_post_info(scanned_posts, kemono.api_address)
+    for pi in rebuilt:
+        pi_old = cached_dict.pop(pi.as_cache_key())
+        old_links: dict[str, PostLinkInfo] = {_.name: _ for _ in pi_old.links}
+        for plink in pi.links:
+            if plink_old := old_links.get(plink.name):
+                plink.status.size = plink_old.status.size
+                if plink.path == plink_old.path:
+                    plink.status.flags |= plink_old.status.flags
+                    plink.status.sha256 = plink_old.status.sha256
+        if pi.dest == pi_old.dest:
+            pi.status.flags |= pi_old.status.flags
+    if rebuilt:
+        await Cache.store_post_info_cache(rebuilt)
+    Log.info(f'Rebuilt {len(rebuilt):d} cached entries, {len(cached_dict):d} entries have no stored scan data')
+    return rebuilt, list(cached_dict.values())
+
+
+def _make_post_info_generator(run_id: int) -> Callable[[Iterable[ScannedPost], APIAddress], Awaitable[list[PostInfo]]]:
+    """With run journal every scanned post is recorded as soon as it's gathered so resumed run doesn't have to scan it again"""
+    async def gather_post_info_journaled(scanned_posts: Iterable[ScannedPost], api_address: APIAddress) -> list[PostInfo]:
+        post_infos = await gather_post_info(scanned_posts, api_address)
+        await Cache.journal_posts_scanned(run_id, post_infos)
+        return post_infos
+    return gather_post_info_journaled if run_id else gather_post_info
+
+
+async def _scan_posts_cached(kemono: Kemono, links: Iterable[PostPageScanResult], ls_results: Iterable[PCSDPost] = (), *,
+                             run_id=0, scanned: Container[str] = ()) -> list[PostInfo]:
+    """'scanned' - cache keys of posts scanned by resumed run, cached ones are used as is"""
+    post_info_generator = _make_post_info_generator(run_id)
     if Config.skip_cache:
-        return await kemono.scan_posts(links, gather_post_info)
+        return await kemono.scan_posts(links, post_info_generator)
     links_dict: dict[str, PostPageScanResult] = {_.as_cache_key(): _ for _ in links}
     ls_results_dict: dict[str, str] = {}
     for _ in ls_results or []:
         lsp: ScannedPostPost = _.get('post', _)
         lrd_key = PostPageScanResult(lsp['id'], lsp['user'], lsp['service'], kemono.api_address)
         ls_results_dict[lrd_key.as_cache_key()] = lsp.get('published', '')
-    cached = await Cache.get_post_info_cache(_.post_id for _ in links_dict.values())
+    cached: list[PostInfo] = []
+    for service in dict.fromkeys(_.service for _ in links_dict.values()):
+        cached.extend(await Cache.get_post_info_cache((_.post_id for _ in links_dict.values() if _.service == service), service))
     Log.info(f'Found {len(cached):d} fully cached entries!')
     if cached:
+        links_cached: dict[str, PostPageScanResult] = {}
         for pi in cached:
             k = pi.as_cache_key()
-            if k in links_dict and (Config.force_cache or (k in ls_results_dict and pi.published == ls_results_dict[k])):
-                links_dict.pop(k)
+            if k in links_dict and (Config.force_cache or k in scanned or (k in ls_results_dict and pi.published == ls_results_dict[k])):
+                links_cached[k] = links_dict.pop(k)
+        cached = [_ for _ in cached if _.as_cache_key() in links_cached]
+        if Config.rebuild_cache and cached:
+            cached, not_rebuilt = await _rebuild_cached(kemono, cached)
+            links_dict.update({_.as_cache_key(): links_cached[_.as_cache_key()] for _ in not_rebuilt})
         if links_dict:
             Log.info(f'Fetching remaining {len(links_dict):d} posts...')
-    if new_cached := await kemono.scan_posts([links_dict[_] for _ in links_dict], gather_post_info):
+        if run_id and cached:
+            await Cache.journal_posts_scanned(run_id, cached)
+    if new_cached := await kemono.scan_posts([links_dict[_] for _ in links_dict], post_info_generator):
         cached.extend(new_cached)
     return cached
 
 
-async def creator_dump(kemono: Kemono) -> None:
+async def _refresh_creators(kemono: Kemono) -> list[Creator]:
     results = await kemono.list_creators()
+    added, updated, removed = await Cache.store_creators(kemono.api_address, results)
+    Log.debug(f'Creators list synced: {added:d} added, {updated:d} updated, {removed:d} removed')
+    return results
+
+
+async def creator_dump(kemono: Kemono) -> None:
+    results = await _refresh_creators(kemono)
     results_sorted = sorted(results, key=lambda c: c['name'].lower())
     with open(Config.dest_base / CREATORS_NAME_DEFAULT, 'wt', encoding=UTF8, newline='\n') as outfile_creators:
         json.dump(
@@ -168,13 +242,9 @@ async def creator_dump(kemono: Kemono) -> None:
 
 
 async def creator_list(kemono: Kemono) -> None:
-    results: list[Creator] = []
-    cache_path = Config.dest_base / CREATORS_NAME_DEFAULT
-    if Config.skip_cache is False and cache_path.is_file():
-        with open(cache_path, 'rt', encoding=UTF8) as infile_creators:
-            results = json.load(infile_creators)
-    results = results or await kemono.list_creators()
-    matched = [c for c in results if Config.pattern.lower() in c['name'].lower()]
+    if Config.skip_cache or await Cache.creators_outdated(kemono.api_address, 0 if Config.force_cache else CACHE_CREATORS_MAX_AGE):
+        await _refresh_creators(kemono)
+    matched = await Cache.find_creators(kemono.api_address, Config.pattern, Config.creator_match or CREATOR_MATCH_DEFAULT)
     Log.info('\n'.join(('\n', *(f'[{_["service"]}] {_["name"]}: {_["id"]}' for _ in matched))) or '\nNothing')
 
 
@@ -189,8 +259,13 @@ async def post_list(kemono: Kemono) -> None:
 
 
 async def post_search(kemono: Kemono) -> None:
+    if Config.search_offline:
+        post_infos = await Cache.search_post_info_cache(Config.search_string, Config.search_tags or ())
+        Log.info(f'Found {len(post_infos):d} cached posts')
+        await _process_scan_results(kemono, post_infos, compact=True, download=bool(Config.search_rip))
+        return
     results = await kemono.search_posts(Config.search_string, Config.search_tags)
-    await _process_list_search_results(kemono, results)
+    await _process_list_search_results(kemono, results, download=bool(Config.search_rip))
 
 
 async def post_scan_id(kemono: Kemono, *, download=False) -> None:
@@ -228,6 +303,60 @@ async def post_rip_file(kemono: Kemono) -> None:
     return await post_scan_file(kemono, download=True)
 
 
+async def post_rip_resume(kemono: Kemono) -> None:
+    run = await Cache.get_run_journal(Config.resume_run_id)
+    if run is None:
+        Log.info(f'Run #{Config.resume_run_id:d} is not found' if Config.resume_run_id else 'No unfinished runs found. Nothing to resume')
+        return
+    if run.finished:
+        Log.info(f'Run #{run.run_id:d} was finished at {datetime.datetime.fromtimestamp(run.finished).isoformat(" ")}. Nothing to resume')
+        return
+    Log.info(f'Resuming run #{run.run_id:d} \'{run.action}\' ({run.args}) started at {datetime.datetime.fromtimestamp(run.created).isoformat(" ")}:'
+             f' {len(run.links):d} posts, {len(run.scanned):d} scanned')
+    await _process_post_page_scan_results(kemono, run.links, compact=True, download=True, run=run)
+
+
+async def post_rip_failed(kemono: Kemono) -> None:
+    failed_links = await Cache.get_failed_links()
+    if not failed_links:
+        Log.info('No failed links found. Nothing to retry')
+        return
+    errors = Counter(_.error for _ in failed_links)
+    Log.info(f'Found {len(failed_links):d} failed links ({", ".join(f"{e}: {c:d}" for e, c in errors.items())})')
+    failed_names: dict[str, set[str]] = defaultdict(set)
+    for failed_link in failed_links:
+        failed_names[f'{failed_link.post_id}:{failed_link.service}'].add(failed_link.name)
+    post_infos: list[PostInfo] = []
+    for service in dict.fromkeys(_.service for _ in failed_links):
+        post_infos.extend(await Cache.get_post_info_cache((_.post_id for _ in failed_links if _.service == service), service))
+    # post was evicted from cache or re-scanned since and link is gone
+    cached_names = {_.as_cache_key(): {pl.name for pl in _.links} for _ in post_infos}
+    if stale := [_ for _ in failed_links if _.name not in cached_names.get(f'{_.post_id}:{_.service}', ())]:
+        Log.warn(f'{len(stale):d} failed links are no longer cached and can\'t be retried, dropping them')
+        await Cache.clear_failed_links(stale)
+    post_infos = [_ for _ in post_infos if any(pl.name in failed_names[_.as_cache_key()] for pl in _.links)]
+    if not post_infos:
+        return
+    # circuit breaker state of the run which failed is gone, retry each failed link through another data server
+    for post_info in post_infos:
+        post_info.links[:] = [_._replace(url=with_random_data_server(_.url)) if _.name in failed_names[post_info.as_cache_key()] else _
+                              for _ in post_info.links]
+    # retry is a run of its own: only failed links are queued, other links of their posts are journaled as finished
+    links = [PostPageScanResult(_.post_id, _.creator_id, _.service, kemono.api_address) for _ in post_infos]
+    run_id = await Cache.create_run_journal(Config.get_action_string(), ' '.join(Config.arglist), kemono.api_address, links)
+    await Cache.journal_posts_scanned(run_id, post_infos)
+    for post_info in post_infos:
+        other_links = [_ for _ in post_info.links if _.name not in failed_names[post_info.as_cache_key()]]
+        for plink in other_links:
+            plink.status.result = (
+                DownloadResult.FAIL_ALREADY_EXISTS if plink.status.flags & DownloadFlags.COMPLETED else DownloadResult.FAIL_SKIPPED)
+        await Cache.journal_link_results(run_id, post_info, other_links)
+    Log.info(f'Run #{run_id:d} started. If interrupted, it can be continued with \'post rip resume {run_id:d}\'')
+    # prepared posts go straight to download, re-scanning them would bring back original links
+    await _process_scan_results(kemono, post_infos, compact=True, download=True, run_id=run_id)
+    await Cache.finish_run_journal(run_id)
+
+
 async def post_tag_dump(kemono: Kemono) -> None:
     results = await kemono.list_tags()
     results_sorted = sorted(results, key=lambda t: t['tag'].lower())
@@ -294,6 +423,55 @@ async def config_modify(*_) -> None:
     await _config_write(config_path, use_backup=True)
 
 
+async def cache_stats(*_) -> None:
+    stats = await Cache.get_cache_stats()
+    lookups, hits = stats.last_run_lookups, stats.last_run_hits
+    last_run_time = datetime.datetime.fromtimestamp(stats.last_run_time).isoformat(' ') if stats.last_run_time else 'never'
+    oldest_time = datetime.datetime.fromtimestamp(stats.oldest_access).isoformat(' ') if stats.posts else '-'
+    smsgs: tuple[str, ...] = (
+        f'Cache DB: {stats.db_path.as_posix()}',
+        f'File size: {stats.file_size / Mem.MB:.2f} Mb, used: {stats.used_size / Mem.MB:.2f} Mb,'
+        f' free: {stats.free_pages * stats.page_size / Mem.MB:.2f} Mb ({stats.free_pages:d} / {stats.page_count:d} pages)',
+        f'Posts: {stats.posts:d} ({stats.posts_raw:d} with stored scan data), links: {stats.links:d}',
+        f'Least recently accessed post: {oldest_time}',
+        *(f' {name}: {size / Mem.KB:.1f} Kb' for name, size in stats.table_sizes.items()),
+        f'Last run: {last_run_time}, cache hits: {hits:d} / {lookups:d}{f" ({hits * 100 / lookups:.1f}%)" if lookups else ""}',
+    )
+    for smsg in smsgs:
+        Log.info(smsg)
+
+
+async def cache_prune(*_) -> None:
+    if not Config.cache_max_age and not Config.cache_max_size:
+        Log.error('No prune limits provided. Aborting')
+        return
+    size_before = (await Cache.get_cache_stats()).used_size
+    evicted = await Cache.prune_cache((Config.cache_max_age or 0) * 86400, (Config.cache_max_size or 0) * Mem.MB)
+    size_after = (await Cache.get_cache_stats()).used_size
+    Log.info(f'Evicted {evicted:d} posts, cache data size: {size_before / Mem.MB:.2f} Mb -> {size_after / Mem.MB:.2f} Mb')
+
+
+async def cache_compact(*_) -> None:
+    size_before = (await Cache.get_cache_stats()).file_size
+    Log.info(f'Compacting cache DB{" (full vacuum)" if Config.cache_full_vacuum else ""}...')
+    await Cache.compact_cache(bool(Config.cache_full_vacuum))
+    size_after = (await Cache.get_cache_stats()).file_size
+    Log.info(f'Done. File size: {size_before / Mem.MB:.2f} Mb -> {size_after / Mem.MB:.2f} Mb')
+
+
+async def cache_export(*_) -> None:
+    filters_str = ', '.join(f'{k}: {", ".join(v)}' for k, v in (('creators', Config.cache_creator_ids), ('services', Config.cache_services)) if v)
+    Log.info(f'Exporting cached posts{f" ({filters_str})" if filters_str else ""} to \'{Config.cache_file.as_posix()}\'...')
+    exported = await Cache.export_cache(Config.cache_file, Config.cache_creator_ids or (), Config.cache_services or ())
+    Log.info(f'Exported {exported:d} posts')
+
+
+async def cache_import(*_) -> None:
+    Log.info(f'Importing cached posts from \'{Config.cache_file.as_posix()}\'...')
+    added, updated, skipped = await Cache.import_cache(Config.cache_file)
+    Log.info(f'Added {added:d} posts, updated {updated:d} posts, skipped {skipped:d} posts (local copy is same or newer)')
+
+
 async def launch(kemono: Kemono) -> None:
     kemono_actions: dict[str, Callable[[Kemono], Awaitable[None]]] = {
         'creator dump': creator_dump,
@@ -307,9 +485,16 @@ async def launch(kemono: Kemono) -> None:
         'post rip id': post_rip_id,
         'post rip url': post_rip_url,
         'post rip file': post_rip_file,
+        'post rip resume': post_rip_resume,
+        'post rip failed': post_rip_failed,
         'post tags dump': post_tag_dump,
         'config create': config_create,
         'config modify': config_modify,
+        'cache stats': cache_stats,
+        'cache prune': cache_prune,
+        'cache compact': cache_compact,
+        'cache export': cache_export,
+        'cache import': cache_import,
     }
 
     action_name = Config.get_action_string()
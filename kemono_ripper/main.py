@@ -17,7 +17,7 @@ from .cache import Cache
 from .cmdargs import HelpPrintExitException, parse_logging_args, prepare_arglist
 from .config import Config
 from .defs import CONFIG_NAME_DEFAULT, MIN_PYTHON_VERSION, MIN_PYTHON_VERSION_STR, UTF8
-from .filters import FileNameFilter, FileSizeFilter
+from .filters import make_file_filters
 from .launcher import config_create, launch
 from .logger import Log
 from .validators import valid_path_format
@@ -77,11 +77,9 @@ def make_kemono_options() -> KemonoOptions:
         proxy=Config.proxy,
         extra_headers=Config.extra_headers,
         extra_cookies=Config.extra_cookies,
-        filters=(
-            *((FileSizeFilter(Config.filter_filesize),) if Config.filter_filesize else ()),
-            *((FileNameFilter(Config.filter_filename),) if Config.filter_filename else ()),
-        ),
+        filters=make_file_filters(),
         download_mode=DownloadMode(Config.download_mode),
+        content_store=Config.content_store,
         logger=Log,
     )
     return options
@@ -82,6 +82,15 @@ def valid_file_path(pathstr: str) -> pathlib.Path:
     return valid_path(pathstr, is_file=True)
 
 
+def valid_output_file_path(pathstr: str) -> pathlib.Path:
+    try:
+        newpath = pathlib.Path(pathstr.strip('\'"')).expanduser().resolve()
+        assert newpath.parent.is_dir() and not newpath.is_dir()
+        return newpath
+    except Exception:
+        raise ArgumentError
+
+
 def valid_path_format(format_str: str) -> str:
     try:
         assert not any(_ in format_str for _ in (' /',))
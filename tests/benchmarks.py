@@ -0,0 +1,98 @@
+# coding=UTF-8
+"""
+Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
+"""
+#########################################
+#
+#
+
+# Not part of the test suite, run manually: python -m tests.benchmarks
+
+import asyncio
+import pathlib
+import time
+from collections.abc import Callable, Coroutine
+from tempfile import TemporaryDirectory
+from typing import Any
+
+from kemono_ripper import APP_NAME
+from kemono_ripper.api import FileWriter, Mem
+from kemono_ripper.config import Config
+from kemono_ripper.downloader import KemonoDownloader
+from kemono_ripper.logger import Log
+
+from .tests import LocalKemono, make_post_info, run_with_temp_cache
+
+BENCH_POSTS_COUNT = 2000
+BENCH_LINKS_PER_POST = (0, 1, 4)
+BENCH_JOBS = (1, 8, 32)
+BENCH_WRITE_FILE_SIZE = 64 * Mem.MB
+BENCH_WRITE_CHUNK_SIZE = 128 * Mem.KB
+BENCH_WRITE_FILES = (1, 8)
+
+
+def bench_downloader_scheduling() -> None:
+    """Downloader orchestration overhead per post, link 'downloads' complete instantly so the rest is scheduling + bookkeeping"""
+    for links_count in BENCH_LINKS_PER_POST:
+        for max_jobs in BENCH_JOBS:
+            with TemporaryDirectory(prefix=f'{APP_NAME}_bench_') as tempdir:
+                post_infos = [make_post_info(f'{_:d}', links_count=links_count, root=pathlib.Path(tempdir)) for _ in range(BENCH_POSTS_COUNT)]
+                elapsed = 0.0
+
+                async def bench_coro() -> None:
+                    nonlocal elapsed
+                    async with KemonoDownloader(LocalKemono(), post_infos) as downloader:
+                        start = time.perf_counter()
+                        await downloader.run()
+                        elapsed = time.perf_counter() - start
+
+                Config._reset()
+                Config.max_jobs = max_jobs
+                run_with_temp_cache('bench_downloader_scheduling', bench_coro)
+                print(f'posts: {BENCH_POSTS_COUNT:d}, links per post: {links_count:d}, jobs: {max_jobs:2d} -> '
+                      f'{elapsed:.3f}s total, {elapsed * 1000000 / BENCH_POSTS_COUNT:.1f}us per post')
+
+
+def bench_file_write() -> None:
+    """Write throughput of concurrent downloads: thread round-trip per chunk (old aiofile way) vs FileWriter"""
+    chunk = bytes(BENCH_WRITE_CHUNK_SIZE)
+
+    async def write_per_chunk(file_path: pathlib.Path) -> None:
+        loop = asyncio.get_running_loop()
+        with open(file_path, 'ab') as output_file:
+            for _ in range(BENCH_WRITE_FILE_SIZE // BENCH_WRITE_CHUNK_SIZE):
+                await loop.run_in_executor(None, output_file.write, chunk)
+                await asyncio.sleep(0)  # next network chunk
+
+    async def write_file_writer(file_path: pathlib.Path) -> None:
+        async with FileWriter(file_path, 'ab', BENCH_WRITE_FILE_SIZE) as output_file:
+            for _ in range(BENCH_WRITE_FILE_SIZE // BENCH_WRITE_CHUNK_SIZE):
+                await output_file.write(chunk)
+                await asyncio.sleep(0)
+
+    async def write_all(write_func: Callable[[pathlib.Path], Coroutine[Any, Any, None]], dir_path: pathlib.Path, count: int) -> None:
+        await asyncio.gather(*(write_func(dir_path / f'{_:d}.bin') for _ in range(count)))
+
+    for files_count in BENCH_WRITE_FILES:
+        for name, write_func in (('per-chunk', write_per_chunk), ('FileWriter', write_file_writer)):
+            with TemporaryDirectory(prefix=f'{APP_NAME}_bench_') as tempdir:
+                start = time.perf_counter()
+                asyncio.run(write_all(write_func, pathlib.Path(tempdir), files_count))
+                elapsed = time.perf_counter() - start
+            total_mb = files_count * BENCH_WRITE_FILE_SIZE / Mem.MB
+            print(f'files: {files_count:d} x {BENCH_WRITE_FILE_SIZE // Mem.MB:d} MB, {name:>10} -> '
+                  f'{elapsed:.3f}s, {total_mb / elapsed:.1f} MB/s')
+
+
+def main() -> None:
+    Log._disabled = True
+    bench_downloader_scheduling()
+    bench_file_write()
+
+
+if __name__ == '__main__':
+    main()
+
+#
+#
+#########################################
@@ -8,19 +8,68 @@ Author: trickerer (https://github.com/trickerer, https://github.com/trickerer01)
 
 import asyncio
 import functools
+import hashlib
 import pathlib
-from collections.abc import Callable
+import sqlite3
+import threading
+import time
+from collections.abc import Callable, Coroutine
+from contextlib import AsyncExitStack
 from io import StringIO
 from tempfile import TemporaryDirectory
+from types import SimpleNamespace
+from typing import Any
 from unittest import TestCase
 from unittest.mock import patch
 
+from aiohttp import ClientTimeout, web
+from yarl import URL
+
 from kemono_ripper import APP_NAME, APP_VERSION, main_sync
-from kemono_ripper.analyzer import SUPPORTED_EXTENSIONS
-from kemono_ripper.api import APIAddress, APIService, DownloadFlags, PostInfo, RequestQueue
-from kemono_ripper.cache import Cache
+from kemono_ripper.analyzer import SUPPORTED_EXTENSIONS, gather_post_info, with_random_data_server
+from kemono_ripper.api import (
+    AdaptiveChunkSize,
+    APIAddress,
+    APIService,
+    CircuitBreaker,
+    CircuitState,
+    ContentStore,
+    Creator,
+    DownloadFlags,
+    DownloadMode,
+    DownloadResult,
+    DownloadStatus,
+    FileWriter,
+    Kemono,
+    KemonoErrorCodes,
+    KemonoOptions,
+    Mem,
+    PartFile,
+    PartFileInfo,
+    PostInfo,
+    PostLinkInfo,
+    PostPageScanResult,
+    RequestQueue,
+    State,
+    link_file,
+)
+from kemono_ripper.api.actions import GetCreatorsAction
+from kemono_ripper.api.defs import (
+    CIRCUIT_MIN_REQUESTS,
+    CIRCUIT_OPEN_TIME,
+    CIRCUIT_PROBE_TIMEOUT,
+    DOWNLOAD_CHUNK_SIZE_INIT,
+    DOWNLOAD_CHUNK_SIZE_MAX,
+    DOWNLOAD_CHUNK_TIME_SLOW,
+    RETRY_BUDGET_INITIAL,
+    RETRY_BUDGET_RATIO,
+)
+from kemono_ripper.cache import SCHEMA_MIGRATIONS, SCHEMA_VERSION, Cache
 from kemono_ripper.config import Config
-from kemono_ripper.defs import UTF8
+from kemono_ripper.defs import CONFIG_NAME_DEFAULT, POST_DONE_FILE_NAME_DEFAULT, UTF8, NumRange
+from kemono_ripper.downloader import KemonoDownloader
+from kemono_ripper.filters import FileSizeFilter
+from kemono_ripper.launcher import _rebuild_cached, post_rip_failed
 from kemono_ripper.logger import Log
 from kemono_ripper.main import at_startup
 
@@ -39,12 +88,85 @@ def test_prepare(log=False) -> Callable[[], Callable[[], None]]:
                 Log._disabled = not log
                 Config._reset()
                 RequestQueue._reset()
+                CircuitBreaker._reset()
             set_up_test()
             test_func(*args, **kwargs)
         return invoke_test
     return invoke1
 
 
+test_prepare.__test__ = False  # decorator, not a test (pytest collects it by name otherwise)
+
+
+def make_post_info(post_id: str, creator_id='1000', service: APIService = 'patreon', links_count=2,
+                   root: pathlib.Path | None = None) -> PostInfo:
+    dest = (root or pathlib.Path()) / f'{creator_id} - {post_id}'
+    links = [
+        PostLinkInfo(post_id, f'{idx:02d}_file.png', URL(f'https://n1.kemono.cr/data/00/00/{post_id}{idx:02d}.png'),
+                     dest / f'{idx:02d}_file.png', DownloadStatus())
+        for idx in range(links_count)
+    ]
+    return PostInfo(post_id, creator_id, service, f'Post {post_id}', '2024-01-01T00:00:00', '2024-01-01T00:00:00', '',
+                    ['tag1', 'tag2'], f'Content {post_id}', dest, links, DownloadStatus())
+
+
+class LocalKemono:
+    """Stands in for Kemono in downloader tests, 'downloads' links instantly by writing a few bytes locally"""
+    def __init__(self, delays: dict[str, float] | None = None, failures: dict[str, int] | None = None,
+                 sizes: dict[str, int] | None = None, broken: set[str] | None = None, filtered: set[str] | None = None) -> None:
+        self.api_address: APIAddress = APIAddress.__args__[0]
+        self.downloaded: list[str] = []
+        self.attempts: list[str] = []
+        self.probed: list[str] = []
+        self.hosts: dict[str, str] = {}
+        self._delays = delays or {}
+        self._failures = failures or {}
+        self._sizes = sizes or {}
+        self._broken = broken or set()
+        self._filtered = filtered or set()
+
+    async def probe_url(self, post: PostInfo, plink: PostLinkInfo) -> int:
+        plink_key = f'{post.post_id}/{plink.name}'
+        self.probed.append(plink_key)
+        return self._sizes.get(plink_key, 0)
+
+    async def download_url(self, post: PostInfo, plink: PostLinkInfo, *, retry_later=False) -> KemonoErrorCodes:
+        plink_key = f'{post.post_id}/{plink.name}'
+        self.attempts.append(plink_key)
+        self.hosts[plink_key] = plink.url.host
+        if delay := self._delays.get(plink_key):
+            await asyncio.sleep(delay)
+        if self._failures.get(plink_key, 0) > plink.status.tries:
+            assert retry_later
+            plink.status.tries += 1
+            return KemonoErrorCodes.ERETRY
+        if plink_key in self._broken:
+            return KemonoErrorCodes.ECONNECT
+        if plink_key in self._filtered:
+            return KemonoErrorCodes.EFILTERED
+        plink.path.parent.mkdir(parents=True, exist_ok=True)
+        plink.status.size = plink.path.write_bytes(plink.name.encode())
+        plink.status.sha256 = plink.url_sha256
+        self.downloaded.append(plink_key)
+        return KemonoErrorCodes.ESUCCESS
+
+
+def run_with_temp_cache(test_name: str, test_coro: Callable[[], Coroutine[Any, Any, None]],
+                        prepare_db: Callable[[pathlib.Path], None] | None = None) -> None:
+    with TemporaryDirectory(prefix=f'{APP_NAME}_{test_name}_') as tempdir:
+        db_path = pathlib.Path(tempdir) / f'{test_name}.db'
+        if prepare_db:
+            prepare_db(db_path)
+        with patch.object(Cache, '_db_path', return_value=db_path):
+            at_startup(())
+
+            async def run_test() -> None:
+                async with AsyncExitStack() as ctx:
+                    await ctx.enter_async_context(Cache())
+                    await test_coro()
+            asyncio.run(run_test())
+
+
 class DataIntegrityTests(TestCase):
     @test_prepare()
     def test_integrity_config(self):
@@ -57,7 +179,893 @@ class DataIntegrityTests(TestCase):
         print(f'{self._testMethodName} passed')
 
 
+class APITests(TestCase):
+    @test_prepare()
+    def test_circuit_breaker(self):
+        url = URL('https://n2.kemono.cr/data/00/00/file.png')
+        for _ in range(CIRCUIT_MIN_REQUESTS - 1):
+            CircuitBreaker.record_failure(url.host)
+        self.assertEqual(CircuitState.CLOSED, CircuitBreaker.state(url.host))
+        CircuitBreaker.record_success(url.host)
+        CircuitBreaker.record_failure(url.host)
+        self.assertEqual(CircuitState.OPEN, CircuitBreaker.state(url.host))
+        # dead data server is replaced with a mirror, API host has none
+        self.assertEqual(url.with_host('n1.kemono.cr'), CircuitBreaker.route(url))
+        api_url = URL('https://kemono.cr/api/v1/creators')
+        for _ in range(CIRCUIT_MIN_REQUESTS):
+            CircuitBreaker.record_failure(api_url.host)
+        self.assertIsNone(CircuitBreaker.route(api_url))
+        with patch('time.monotonic', return_value=time.monotonic() + CIRCUIT_OPEN_TIME):
+            self.assertEqual(CircuitState.HALF_OPEN, CircuitBreaker.state(api_url.host))
+            self.assertEqual(api_url, CircuitBreaker.route(api_url))
+            self.assertFalse(CircuitBreaker.allow(api_url.host))
+        # probe which never reported back (cancelled) doesn't keep the host blocked
+        with patch('time.monotonic', return_value=time.monotonic() + CIRCUIT_OPEN_TIME + CIRCUIT_PROBE_TIMEOUT):
+            self.assertTrue(CircuitBreaker.allow(api_url.host))
+            self.assertFalse(CircuitBreaker.allow(api_url.host))
+            CircuitBreaker.record_success(api_url.host)
+            self.assertEqual(CircuitState.CLOSED, CircuitBreaker.state(api_url.host))
+            self.assertEqual(url, CircuitBreaker.route(url))
+            CircuitBreaker.record_failure(url.host)
+            self.assertEqual(CircuitState.OPEN, CircuitBreaker.state(url.host))
+        spent = 0
+        while CircuitBreaker.try_spend_retry():
+            spent += 1
+        self.assertEqual(int(RETRY_BUDGET_INITIAL + 2 * RETRY_BUDGET_RATIO), spent)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_file_writer(self):
+        async def test_coro() -> None:
+            file_path = pathlib.Path(tempdir) / 'file.bin'
+            async with FileWriter(file_path, 'wb', expected_size=len(data), buffer_size=1000) as writer:
+                for i in range(0, len(data) // 2, 300):
+                    await writer.write(data[i:min(i + 300, len(data) // 2)])
+                    self.assertEqual(min(i + 300, len(data) // 2), writer.offset)
+            # preallocation must not change file size, resume relies on it
+            self.assertEqual(data[:len(data) // 2], file_path.read_bytes())
+            with self.assertRaises(ValueError):
+                async with FileWriter(file_path, 'ab', expected_size=len(data), buffer_size=1000) as writer:
+                    await writer.write(data[len(data) // 2:-100])
+                    raise ValueError
+            # resumed file hash includes data written before
+            async with FileWriter(file_path, 'ab', expected_size=len(data), sha256=True) as writer:
+                self.assertEqual(len(data) - 100, writer.offset)
+                await writer.write(data[-100:])
+            self.assertEqual(data, file_path.read_bytes())
+            self.assertEqual(hashlib.sha256(data).hexdigest(), writer.sha256)
+            # hash is not updated by shared I/O thread, other downloads' writes don't wait for it
+            hash_threads: list[str] = []
+            async with FileWriter(file_path, 'wb', buffer_size=1000, sha256=True) as writer:
+                file_hash = hashlib.sha256()
+                writer._hash = SimpleNamespace(hexdigest=file_hash.hexdigest,
+                                               update=lambda _: hash_threads.append(threading.current_thread().name) or file_hash.update(_))
+                for i in range(0, len(data), 300):
+                    await writer.write(data[i:i + 300])
+            self.assertEqual(hashlib.sha256(data).hexdigest(), writer.sha256)
+            self.assertTrue(hash_threads and not any(_.startswith('file_writer') for _ in hash_threads))
+            # file is closed if open fails halfway
+            for target in ('kemono_ripper.api.file_writer._preallocate', 'kemono_ripper.api.file_writer.FileWriter._hash_existing'):
+                writer = FileWriter(file_path, 'ab', expected_size=len(data) * 2, sha256=True)
+                with patch(target, side_effect=OSError), self.assertRaises(OSError):
+                    async with writer:
+                        pass
+                self.assertEqual(-1, writer._fd)
+            async with FileWriter(file_path, 'wb') as writer:
+                await writer.write(data[:10])
+            self.assertEqual(data[:10], file_path.read_bytes())
+            self.assertEqual('', writer.sha256)
+            digest = hashlib.sha256(data).hexdigest()
+            for url, url_sha256 in (
+                (f'https://n1.kemono.cr/data/{digest[:2]}/{digest[2:4]}/{digest}.png?f=a.png', digest),
+                (f'https://n1.kemono.cr/{digest[:2]}/{digest[2:4]}/{digest.upper()}.zip', digest),
+                (f'https://n1.kemono.cr/data/{digest[:2]}/{digest[2:4]}/{digest[:-1]}.png', ''),
+                ('https://mega.nz/file/abc', ''),
+            ):
+                self.assertEqual(url_sha256, PostLinkInfo('1', 'a.png', URL(url), file_path, DownloadStatus()).url_sha256)
+        data = bytes(range(256)) * 40
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            asyncio.run(test_coro())
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_content_store(self):
+        async def test_coro() -> None:
+            store = ContentStore(base_path / 'store')
+            src_path = base_path / '1' / 'a.png'
+            src_path.parent.mkdir()
+            src_path.write_bytes(data)
+            self.assertIsNone(store.find(digest, '.png'))
+            await store.add(src_path, digest, '.PNG')
+            stored_path = store.find(digest, '.png')
+            self.assertEqual(base_path / 'store' / digest[:2] / digest[2:4] / f'{digest}.png', stored_path)
+            self.assertTrue(stored_path.samefile(src_path))
+            # partial download is replaced
+            dest_path = base_path / '2' / 'b.png'
+            dest_path.parent.mkdir()
+            dest_path.write_bytes(data[:10])
+            await store.place(stored_path, dest_path)
+            self.assertTrue(dest_path.samefile(src_path))
+            with patch('os.link', side_effect=OSError):
+                self.assertFalse(link_file(stored_path, base_path / '3' / 'c.png'))
+            self.assertEqual(data, (base_path / '3' / 'c.png').read_bytes())
+            self.assertFalse((base_path / '3' / 'c.png').samefile(src_path))
+        data = bytes(range(256)) * 4
+        digest = hashlib.sha256(data).hexdigest()
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            base_path = pathlib.Path(tempdir)
+            asyncio.run(test_coro())
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_download_part_file(self):
+        async def handle_file(request: web.Request) -> web.StreamResponse:
+            requests.append(request.headers.get('Range', ''))
+            if server_down:
+                raise web.HTTPServiceUnavailable
+            return web.FileResponse(src_path)
+
+        async def test_coro() -> None:
+            nonlocal server_down
+            app = web.Application()
+            app.router.add_get(url_path, handle_file)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                options = KemonoOptions(base_path, 1, 1, APIAddress.__args__[0], 'patreon', ClientTimeout(total=10), True, '', [], [], (),
+                                        DownloadMode.FULL, None, Log)
+                async with Kemono(options) as kemono:
+                    plink = PostLinkInfo('1', 'a.bin', URL(f'http://127.0.0.1:{port:d}{url_path}'), base_path / 'a.bin', DownloadStatus())
+                    post = make_post_info('1', links_count=0)
+                    part_file = PartFile(plink.path)
+                    # interrupted download is resumed from where it stopped
+                    part_file.path.write_bytes(data[:1000])
+                    self.assertEqual(KemonoErrorCodes.ESUCCESS, await kemono.download_url(post, plink))
+                    self.assertEqual(['bytes=1000-'], requests)
+                    self.assertEqual(data, plink.path.read_bytes())
+                    self.assertEqual((len(data), digest), (plink.status.size, plink.status.sha256))
+                    self.assertFalse(part_file.path.exists() or part_file.sidecar_path.exists())
+                    # completed file is recognized without any request
+                    self.assertEqual(KemonoErrorCodes.EEXISTS, await kemono.download_url(post, plink))
+                    self.assertEqual(1, len(requests))
+                    # corrupted partial file is discarded and downloaded again
+                    plink.path.unlink()
+                    part_file.path.write_bytes(bytes(1000))
+                    with patch('kemono_ripper.api.api.CONNECT_RETRY_DELAY', (0.0, 0.0)):
+                        self.assertEqual(KemonoErrorCodes.ESUCCESS, await kemono.download_url(post, plink))
+                    self.assertEqual(['bytes=1000-', ''], requests[1:])
+                    self.assertEqual(data, plink.path.read_bytes())
+                    self.assertFalse(part_file.path.exists() or part_file.sidecar_path.exists())
+                    # complete but corrupted partial file is verified too
+                    plink.path.unlink()
+                    part_file.path.write_bytes(bytes(len(data)))
+                    with patch('kemono_ripper.api.api.CONNECT_RETRY_DELAY', (0.0, 0.0)):
+                        self.assertEqual(KemonoErrorCodes.ESUCCESS, await kemono.download_url(post, plink))
+                    self.assertEqual([f'bytes={len(data):d}-', ''], requests[3:])
+                    self.assertEqual(data, plink.path.read_bytes())
+                    # file changed on server
+                    plink.path.unlink()
+                    part_file.path.write_bytes(data[:1000])
+                    part_file.save(PartFileInfo(url=str(plink.url), size=len(data) * 2, etag='', ranges=[(0, 1000)]))
+                    with patch('kemono_ripper.api.api.CONNECT_RETRY_DELAY', (0.0, 0.0)):
+                        self.assertEqual(KemonoErrorCodes.ESUCCESS, await kemono.download_url(post, plink))
+                    self.assertEqual(['bytes=1000-', ''], requests[5:])
+                    self.assertEqual(data, plink.path.read_bytes())
+                    # invalid content is not the host's fault
+                    self.assertEqual(0.0, CircuitBreaker._circuit(plink.url.host).failure_rate())
+                    # existing file of unknown size is verified in place
+                    plink.status.size = 0
+                    self.assertEqual(KemonoErrorCodes.EEXISTS, await kemono.download_url(post, plink))
+                    self.assertEqual([f'bytes={len(data):d}-'], requests[7:])
+                    self.assertFalse(part_file.path.exists())
+                    # corrupted one is replaced once downloaded again, incomplete one is resumed
+                    for content, expected_requests in ((bytes(len(data)), [f'bytes={len(data):d}-', '']), (data[:1000], ['bytes=1000-'])):
+                        plink.status.size = 0
+                        plink.path.write_bytes(content)
+                        requests.clear()
+                        with patch('kemono_ripper.api.api.CONNECT_RETRY_DELAY', (0.0, 0.0)):
+                            self.assertEqual(KemonoErrorCodes.ESUCCESS, await kemono.download_url(post, plink))
+                        self.assertEqual(expected_requests, requests)
+                        self.assertEqual(data, plink.path.read_bytes())
+                        self.assertFalse(part_file.path.exists() or part_file.sidecar_path.exists())
+                    # existing file of unknown size stays in place if it can't be verified
+                    plink.status.size = 0
+                    server_down = True
+                    with patch('kemono_ripper.api.api.CONNECT_RETRY_DELAY', (0.0, 0.0)):
+                        self.assertEqual(KemonoErrorCodes.ECONNECT, await kemono.download_url(post, plink))
+                    self.assertEqual(data, plink.path.read_bytes())
+            finally:
+                await runner.cleanup()
+        data = bytes(range(256)) * 40
+        digest = hashlib.sha256(data).hexdigest()
+        url_path = f'/data/{digest[:2]}/{digest[2:4]}/{digest}.bin'
+        requests: list[str] = []
+        server_down = False
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            base_path = pathlib.Path(tempdir)
+            src_path = base_path / 'src.bin'
+            src_path.write_bytes(data)
+            at_startup(())
+            asyncio.run(test_coro())
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_download_probe(self):
+        async def handle_file(_request: web.Request) -> web.StreamResponse:
+            return web.FileResponse(src_path)
+
+        async def test_coro() -> None:
+            app = web.Application()
+            app.router.add_get(url_path, handle_file)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                options = KemonoOptions(base_path, 0, 4, APIAddress.__args__[0], 'patreon', ClientTimeout(total=10), False, '', [], [],
+                                        (FileSizeFilter(NumRange(1.0, 2.0)),), DownloadMode.FULL, None, Log)
+                async with Kemono(options) as kemono:
+                    post = make_post_info('1', links_count=0)
+                    plinks = [PostLinkInfo('1', f'{_:d}.bin', URL(f'http://127.0.0.1:{port:d}{url_path}'), base_path / f'{_:d}.bin',
+                                           DownloadStatus()) for _ in range(4)]
+                    with patch.object(RequestQueue, 'until_ready', wraps=RequestQueue.until_ready) as until_ready:
+                        # probes don't wait for request queue
+                        self.assertEqual([len(data)] * 4, await asyncio.gather(*(kemono.probe_url(post, _) for _ in plinks)))
+                        until_ready.assert_not_called()
+                        # size reported by server is filtered out, nothing is written
+                        self.assertEqual(KemonoErrorCodes.EFILTERED, await kemono.download_url(post, plinks[0]))
+                        until_ready.assert_called_once()
+                    self.assertFalse(plinks[0].path.exists() or PartFile(plinks[0].path).path.exists())
+            finally:
+                await runner.cleanup()
+        data = bytes(range(256)) * 40
+        url_path = '/data/00/00/src.bin'
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            base_path = pathlib.Path(tempdir)
+            src_path = base_path / 'src.bin'
+            src_path.write_bytes(data)
+            at_startup(())
+            asyncio.run(test_coro())
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_query_api_host_failures(self):
+        async def handle_creators(_request: web.Request) -> web.StreamResponse:
+            return web.Response(status=statuses.pop(0), body=b'<html>not json</html>')
+
+        async def test_coro() -> None:
+            app = web.Application()
+            app.router.add_get('/api/v1/creators', handle_creators)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                options = KemonoOptions(pathlib.Path(tempdir), 0, 1, APIAddress.__args__[0], 'patreon', ClientTimeout(total=10), True, '',
+                                        [], [], (), DownloadMode.FULL, None, Log)
+                async with Kemono(options) as kemono:
+                    with patch.object(GetCreatorsAction, 'get_url', return_value=URL(f'http://127.0.0.1:{port:d}/api/v1/creators')):
+                        # invalid content and client errors are not the host's fault, server errors are
+                        for failures in (0, 0, 1):
+                            with self.assertRaises(ConnectionError):
+                                await kemono.list_creators()
+                            self.assertEqual(failures, CircuitBreaker._circuit('127.0.0.1').results.count(False))
+                        self.assertEqual([True, False], list(CircuitBreaker._circuit('127.0.0.1').results))
+            finally:
+                await runner.cleanup()
+        statuses = [200, 400, 503]
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            at_startup(())
+            asyncio.run(test_coro())
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_adaptive_chunk_size(self):
+        class BufferedContent:
+            def __init__(self, data: bytes) -> None:
+                self.data = data
+                self.reads: list[int] = []
+
+            async def read(self, n: int) -> bytes:
+                self.reads.append(n)
+                chunk, self.data = self.data[:n], self.data[n:]
+                return chunk
+
+        async def test_coro() -> None:
+            content = BufferedContent(data)
+            self.assertEqual(data, b''.join([_ async for _ in AdaptiveChunkSize().iter_chunked(content)]))
+            # everything is available instantly, reads grow up to max
+            self.assertEqual(DOWNLOAD_CHUNK_SIZE_INIT, content.reads[0])
+            self.assertEqual(DOWNLOAD_CHUNK_SIZE_MAX, content.reads[-1])
+        chunk_size = AdaptiveChunkSize()
+        self.assertEqual(DOWNLOAD_CHUNK_SIZE_INIT, chunk_size.update(DOWNLOAD_CHUNK_SIZE_INIT // 2, 0.0))
+        self.assertEqual(DOWNLOAD_CHUNK_SIZE_INIT * 2, chunk_size.update(DOWNLOAD_CHUNK_SIZE_INIT, 0.0))
+        self.assertEqual(DOWNLOAD_CHUNK_SIZE_INIT, chunk_size.update(DOWNLOAD_CHUNK_SIZE_INIT * 2, DOWNLOAD_CHUNK_TIME_SLOW * 2))
+        self.assertEqual(DOWNLOAD_CHUNK_SIZE_INIT, chunk_size.update(DOWNLOAD_CHUNK_SIZE_INIT, DOWNLOAD_CHUNK_TIME_SLOW * 2))
+        data = bytes(range(256)) * (DOWNLOAD_CHUNK_SIZE_MAX * 4 // 256)
+        asyncio.run(test_coro())
+        print(f'{self._testMethodName} passed')
+
+
+class CacheTests(TestCase):
+    @test_prepare()
+    def test_cache_bulk_lookup(self):
+        async def test_coro() -> None:
+            post_ids = [f'{_:d}' for _ in range(10000, 11234)]
+            await Cache.store_post_info_cache([make_post_info(_) for _ in post_ids])
+            cached = await Cache.get_post_info_cache([*post_ids, *post_ids[:10], 'missing1', 'missing2'])
+            self.assertEqual(len(post_ids), len(cached))
+            self.assertEqual(set(post_ids), {_.post_id for _ in cached})
+            self.assertTrue(all(len(_.links) == 2 for _ in cached))
+            await Cache.clear_post_info_cache(post_ids[::2])
+            cached = await Cache.get_post_info_cache(post_ids)
+            self.assertEqual(set(post_ids[1::2]), {_.post_id for _ in cached})
+        run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cache_schema_migration(self):
+        def prepare_legacy_db(db_path: pathlib.Path) -> None:
+            db = sqlite3.connect(db_path.as_posix())
+            with db:
+                [db.execute(_) for _ in SCHEMA_MIGRATIONS[0].queries[:2]]
+                db.execute("INSERT INTO `cache_post` VALUES ('123','1000','fanbox','T',NULL,NULL,NULL,'','C','1000 - 123','32')")
+                db.execute("INSERT INTO `cache_post_link` VALUES ('123','a.png','https://n1.kemono.cr/data/a.png','1000 - 123/a.png','5','32')")
+            db.close()
+
+        async def test_coro() -> None:
+            self.assertEqual([(SCHEMA_VERSION,)], await Cache._query('PRAGMA user_version'))
+            self.assertEqual(0, len(await Cache.get_post_info_cache(('123',), 'patreon')))
+            cached = await Cache.get_post_info_cache(('123',), 'fanbox')
+            self.assertEqual(1, len(cached))
+            self.assertEqual('fanbox', cached[0].service)
+            self.assertEqual(1, len(cached[0].links))
+            self.assertEqual(5, cached[0].links[0].status.size)
+            await Cache.store_post_info_cache([make_post_info('123', service='patreon')])
+            self.assertEqual(2, len(await Cache.get_post_info_cache(('123',))))
+            await Cache.clear_post_info_cache(('123',), 'fanbox')
+            cached = await Cache.get_post_info_cache(('123',))
+            self.assertEqual(['patreon'], [_.service for _ in cached])
+            self.assertEqual(2, len(cached[0].links))
+        run_with_temp_cache(self._testMethodName, test_coro, prepare_legacy_db)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cache_scanned_post_rebuild(self):
+        scanned_post = {
+            'post': {
+                'id': '456', 'user': '1000', 'service': 'patreon', 'title': 'Title', 'content': '', 'embed': {}, 'shared_file': False,
+                'added': '2024-01-01T00:00:00', 'published': '2024-01-01T00:00:00', 'edited': None,
+                'file': {'name': 'a.png', 'path': '/2c/41/2c41ce3128d182916e2922ea2c96148ddf2e97d5.png'},
+                'attachments': [], 'poll': None, 'tags': ['tag1'],
+            },
+            'attachments': [], 'previews': [], 'videos': [], 'props': {'flagged': None, 'revisions': []},
+        }
+
+        async def test_coro() -> None:
+            Config.dest_base = pathlib.Path('base')
+            Config.path_format = '{creator_id} - {post_id}'
+            pinfos1 = await gather_post_info([scanned_post], APIAddress.__args__[0])
+            scanned_posts = await Cache.get_scanned_post_cache(('456',), 'patreon')
+            self.assertEqual([scanned_post], scanned_posts)
+            Config.path_format = '{post_id}'
+            pinfos2 = await gather_post_info(scanned_posts, APIAddress.__args__[0])
+            self.assertEqual(pathlib.Path('base/1000 - 456'), pinfos1[0].dest)
+            self.assertEqual(pathlib.Path('base/456'), pinfos2[0].dest)
+            self.assertEqual(pinfos1[0].links[0].url.path, pinfos2[0].links[0].url.path)
+            self.assertEqual(pathlib.Path('base/456'), (await Cache.get_post_info_cache(('456',), 'patreon'))[0].dest)
+            # rebuild keeps download state of links whose path didn't change, including verified hash
+            pinfos2[0].links[0].status.flags |= DownloadFlags.COMPLETED
+            pinfos2[0].links[0].status.sha256 = 'ab' * 32
+            await Cache.update_post_link_info_cache(pinfos2[0], pinfos2[0].links[0])
+            rebuilt, failed = await _rebuild_cached(LocalKemono(), await Cache.get_post_info_cache(('456',), 'patreon'))
+            self.assertEqual((1, 0), (len(rebuilt), len(failed)))
+            cached_link = (await Cache.get_post_info_cache(('456',), 'patreon'))[0].links[0]
+            self.assertEqual('ab' * 32, cached_link.status.sha256)
+            self.assertTrue(cached_link.status.flags & DownloadFlags.COMPLETED)
+            self.assertEqual(['ab' * 32], [_[0] for _ in await Cache._query('SELECT `sha256` FROM `cache_post_link`')])
+        run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cache_scanned_post_dedup(self):
+        file_path = '/2c/41/2c41ce3128d182916e2922ea2c96148ddf2e97d52c41ce3128d182916e2922ea.png'
+        scanned_post = {
+            'post': {
+                'id': '457', 'user': '1000', 'service': 'patreon', 'title': 'Title', 'embed': {}, 'shared_file': False,
+                'content': f'<p>Image: <img src="https://n3.kemono.cr/data{file_path}?f=image.png"></p>',
+                'added': '2024-01-01T00:00:00', 'published': '2024-01-01T00:00:00', 'edited': None,
+                'file': {'name': 'a.png', 'path': file_path},
+                'attachments': [{'name': 'a.png', 'path': file_path}, {'name': 'b.png', 'path': '/00/00/b.png'}], 'poll': None, 'tags': [],
+            },
+            'attachments': [], 'previews': [{'type': 'thumbnail', 'name': 'a.png', 'path': file_path, 'server': 'https://n1.kemono.cr'}],
+            'videos': [{'name': 'c.mp4', 'path': '/00/00/c.mp4'}], 'props': {'flagged': None, 'revisions': []},
+        }
+
+        async def test_coro() -> None:
+            Config.dest_base = pathlib.Path('base')
+            Config.path_format = '{post_id}'
+            pinfos = await gather_post_info([scanned_post], APIAddress.__args__[0])
+            self.assertEqual([f'/data{file_path}', '/data/00/00/b.png', '/data/00/00/c.mp4'], [_.url.path for _ in pinfos[0].links])
+            # skipped duplicate still takes its number, files already downloaded under old names keep them
+            self.assertEqual(['01_a.png', '02_b.png', '04_c.mp4'], [_.path.name for _ in pinfos[0].links])
+        run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cache_memory_tier(self):
+        async def test_coro() -> None:
+            post_infos = [make_post_info(f'{_:d}') for _ in range(30000, 30005)]
+            await Cache.store_post_info_cache(post_infos)
+            self.assertEqual([_.as_cache_key() for _ in post_infos[2:]], list(Cache._memory))
+            await Cache._execute_one(("UPDATE `cache_post` SET `title`='changed'", ()))
+            cached = await Cache.get_post_info_cache(('30004', '30000'), 'patreon')
+            self.assertIs(post_infos[4], cached[0])
+            self.assertEqual(['Post 30004', 'changed'], [_.title for _ in cached])
+            self.assertEqual(['30003', '30004', '30000'], [_.post_id for _ in Cache._memory.values()])
+            cached[0].status.flags |= DownloadFlags.COMPLETED
+            await Cache.update_post_info_cache(cached[0])
+            await Cache.clear_post_info_cache(('30003',))
+            self.assertEqual(['30000', '30004'], [_.post_id for _ in Cache._memory.values()])
+            Cache._memory.clear()
+            cached = await Cache.get_post_info_cache(('30004',), 'patreon')
+            self.assertIsNot(post_infos[4], cached[0])
+            self.assertTrue(bool(cached[0].status.flags & DownloadFlags.COMPLETED))
+            # memory tier hits count as access too, batched
+            await Cache._execute_one(('UPDATE `cache_post` SET `accessed`=0', ()))
+            self.assertIs(cached[0], (await Cache.get_post_info_cache(('30004',), 'patreon'))[0])
+            self.assertEqual(3, await Cache.prune_cache(86400, None))
+            self.assertEqual(['30004'], [_.post_id for _ in await Cache.get_post_info_cache(('30000', '30001', '30002', '30004'))])
+        Config.memory_cache = 3
+        run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cache_concurrent_access(self):
+        async def test_coro() -> None:
+            self.assertEqual([('wal',)], await Cache._query('PRAGMA journal_mode'))
+            other = sqlite3.connect(Cache._db_path().as_posix(), timeout=0, isolation_level=None)
+            other.execute('BEGIN IMMEDIATE')
+            other.execute("INSERT INTO `cache_meta` VALUES ('other','1')")
+            # WAL: reads are not blocked by another process writing
+            self.assertEqual(0, len(await Cache.get_post_info_cache(('40000',), 'patreon')))
+            asyncio.get_running_loop().call_later(1.0, other.commit)
+            await Cache.store_post_info_cache([make_post_info('40000')])
+            other.close()
+            self.assertEqual(1, len(await Cache.get_post_info_cache(('40000',), 'patreon')))
+            self.assertEqual([('1',)], await Cache._query("SELECT `value` FROM `cache_meta` WHERE `key`='other'"))
+        run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cache_export_import(self):
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            export_path = pathlib.Path(tempdir) / 'export.ndjson.gz'
+
+            async def test_coro_export() -> None:
+                post_infos = [make_post_info(f'{_:d}', creator_id=f'{1000 + _ % 2:d}') for _ in range(50000, 50010)]
+                post_infos.append(make_post_info('50010', service='fanbox'))
+                for _ in post_infos:
+                    _.status.flags = DownloadFlags.COMPLETED
+                    _.links[0].status.flags = DownloadFlags.COMPLETED | DownloadFlags.RETURNED_404
+                    _.links[0].status.sha256 = 'ab' * 32
+                await Cache.store_post_info_cache(post_infos)
+                await Cache._execute_one(('UPDATE `cache_post` SET `updated`=100', ()))
+                self.assertEqual(5, await Cache.export_cache(export_path, ('1000',), ('patreon',)))
+
+            async def test_coro_import() -> None:
+                local_old, local_new = make_post_info('50000', creator_id='1000'), make_post_info('50002', creator_id='1000')
+                local_old.links[1].status.flags = DownloadFlags.COMPLETED
+                local_new.links.clear()
+                await Cache.store_post_info_cache([local_old, local_new])
+                await Cache._execute_one(("UPDATE `cache_post` SET `updated`=CASE WHEN `post_id`='50000' THEN 50 ELSE 200 END", ()))
+                self.assertEqual((3, 1, 1), await Cache.import_cache(export_path))
+                cached = {_.post_id: _ for _ in await Cache.get_post_info_cache([f'{_:d}' for _ in range(50000, 50011)])}
+                self.assertEqual(['50000', '50002', '50004', '50006', '50008'], sorted(cached))
+                self.assertEqual(0, len(cached['50002'].links))
+                self.assertEqual(DownloadFlags.NONE, cached['50004'].status.flags)
+                self.assertEqual([DownloadFlags.RETURNED_404, DownloadFlags.NONE], [_.status.flags for _ in cached['50004'].links])
+                self.assertEqual([DownloadFlags.RETURNED_404, DownloadFlags.COMPLETED], [_.status.flags for _ in cached['50000'].links])
+                self.assertEqual(['ab' * 32, ''], [_.status.sha256 for _ in cached['50004'].links])
+                self.assertEqual([(100,)], await Cache._query("SELECT `updated` FROM `cache_post` WHERE `post_id`='50000'"))
+            run_with_temp_cache(f'{self._testMethodName}_1', test_coro_export)
+            run_with_temp_cache(f'{self._testMethodName}_2', test_coro_import)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cache_creators(self):
+        def make_creator(creator_id: str, name: str, service: APIService = 'patreon', updated=1) -> Creator:
+            return Creator(id=creator_id, name=name, service=service, indexed=1, updated=updated, favorited=0)
+
+        async def test_coro() -> None:
+            apiaddr = APIAddress.__args__[0]
+            self.assertTrue(await Cache.creators_outdated(apiaddr))
+            creators = [make_creator(f'{_:d}', f'Artist{_:d}') for _ in range(1000)]
+            creators.extend((make_creator('a1', 'Xavier Renegade'), make_creator('a2', 'Renegade Xavie', 'fanbox'),
+                             make_creator('a3', '100%_done')))
+            self.assertEqual((1003, 0, 0), await Cache.store_creators(apiaddr, creators))
+            self.assertFalse(await Cache.creators_outdated(apiaddr))
+            self.assertTrue(await Cache.creators_outdated(APIAddress.__args__[1]))
+            self.assertEqual((0, 1, 1), await Cache.store_creators(
+                apiaddr, [*creators[1:-3], make_creator('a1', 'Xavier Renegade', updated=2), *creators[-2:]]))
+            self.assertEqual(['Renegade Xavie', 'Xavier Renegade'], [_['name'] for _ in await Cache.find_creators(apiaddr, 'xavie')])
+            self.assertEqual(['Xavier Renegade'], [_['name'] for _ in await Cache.find_creators(apiaddr, 'xav', 'prefix')])
+            self.assertEqual(['100%_done'], [_['name'] for _ in await Cache.find_creators(apiaddr, '%_', 'substring')])
+            self.assertEqual([], [_['name'] for _ in await Cache.find_creators(apiaddr, 'Artist0', 'prefix')])
+            self.assertEqual(11, len(await Cache.find_creators(apiaddr, 'artist99')))
+            self.assertEqual(['Xavier Renegade', 'Renegade Xavie'], [_['name'] for _ in await Cache.find_creators(apiaddr, 'xaveir', 'fuzzy')])
+            self.assertEqual([], await Cache.find_creators(APIAddress.__args__[1], 'xavie'))
+            Cache._creators_fts = False
+            self.assertEqual(['Xavier Renegade'], [_['name'] for _ in await Cache.find_creators(apiaddr, 'xav', 'prefix')])
+            self.assertEqual(11, len(await Cache.find_creators(apiaddr, 'artist99')))
+            self.assertEqual(['Xavier Renegade', 'Renegade Xavie'], [_['name'] for _ in await Cache.find_creators(apiaddr, 'xaveir', 'fuzzy')])
+            Cache._creators_fts = True
+            # renamed and removed creators are reindexed in place
+            self.assertEqual((0, 1, 1), await Cache.store_creators(
+                apiaddr, [*creators[1:-3], make_creator('a1', 'Renamed Artist', updated=3), creators[-2]]))
+            self.assertEqual(['Renamed Artist'], [_['name'] for _ in await Cache.find_creators(apiaddr, 'renamed')])
+            self.assertEqual(['Renegade Xavie'], [_['name'] for _ in await Cache.find_creators(apiaddr, 'renegade')])
+            await Cache._execute_one(("INSERT INTO `cache_creator_fts` (`cache_creator_fts`,`rank`) VALUES ('integrity-check',1)", ()))
+        run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cache_post_search(self):
+        async def test_coro() -> None:
+            post_infos = [make_post_info(f'{_:d}') for _ in range(60000, 60005)]
+            post_infos[0] = post_infos[0]._replace(title='Summer Café sketches', tags=['sketch', 'wip'], published='2024-02-01T00:00:00')
+            post_infos[1] = post_infos[1]._replace(content='<p>finished sketchbook</p>', tags=['sketch'], published='2024-03-01T00:00:00')
+            post_infos[2] = post_infos[2]._replace(title='Winter', tags=['sketches'])
+            await Cache.store_post_info_cache(post_infos)
+            for fts in (True, False):
+                Cache._posts_fts = fts
+                self.assertEqual(['60000'], [_.post_id for _ in await Cache.search_post_info_cache('cafe' if fts else 'café')])
+                self.assertEqual(['60001', '60000', '60002'], [_.post_id for _ in await Cache.search_post_info_cache('sketch*')])
+                self.assertEqual(['60001', '60000'], [_.post_id for _ in await Cache.search_post_info_cache('', ['sketch'])])
+                self.assertEqual(['60000'], [_.post_id for _ in await Cache.search_post_info_cache('summer', ['sketch'])])
+                self.assertEqual(2, len((await Cache.search_post_info_cache('summer'))[0].links))
+            Cache._posts_fts = True
+            await Cache.store_post_info_cache([post_infos[0]._replace(title='Autumn')])
+            await Cache.clear_post_info_cache(('60001',))
+            self.assertEqual([], await Cache.search_post_info_cache('summer'))
+            self.assertEqual(['60000'], [_.post_id for _ in await Cache.search_post_info_cache('autumn')])
+            await Cache.compact_cache(True)
+            self.assertEqual(['60000'], [_.post_id for _ in await Cache.search_post_info_cache('autumn')])
+            self.assertEqual(['60002'], [_.post_id for _ in await Cache.search_post_info_cache('winter sketches')])
+        run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cache_prune_compact(self):
+        async def test_coro() -> None:
+            post_ids = [f'{_:d}' for _ in range(20000, 20400)]
+            await Cache.store_post_info_cache([make_post_info(_, links_count=5) for _ in post_ids])
+            await Cache._execute_one(('UPDATE `cache_post` SET `accessed`=`accessed`-864000 WHERE `post_id`<?', ('20100',)))
+            self.assertEqual(len(post_ids), len(await Cache.get_post_info_cache((*post_ids[200:], 'missing'))) + 200)
+            self.assertEqual(100, await Cache.prune_cache(86400 * 5, None))
+            self.assertEqual(300, (await Cache.get_cache_stats()).posts)
+            self.assertEqual(1500, (await Cache.get_cache_stats()).links)
+            max_size = (await Cache.get_cache_stats()).used_size // 2
+            self.assertLess(0, await Cache.prune_cache(None, max_size))
+            stats = await Cache.get_cache_stats()
+            self.assertGreaterEqual(max_size, stats.used_size)
+            self.assertEqual(stats.posts * 5, stats.links)
+            self.assertEqual(stats.posts, len(await Cache.get_post_info_cache(post_ids[200:])))
+            await Cache.compact_cache(False)
+            stats = await Cache.get_cache_stats()
+            self.assertEqual((2, 0), (stats.auto_vacuum, stats.free_pages))
+            self.assertEqual(stats.file_size, stats.page_count * stats.page_size)
+        run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+
+class DownloaderTests(TestCase):
+    @test_prepare()
+    def test_downloader_queue(self):
+        async def test_coro() -> None:
+            post_infos = [make_post_info(f'{_:d}', links_count=_ % 4, root=pathlib.Path(tempdir)) for _ in range(70000, 70050)]
+            await Cache.store_post_info_cache(post_infos)
+            kemono = LocalKemono()
+            async with KemonoDownloader(kemono, post_infos) as downloader:
+                self.assertEqual(len(post_infos), downloader.get_workload_size())
+                await downloader.run()
+                self.assertFalse(downloader.can_fetch_next())
+                self.assertEqual(0, downloader.get_workload_size())
+            self.assertEqual(sum(len(_.links) for _ in post_infos), len(kemono.downloaded))
+            self.assertTrue(all(_.status.state == State.DONE and _.status.flags & DownloadFlags.COMPLETED for _ in post_infos))
+            self.assertTrue(all(pl.status.result == DownloadResult.SUCCESS for _ in post_infos for pl in _.links))
+            # slow link only holds its own slot, everything else flows through the other one
+            for post_info in post_infos:
+                for plink in post_info.links:
+                    plink.path.unlink()
+                    plink.status.state = State.NEW
+            slow_key = f'{post_infos[1].post_id}/{post_infos[1].links[0].name}'
+            kemono = LocalKemono({slow_key: 0.3})
+            Config.max_jobs = 2
+            async with KemonoDownloader(kemono, post_infos) as downloader:
+                await downloader.run()
+            self.assertEqual(slow_key, kemono.downloaded[-1])
+            self.assertEqual(sum(len(_.links) for _ in post_infos), len(kemono.downloaded))
+        Config.max_jobs = 4
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_downloader_local_similar(self):
+        async def test_coro() -> None:
+            digest = hashlib.sha256(b'').hexdigest()
+            post_infos = [make_post_info(f'{_:d}', links_count=1, root=pathlib.Path(tempdir)) for _ in range(72000, 72002)]
+            post_infos = [_._replace(links=[pl._replace(url=URL(f'https://n{i + 1:d}.kemono.cr/data/{digest[:2]}/{digest[2:4]}/{digest}.png'))
+                                            for pl in _.links]) for i, _ in enumerate(post_infos)]
+            await Cache.store_post_info_cache(post_infos)
+            kemono = LocalKemono()
+            async with KemonoDownloader(kemono, post_infos[:1]) as downloader:
+                await downloader.run()
+            # same content under another post is reused without downloading it again
+            async with KemonoDownloader(kemono, post_infos[1:]) as downloader:
+                await downloader.run()
+            self.assertEqual([f'{post_infos[0].post_id}/{post_infos[0].links[0].name}'], kemono.downloaded)
+            plink1, plink2 = post_infos[0].links[0], post_infos[1].links[0]
+            self.assertEqual(DownloadResult.SUCCESS, plink2.status.result)
+            self.assertTrue(plink2.status.flags & DownloadFlags.ALREADY_EXISTED_SIMILAR)
+            self.assertTrue(plink2.path.samefile(plink1.path))
+            self.assertEqual([(plink1.path, plink1.status.size), (plink2.path, plink1.status.size)],
+                             sorted(await Cache.get_local_files(digest)))
+            plink2.status.state = State.NEW
+            async with KemonoDownloader(kemono, post_infos[1:]) as downloader:
+                await downloader.run()
+            self.assertEqual(DownloadResult.FAIL_ALREADY_EXISTS, plink2.status.result)
+            self.assertEqual(1, len(kemono.downloaded))
+        Config.download_mode = DownloadMode.FULL.value
+        Config.max_jobs = 4
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_downloader_same_content(self):
+        async def test_coro() -> None:
+            digest = hashlib.sha256(b'').hexdigest()
+            urls = (
+                f'https://n1.kemono.cr/data/{digest[:2]}/{digest[2:4]}/{digest}.png',
+                f'https://n3.kemono.cr/data/{digest[:2]}/{digest[2:4]}/{digest}.png?f=a.png',
+                f'https://n2.kemono.cr/{digest[:2]}/{digest[2:4]}/{digest}.png',
+                'https://n1.kemono.cr/data/00/00/unhashed.png',
+                'https://n4.kemono.cr/data/00/00/unhashed.png?f=b.png',
+            )
+            post_infos = [make_post_info(f'{_:d}', links_count=1, root=pathlib.Path(tempdir)) for _ in range(73000, 73000 + len(urls))]
+            post_infos = [_._replace(links=[pl._replace(url=URL(url)) for pl in _.links]) for url, _ in zip(urls, post_infos, strict=True)]
+            await Cache.store_post_info_cache(post_infos)
+            # first link of each file is slow so the rest of them is picked while it's still downloading
+            kemono = LocalKemono({f'{post_infos[0].post_id}/{post_infos[0].links[0].name}': 0.2,
+                                  f'{post_infos[3].post_id}/{post_infos[3].links[0].name}': 0.2})
+            async with KemonoDownloader(kemono, post_infos) as downloader:
+                await downloader.run()
+            self.assertEqual([f'{post_infos[_].post_id}/{post_infos[_].links[0].name}' for _ in (0, 3)], sorted(kemono.downloaded))
+            self.assertTrue(all(_.status.state == State.DONE and _.status.flags & DownloadFlags.COMPLETED for _ in post_infos))
+            for owner_idx, follower_idx in ((0, 1), (0, 2), (3, 4)):
+                plink1, plink2 = post_infos[owner_idx].links[0], post_infos[follower_idx].links[0]
+                self.assertEqual(DownloadResult.SUCCESS, plink2.status.result)
+                self.assertTrue(plink2.status.flags & DownloadFlags.ALREADY_EXISTED_SIMILAR)
+                self.assertTrue(plink2.path.samefile(plink1.path))
+        Config.download_mode = DownloadMode.FULL.value
+        Config.max_jobs = 4
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_downloader_retry_later(self):
+        async def test_coro() -> None:
+            post_infos = [make_post_info(f'{_:d}', links_count=1, root=pathlib.Path(tempdir)) for _ in range(72000, 72020)]
+            flaky_key = f'{post_infos[0].post_id}/{post_infos[0].links[0].name}'
+            kemono = LocalKemono(failures={flaky_key: 2})
+            async with KemonoDownloader(kemono, post_infos) as downloader:
+                await downloader.run()
+            # failed link waits for retry without holding the only slot, the rest goes through in the meantime
+            self.assertEqual(3, kemono.attempts.count(flaky_key))
+            self.assertEqual(flaky_key, kemono.attempts[0])
+            self.assertEqual(flaky_key, kemono.downloaded[-1])
+            self.assertEqual(len(post_infos), len(kemono.downloaded))
+            self.assertTrue(all(_.status.state == State.DONE and _.status.flags & DownloadFlags.COMPLETED for _ in post_infos))
+        Config.max_jobs = 1
+        with (TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir,
+              patch('kemono_ripper.downloader.CONNECT_RETRY_DELAY', (0.2, 0.2))):
+            run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_downloader_order(self):
+        async def test_coro() -> None:
+            for order, expected in orders.items():
+                post_infos = [make_post_info(f'{_:d}', links_count=2, root=pathlib.Path(tempdir) / order) for _ in range(71000, 71003)]
+                for i, (post_info, sizes) in enumerate(zip(post_infos, ((30, 0), (10, 50), (20, 40)), strict=True)):
+                    for j, (plink, size) in enumerate(zip(post_info.links, sizes, strict=True)):
+                        plink.status.size = size
+                        post_info.links[j] = plink._replace(url=plink.url.with_host(f'n{i % 2 + 1:d}.kemono.cr'))
+                kemono = LocalKemono()
+                Config.download_order = order
+                async with KemonoDownloader(kemono, post_infos) as downloader:
+                    await downloader.run()
+                self.assertEqual(expected, [(int(_[4]) + 1) * 100 + int(_[7]) for _ in kemono.downloaded], order)
+        orders = {
+            'input': [100, 101, 200, 201, 300, 301],
+            'shortest': [200, 300, 100, 301, 201, 101],
+            'largest': [201, 301, 100, 300, 200, 101],
+            'host': [100, 200, 101, 201, 300, 301],
+        }
+        Config.max_jobs = 1
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_downloader_local_complete(self):
+        async def test_coro() -> None:
+            post_infos = [make_post_info(f'{_:d}', links_count=_ % 3, root=pathlib.Path(tempdir)) for _ in range(76000, 76006)]
+            await Cache.store_post_info_cache(post_infos)
+            async with KemonoDownloader(LocalKemono(), post_infos) as downloader:
+                await downloader.run()
+            # re-run of completed posts makes no download attempts
+            post_infos = await Cache.get_post_info_cache(_.post_id for _ in post_infos)
+            kemono = LocalKemono()
+            async with KemonoDownloader(kemono, post_infos) as downloader:
+                self.assertEqual(0, downloader.get_workload_size())
+                await downloader.run()
+            self.assertEqual([], kemono.attempts)
+            self.assertTrue(all(pl.status.result == DownloadResult.FAIL_ALREADY_EXISTS for _ in post_infos for pl in _.links))
+            # changed file or missing 'done' marker, post has to be processed again
+            post_infos = sorted(await Cache.get_post_info_cache(_.post_id for _ in post_infos), key=lambda pi: pi.post_id)
+            post_infos[1].links[0].path.write_bytes(b'changed')
+            post_infos[2].dest.joinpath(POST_DONE_FILE_NAME_DEFAULT).unlink()
+            async with KemonoDownloader(LocalKemono(), post_infos) as downloader:
+                self.assertEqual(2, downloader.get_workload_size())
+        Config.download_mode = DownloadMode.FULL.value
+        Config.max_jobs = 4
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_downloader_run_journal(self):
+        async def test_coro() -> None:
+            post_infos = [make_post_info(f'{_:d}', links_count=2, root=pathlib.Path(tempdir)) for _ in range(75000, 75004)]
+            await Cache.store_post_info_cache(post_infos)
+            links = [PostPageScanResult(_.post_id, _.creator_id, 'patreon', 'kemono.cr') for _ in reversed(post_infos)]
+            run_id = await Cache.create_run_journal('post rip id', '75003 75002 75001 75000', 'kemono.cr', links)
+            await Cache.journal_posts_scanned(run_id, post_infos[:3])
+            run = await Cache.get_run_journal()
+            self.assertEqual(run_id, run.run_id)
+            self.assertEqual(links, run.links)
+            self.assertEqual({_.as_cache_key() for _ in post_infos[:3]}, run.scanned)
+            # interrupted run: first post is done, first link of the second one is downloaded
+            kemono = LocalKemono()
+            async with KemonoDownloader(kemono, post_infos[:1], run_id) as downloader:
+                await downloader.run()
+            post_infos[1].links[0].status.result = DownloadResult.SUCCESS
+            await Cache.journal_link_results(run_id, post_infos[1], post_infos[1].links[:1])
+            kemono = LocalKemono()
+            async with KemonoDownloader(kemono, post_infos, run_id) as downloader:
+                await downloader.run()
+            self.assertEqual(['75001/01_file.png', '75002/00_file.png', '75002/01_file.png', '75003/00_file.png', '75003/01_file.png'],
+                             sorted(kemono.attempts))
+            self.assertTrue(all(pl.status.result == DownloadResult.SUCCESS for _ in post_infos for pl in _.links))
+            await Cache.finish_run_journal(run_id)
+            self.assertIsNone(await Cache.get_run_journal())
+            run = await Cache.get_run_journal(run_id)
+            self.assertTrue(run.finished)
+            self.assertEqual([], run.links)
+            # abandoned and finished runs are dropped by age based prune
+            await Cache.create_run_journal('post rip id', '75000', 'kemono.cr', links[:1])
+            await Cache._execute_one(('UPDATE `run_journal` SET `created`=`created`-864000', ()))
+            await Cache.prune_cache(86400 * 5, None)
+            self.assertIsNone(await Cache.get_run_journal())
+            self.assertEqual([0, 0], [(await Cache._query(f'SELECT COUNT(*) FROM `{_}`'))[0][0] for _ in ('run_journal', 'run_journal_post')])
+        Config.max_jobs = 4
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_downloader_failed_links(self):
+        async def test_coro() -> None:
+            def make_post_infos() -> list[PostInfo]:
+                return [make_post_info(f'{_:d}', links_count=2, root=pathlib.Path(tempdir)) for _ in range(76000, 76002)]
+            broken = {'76000/01_file.png', '76001/00_file.png'}
+            for _ in range(2):
+                post_infos = make_post_infos()
+                async with KemonoDownloader(LocalKemono(broken=broken), post_infos) as downloader:
+                    await downloader.run()
+            failed_links = await Cache.get_failed_links()
+            self.assertEqual(sorted(broken), sorted(f'{_.post_id}/{_.name}' for _ in failed_links))
+            self.assertTrue(all(_.error == KemonoErrorCodes.ECONNECT.name and _.attempts == 2 for _ in failed_links))
+            # retried link completes and is no longer considered failed, stale one is dropped explicitly
+            async with KemonoDownloader(LocalKemono(), make_post_infos()[:1]) as downloader:
+                await downloader.run()
+            self.assertEqual(['76001/00_file.png'], [f'{_.post_id}/{_.name}' for _ in await Cache.get_failed_links()])
+            await Cache.clear_failed_links(await Cache.get_failed_links())
+            self.assertEqual([], await Cache.get_failed_links())
+            # retry goes through another data server
+            url = post_infos[0].links[0].url
+            self.assertEqual({f'n{_:d}.kemono.cr' for _ in (2, 3, 4)}, {with_random_data_server(url).host for _ in range(100)})
+            self.assertEqual(URL('https://mega.nz/file/abc'), with_random_data_server(URL('https://mega.nz/file/abc')))
+        Config.download_mode = DownloadMode.FULL.value
+        Config.max_jobs = 2
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_downloader_rip_failed(self):
+        async def test_coro() -> None:
+            post_infos = [make_post_info(f'{_:d}', links_count=2, root=pathlib.Path(tempdir)) for _ in range(77000, 77002)]
+            await Cache.store_post_info_cache(post_infos)
+            broken = {'77000/01_file.png', '77001/00_file.png'}
+            async with KemonoDownloader(LocalKemono(broken=broken), post_infos) as downloader:
+                await downloader.run()
+            kemono = LocalKemono()
+            await post_rip_failed(kemono)
+            # only failed links are retried, each one is downloaded from another data server
+            self.assertEqual(sorted(broken), sorted(kemono.downloaded))
+            self.assertTrue(all(kemono.hosts[_] in {f'n{i:d}.kemono.cr' for i in (2, 3, 4)} for _ in broken))
+            self.assertEqual([], await Cache.get_failed_links())
+            self.assertIsNone(await Cache.get_run_journal(0))
+        Config.download_mode = DownloadMode.FULL.value
+        Config.max_jobs = 2
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_downloader_probe_sizes(self):
+        async def test_coro() -> None:
+            post_infos = [make_post_info(f'{_:d}', links_count=2, root=pathlib.Path(tempdir)) for _ in range(74000, 74002)]
+            post_infos[1].links[1].status.size = 5
+            await Cache.store_post_info_cache(post_infos)
+            sizes = {'74000/00_file.png': 30, '74000/01_file.png': 10, '74001/00_file.png': 20}
+            kemono = LocalKemono(sizes=sizes)
+            async with KemonoDownloader(kemono, post_infos) as downloader:
+                await downloader._probe_sizes()
+                cached = {_.post_id: _ for _ in await Cache.get_post_info_cache(('74000', '74001'))}
+                self.assertEqual([30, 10, 20, 5], [_.status.size for pid in ('74000', '74001') for _ in cached[pid].links])
+                await downloader.run()
+            # known size is not probed again, probed sizes define order
+            self.assertEqual(sorted(sizes), sorted(kemono.probed))
+            self.assertEqual(['74001/01_file.png', '74000/01_file.png', '74001/00_file.png', '74000/00_file.png'], kemono.attempts)
+            size_filter = FileSizeFilter(NumRange(1.0, 2.0))
+            plink = post_infos[0].links[0]
+            for size, filtered in ((0, False), (Mem.MB // 2, True), (Mem.MB * 3 // 2, False), (Mem.MB * 3, True)):
+                plink.status.size = size
+                self.assertEqual(filtered, size_filter.filters_out(post_infos[0], plink))
+            # link filtered out once its size is known is skipped, not completed
+            post_info = make_post_info('74002', links_count=1, root=pathlib.Path(tempdir))
+            async with KemonoDownloader(LocalKemono(filtered={'74002/00_file.png'}), [post_info]) as downloader:
+                await downloader.run()
+            self.assertEqual(DownloadResult.FAIL_SKIPPED, post_info.links[0].status.result)
+            self.assertFalse(post_info.links[0].status.flags & DownloadFlags.COMPLETED)
+            self.assertEqual([], await Cache.get_failed_links())
+        Config.download_mode = DownloadMode.FULL.value
+        Config.download_order = 'shortest'
+        Config.max_jobs = 1
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            run_with_temp_cache(self._testMethodName, test_coro)
+        print(f'{self._testMethodName} passed')
+
+
 class CmdTests(TestCase):
+    def setUp(self) -> None:
+        # config file (and cache DB next to it) goes into temp dir so command tests never write into working tree
+        tempdir = TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_')
+        self.addCleanup(tempdir.cleanup)
+        config_path_patch = patch.object(Config, 'default_config_path', return_value=pathlib.Path(tempdir.name) / CONFIG_NAME_DEFAULT)
+        config_path_patch.start()
+        self.addCleanup(config_path_patch.stop)
 
     @test_prepare()
     def test_output_version(self):
@@ -76,6 +1084,56 @@ class CmdTests(TestCase):
         self.assertEqual('{creator_id} - {post_id} - {post_title}', Config.path_format)
         print(f'{self._testMethodName} passed')
 
+    @test_prepare()
+    def test_cmd_cache(self):
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            db_path = pathlib.Path(tempdir) / f'{self._testMethodName}.db'
+            with patch.object(Cache, '_db_path', return_value=db_path):
+                self.assertEqual(0, main_sync(['cache', 'stats']))
+                self.assertEqual(0, main_sync(['cache', 'prune', '--max-age', '30', '--max-size', '100']))
+                self.assertEqual((30, 100), (Config.cache_max_age, Config.cache_max_size))
+                self.assertEqual(0, main_sync(['cache', 'compact', '--full-vacuum']))
+                self.assertTrue(Config.cache_full_vacuum)
+                export_path = pathlib.Path(tempdir) / 'export.ndjson.gz'
+                self.assertEqual(0, main_sync(['cache', 'export', export_path.as_posix(), '--creator', '1000', '--services', 'fanbox']))
+                self.assertEqual((['1000'], ['fanbox']), (Config.cache_creator_ids, Config.cache_services))
+                self.assertEqual(0, main_sync(['cache', 'import', export_path.as_posix()]))
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cmd_command_pse_offline(self):
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            db_path = pathlib.Path(tempdir) / f'{self._testMethodName}.db'
+            with patch.object(Cache, '_db_path', return_value=db_path):
+                self.assertEqual(0, main_sync(['cache', 'stats']))
+                arglist1 = ['post', 'search', '--offline', 'content', 'tag1', '--published', '2023-01-01..']
+                arglist1.extend(('--path', tempdir, *COMMON_ARGS))
+                self.assertEqual(0, main_sync(arglist1))
+                self.assertTrue(Config.search_offline)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cmd_command_prr_offline(self):
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            db_path = pathlib.Path(tempdir) / f'{self._testMethodName}.db'
+            with patch.object(Cache, '_db_path', return_value=db_path):
+                arglist1 = ['post', 'rip', 'resume', '5']
+                arglist1.extend(('--path', tempdir, *COMMON_ARGS))
+                self.assertEqual(0, main_sync(arglist1))
+                self.assertEqual(5, Config.resume_run_id)
+                self.assertEqual(arglist1, Config.arglist)
+        print(f'{self._testMethodName} passed')
+
+    @test_prepare()
+    def test_cmd_command_prf_offline(self):
+        with TemporaryDirectory(prefix=f'{APP_NAME}_{self._testMethodName}_') as tempdir:
+            db_path = pathlib.Path(tempdir) / f'{self._testMethodName}.db'
+            with patch.object(Cache, '_db_path', return_value=db_path):
+                arglist1 = ['post', 'rip', 'failed']
+                arglist1.extend(('--path', tempdir, *COMMON_ARGS))
+                self.assertEqual(0, main_sync(arglist1))
+        print(f'{self._testMethodName} passed')
+
     @test_prepare()
     def test_cmd_command_cl(self):
         if not RUN_CONN_TESTS: